@@ -1,7 +1,7 @@
 from openai import OpenAI, AsyncOpenAI
 from agents import OpenAIChatCompletionsModel, Agent, Runner, set_default_openai_client, function_tool
 from agents.model_settings import ModelSettings
-from agents.mcp import MCPServer, MCPServerStdio
+from agents.mcp import MCPServer
 import os
 from dotenv import load_dotenv
 from IPython.display import display, Code, Markdown, Image
@@ -10,11 +10,15 @@ import os.path
 from typing import Dict, Any, List, Optional
 import asyncio
 
+from mcp_launcher import create_mcp_servers, start_mcp_servers, stop_mcp_servers
+
 load_dotenv(override=True)
 os.environ["OPENAI_AGENTS_DISABLE_TRACING"] = "1"
 API_KEY = os.getenv("API_KEY")
 BASE_URL = os.getenv("BASE_URL")
 MODEL = os.getenv("MODEL")
+# 运行ID：设置后所有工具调用都使用该运行独立的工作目录，多个工作流可以在同一台机器上并发执行
+RUN_ID = os.getenv("MOL_RUN_ID")
 
 external_client = AsyncOpenAI(
     base_url=BASE_URL,
@@ -28,6 +32,195 @@ deepseek_model = OpenAIChatCompletionsModel(
     openai_client=external_client
 )
 
+class RuleBasedPlanner:
+    """基于正则规则的快速任务规划器，覆盖常见的工作流指令，无需调用LLM
+
+    parse()返回(任务列表, 置信度)。置信度低于阈值时，应交给LLM规划器处理。
+    """
+
+    # 按执行顺序排列的操作及其触发模式（"生成的分子"、"对接结果"指已有结果，不算生成/对接操作）
+    OPERATION_PATTERNS = [
+        ("molecule_generation", re.compile(r"生成(?!的)")),
+        ("molecular_docking", re.compile(r"对接(?!的?结果)")),
+        ("conformation_evaluation", re.compile(r"评估")),
+        ("download_all_outputs", re.compile(r"下载")),
+    ]
+
+    # 每个操作可以接受的文件参数：扩展名 -> 参数名
+    FILE_SLOTS = {
+        "molecule_generation": {".pdb": "pdb_file", ".sdf": "ref_ligand"},
+        "molecular_docking": {".sdf": "ligand_sdf", ".pdb": "protein_pdb"},
+        "conformation_evaluation": {".pdbqt": "pred_file", ".pdb": "cond_file"},
+    }
+
+    # "X作为..."中的显式角色 -> (操作, 参数名)，"受体"在生成和对接中含义不同，按默认规则分配
+    ROLE_KEYWORDS = [
+        ("参考配体", ("molecule_generation", "ref_ligand")),
+        ("ref_ligand", ("molecule_generation", "ref_ligand")),
+        ("pdb_file", ("molecule_generation", "pdb_file")),
+        ("配体", ("molecular_docking", "ligand_sdf")),
+        ("ligand_sdf", ("molecular_docking", "ligand_sdf")),
+        ("受体", (None, None)),
+        ("protein_pdb", ("molecular_docking", "protein_pdb")),
+        ("pred_file", ("conformation_evaluation", "pred_file")),
+        ("cond_file", ("conformation_evaluation", "cond_file")),
+    ]
+
+    DESCRIPTIONS = {
+        "molecule_generation": "执行分子生成",
+        "molecular_docking": "执行分子对接",
+        "conformation_evaluation": "进行构象评估",
+        "download_all_outputs": "下载结果文件",
+    }
+
+    # 出现这些词时说明指令带有条件、否定等复杂语义，规则无法可靠处理
+    AMBIGUOUS_WORDS = ("如果", "否则", "不要", "不用", "除了", "是否", "直到", "每个", "分别", "?", "？")
+    # 规则不解析的工具参数，出现时交给LLM
+    UNSUPPORTED_WORDS = ("漏斗", "聚类", "口袋", "去重", "阈值", "分片", "分块", "预检", "精细", "排名")
+
+    PATH_RE = re.compile(r"/[A-Za-z0-9_.\-/]+?(\.pdbqt|\.pdb|\.sdf)(?![A-Za-z0-9_])")
+    FIELD_RE = re.compile(r"uploaded_pdb|best_ref_ligand_sdf")
+    ROLE_RE = re.compile(r"^\s*(?:作为|为|当作)\s*([A-Za-z_]+|[一-鿿]+)")
+    N_SAMPLES_RE = re.compile(r"(\d+|[零一二两三四五六七八九十百千]+)\s*个(?:分子|样本)")
+    DOCK_MODE_RE = re.compile(r"adgpu|vina", re.IGNORECASE)
+    OUTPUT_DIR_RE = re.compile(r"(?:下载|保存|输出)[^/，,。；;]{0,10}?(?:到|至)\s*(/[A-Za-z0-9_.\-/]*)")
+    # 规则解析后仍未被使用的路径、英文参数名、数字和带量词的中文数字，出现时说明指令中有规则没有理解的内容
+    LEFTOVER_RE = re.compile(r"/[A-Za-z0-9_.\-/]+|[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?|[零一二两三四五六七八九十百千]+\s*(?:个|次|轮|组|条|种)")
+    CHINESE_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+    CHINESE_UNITS = {"十": 10, "百": 100, "千": 1000}
+
+    def __init__(self, min_confidence: float = 0.8):
+        self.min_confidence = min_confidence
+
+    def _match_role(self, text_after: str):
+        match = self.ROLE_RE.match(text_after)
+        if not match:
+            return None
+        role = match.group(1)
+        for keyword, slot in self.ROLE_KEYWORDS:
+            if role.startswith(keyword):
+                return slot
+        return None
+
+    @classmethod
+    def _parse_number(cls, text: str) -> int:
+        """解析阿拉伯数字或中文数字（如"两"、"二十"、"一百零五"）"""
+        if text.isdigit():
+            return int(text)
+        total, digit = 0, 0
+        for char in text:
+            if char in cls.CHINESE_DIGITS:
+                digit = cls.CHINESE_DIGITS[char]
+            else:
+                total += (digit or 1) * cls.CHINESE_UNITS[char]
+                digit = 0
+        return total + digit
+
+    def parse(self, user_query: str):
+        """解析用户指令
+
+        Returns:
+            (tasks, confidence): tasks格式与TaskPlanner.create_plan一致，confidence取值0~1
+        """
+        query = user_query.strip()
+        confidence = 1.0
+
+        operations = [op for op, pattern in self.OPERATION_PATTERNS if pattern.search(query)]
+        if not operations:
+            return [], 0.0
+        if any(word in query for word in self.AMBIGUOUS_WORDS):
+            confidence -= 0.5
+
+        parameters = {op: {} for op in operations}
+
+        # 已被规则使用的文本区间，最后检查区间外是否还有路径、参数名或数字
+        consumed = []
+
+        # 下载目录
+        output_dirs = []
+        for match in self.OUTPUT_DIR_RE.finditer(query):
+            output_dirs.append(match.group(1))
+            consumed.append(match.span(1))
+        if "download_all_outputs" in parameters and output_dirs:
+            parameters["download_all_outputs"]["output_path"] = output_dirs[-1]
+            if len(set(output_dirs)) > 1:
+                confidence -= 0.3
+        elif output_dirs:
+            # 提到了输出目录却没有下载操作
+            confidence -= 0.3
+
+        # 文件路径与特殊字段，按出现顺序分配给各操作
+        matches = [(m.start(), m.end(), m.group(0), m.group(1)) for m in self.PATH_RE.finditer(query)]
+        matches += [(m.start(), m.end(), m.group(0), ".sdf" if m.group(0) == "best_ref_ligand_sdf" else ".pdb")
+                    for m in self.FIELD_RE.finditer(query)]
+        for start, end, value, ext in sorted(matches):
+            if value in output_dirs:
+                continue
+            op, slot = None, None
+            role = self._match_role(query[end:end + 20])
+            if role and role[0] in parameters:
+                op, slot = role
+            elif value == "best_ref_ligand_sdf" and "molecule_generation" in parameters:
+                op, slot = "molecule_generation", "ref_ligand"
+            else:
+                for candidate in operations:
+                    candidate_slot = self.FILE_SLOTS.get(candidate, {}).get(ext)
+                    if candidate_slot and candidate_slot not in parameters[candidate]:
+                        op, slot = candidate, candidate_slot
+                        break
+            if op is None or slot in parameters[op]:
+                # 路径无法明确归属到某个参数
+                confidence -= 0.4
+                continue
+            parameters[op][slot] = value
+            role_match = self.ROLE_RE.match(query[end:end + 20])
+            consumed.append((start, end + role_match.end() if role_match else end))
+
+        # 生成数量
+        n_samples = []
+        for match in self.N_SAMPLES_RE.finditer(query):
+            n_samples.append(self._parse_number(match.group(1)))
+            consumed.append(match.span())
+        if "molecule_generation" in parameters and n_samples:
+            if len(set(n_samples)) > 1:
+                confidence -= 0.5
+            parameters["molecule_generation"]["n_samples"] = n_samples[0]
+
+        # 对接模式同时作用于对接和构象评估
+        dock_modes = set()
+        for match in self.DOCK_MODE_RE.finditer(query):
+            dock_modes.add(match.group(0).lower())
+            role_match = self.ROLE_RE.match(query[match.end():match.end() + 20])
+            consumed.append((match.start(), match.end() + role_match.end() if role_match else match.end()))
+        if len(dock_modes) > 1:
+            confidence -= 0.5
+        elif dock_modes:
+            dock_mode = dock_modes.pop()
+            for op in ("molecular_docking", "conformation_evaluation"):
+                if op in parameters:
+                    parameters[op]["dock_mode"] = dock_mode
+            if not {"molecular_docking", "conformation_evaluation"} & set(parameters):
+                confidence -= 0.3
+
+        # 规则没有使用的路径、参数名、数字或不支持的参数：生成的计划可能遗漏了用户的要求
+        leftovers = [match.group(0) for match in self.LEFTOVER_RE.finditer(query)
+                     if not any(start <= match.start() and match.end() <= end for start, end in consumed)]
+        if leftovers or any(word in query for word in self.UNSUPPORTED_WORDS):
+            confidence -= 0.5
+
+        tasks = []
+        for op in operations:
+            description = self.DESCRIPTIONS[op]
+            if op == "molecular_docking" and "dock_mode" in parameters[op]:
+                description = f"执行{parameters[op]['dock_mode']}模式的分子对接"
+            tasks.append({
+                "task_id": len(tasks) + 1,
+                "operation": op,
+                "description": description,
+                "parameters": parameters[op]
+            })
+        return tasks, max(confidence, 0.0)
+
 class TaskPlanner:
     def __init__(self, model):
         # 创建一个专用于任务规划的Agent
@@ -36,8 +229,17 @@ class TaskPlanner:
             instructions="""你是一个任务规划专家，负责将用户的复杂请求分解为有序的任务步骤。""",
             model=model
         )
+        self.rule_planner = RuleBasedPlanner()
         
     async def create_plan(self, user_query: str, feedback: Optional[str] = None) -> list:
+        # 常见指令先走规则解析，只有解析不明确时才调用LLM
+        if not feedback:
+            tasks, confidence = self.rule_planner.parse(user_query)
+            if tasks and confidence >= self.rule_planner.min_confidence:
+                print(f"\033[92m规则解析成功（置信度 {confidence:.2f}），跳过LLM规划\033[0m")
+                return tasks
+            print(f"\033[93m规则解析置信度不足（{confidence:.2f}），使用LLM规划\033[0m")
+
         planning_prompt = f"""
         请分析以下用户请求，并将其分解为明确的按顺序执行的任务步骤：
         
@@ -148,6 +350,81 @@ class TaskPlanner:
 
 
 
+# 反馈轮次的默认参数
+FEEDBACK_RECEPTOR = "uploaded_pdb"
+FEEDBACK_BEST_REF = "best_ref_ligand_sdf"
+FEEDBACK_DOWNLOAD_DIR = "/home/zhangfn/test_download"
+
+def build_round_plan(receptor: str = FEEDBACK_RECEPTOR,
+                     ref_ligand: Optional[str] = None,
+                     n_samples: int = 1,
+                     dock_mode: Optional[str] = None,
+                     download_dir: Optional[str] = None) -> list:
+    """根据模板直接生成一轮"生成-对接-评估(-下载)"的任务计划，不经过LLM规划
+
+    Args:
+        receptor: 受体，可以是PDB文件绝对路径或"uploaded_pdb"字段
+        ref_ligand: 参考配体，可以是"best_ref_ligand_sdf"字段或SDF文件绝对路径，为None时不传
+        n_samples: 生成样本数量
+        dock_mode: 对接模式（"adgpu"或"vina"），为None时使用工具默认值
+        download_dir: 结果文件下载目录，为None时不添加下载任务
+
+    Returns:
+        与TaskPlanner.create_plan格式一致的任务列表
+    """
+    gen_params = {"pdb_file": receptor, "n_samples": n_samples}
+    if ref_ligand:
+        gen_params["ref_ligand"] = ref_ligand
+    dock_params = {"dock_mode": dock_mode} if dock_mode else {}
+
+    tasks = [
+        {
+            "operation": "molecule_generation",
+            "description": f"执行分子生成（{n_samples}个分子）",
+            "parameters": gen_params
+        },
+        {
+            "operation": "molecular_docking",
+            "description": f"执行{dock_mode + '模式的' if dock_mode else ''}分子对接（预筛选并跳过已对接过的分子）",
+            # 反馈轮次会重复生成相同结构，对接前预筛选并去重
+            "parameters": dict(dock_params, prefilter=True, dedup=True)
+        },
+        {
+            "operation": "conformation_evaluation",
+            "description": "进行构象评估",
+            "parameters": dict(dock_params)
+        }
+    ]
+    if download_dir:
+        tasks.append({
+            "operation": "download_all_outputs",
+            "description": "下载结果文件",
+            "parameters": {"output_path": download_dir}
+        })
+
+    for idx, task in enumerate(tasks):
+        task["task_id"] = idx + 1
+    return tasks
+
+def build_feedback_plan(feedback: Dict[str, Any]) -> list:
+    """根据上一轮反馈结果选择模板并生成下一轮任务计划"""
+    has_passed_molecule = False
+    if isinstance(feedback.get('message'), list):
+        has_passed_molecule = any(
+            isinstance(molecule, dict) and molecule.get('overall_pass') == 'YES'
+            for molecule in feedback['message']
+        )
+
+    if has_passed_molecule:
+        # 参考最佳配体进行新一轮分子生成、对接、评估，并下载结果
+        print(f"\033[92m检测到至少一个通过评估的分子，将自动使用最佳配体进行下一轮优化\033[0m")
+        return build_round_plan(ref_ligand=FEEDBACK_BEST_REF, n_samples=20,
+                                download_dir=FEEDBACK_DOWNLOAD_DIR)
+
+    # 扩大样本量进行新一轮分子生成、对接、评估
+    print("\033[93m未检测到通过评估的分子，将自动进行新一轮扩大样本量的分子生成\033[0m")
+    return build_round_plan(n_samples=100)
+
 async def run_agent_until_done(executor_agent, input_items, tasks=None):
     """按照规划执行任务，直到所有任务完成"""
     results = []
@@ -313,6 +590,31 @@ def parse_feedback_items(feedback):
     result["error"] = "未找到有效的反馈内容"
     return result
 
+async def run_scoped_feedback(mcp_servers: list[MCPServer], run_id: str):
+    """直接调用molecule_reflection(run_id=...)获取本运行的评估结果，不经过反馈智能体
+
+    反馈智能体可能漏传run_id而取到共享目录中其他运行的结果，因此设置了运行ID时由这里确定性地调用。
+
+    Returns:
+        工具返回的结果字典，评估不是按运行进行或调用失败时返回None
+    """
+    for server in mcp_servers:
+        tools = await server.list_tools()
+        if not any(tool.name == "molecule_reflection" for tool in tools):
+            continue
+        try:
+            result = await server.call_tool("molecule_reflection", {"run_id": run_id})
+            feedback = json.loads(result.content[0].text)
+        except Exception as e:
+            print(f"⚠️ 获取运行 {run_id} 的评估结果失败：{e}")
+            return None
+        if feedback.get("status") != "success" or feedback.get("scope") != "run":
+            print(f"⚠️ 运行 {run_id} 的评估结果不可用：{feedback.get('message')}")
+            return None
+        return feedback
+    print("⚠️ 未找到molecule_reflection工具")
+    return None
+
 async def chat(mcp_servers: list[MCPServer]):
     # 创建规划智能体
     planner_agent = TaskPlanner(deepseek_model)
@@ -398,37 +700,18 @@ async def chat(mcp_servers: list[MCPServer]):
             print(f"\n====== 第{round_num+1}轮操作 ======")
             print("您可以输入需要执行的任务，或输入'help'查看帮助信息：")
             
-            # 根据上一轮反馈自动生成提示词
+            # 根据上一轮反馈直接生成结构化计划，不再经过LLM规划
+            tasks = None
             if last_feedback is not None:
                 print(f"\n\033[94m[上一轮的执行反馈]:\033[0m")
                 print(f"last_feedback : {last_feedback}")
-                
-                # 检查是否有至少一个分子的overall_pass为YES
-                has_passed_molecule = False
-                
-                if 'message' in last_feedback and isinstance(last_feedback['message'], list):
-                    for molecule in last_feedback['message']:
-                        if molecule.get('overall_pass') == 'YES':
-                            has_passed_molecule = True
-                            break
-                
-                if has_passed_molecule:
-                    # 自动进入"参考最佳配体进行新一轮分子生成、对接、评估"
-                    # 使用"best_ref_ligand_sdf"参数，让系统自动使用最佳参考配体（n_samples=20）
-                    print(f"\033[92m检测到至少一个通过评估的分子，将自动使用最佳配体进行下一轮优化\033[0m")
-                    user_input = "请使用uploaded_pdb作为受体（即pdb_file参数的值为uploaded_pdb这个字段，不必过度解读），使用best_ref_ligand_sdf作为参考配体生成20个分子（即ref_ligand参数的值为best_ref_ligand_sdf这个字段，不必过度解读），然后执行分子对接，最后进行构象评估。最后将结果文件下载到/home/zhangfn/test_download"
-                else:
-                    # 自动进入"进行新一轮分子生成（n_samples=100）、对接、评估"
-                    print("\033[93m未检测到通过评估的分子，将自动进行新一轮扩大样本量的分子生成\033[0m")
-                    user_input = "请使用uploaded_pdb作为受体（即pdb_file参数的值为uploaded_pdb这个字段，不必过度解读）生成100个分子，再进行分子对接，然后进行构象评估"
+                tasks = build_feedback_plan(last_feedback)
+                user_input = "；".join(task["description"] for task in tasks)
+                print(f"\033[95m💬 系统自动生成的计划：{user_input}\033[0m")
             else:
                 # 如果没有上一轮反馈，请求用户输入
                 user_input = input("\033[95m💬 请输入您的指令：\033[0m ")
             
-            # 在这里输出实际使用的指令，便于用户了解系统正在执行什么
-            if last_feedback is not None:
-                print(f"\033[95m💬 系统自动生成的指令：{user_input}\033[0m")
-            
             # 处理特殊命令
             if user_input.lower() in ["exit", "quit"]:
                 print("\033[92m✅ 对话已结束\033[0m")
@@ -449,11 +732,15 @@ async def chat(mcp_servers: list[MCPServer]):
             # 保存用户输入
             input_items = [{"content": user_input, "role": "user"}]
             
-            # 显示处理中提示
-            print("\033[93m正在规划任务执行流程...\033[0m")
-            
-            # 创建执行计划
-            tasks = await planner_agent.create_plan(user_input, last_feedback)
+            # 只有自由输入才需要LLM规划
+            if tasks is None:
+                print("\033[93m正在规划任务执行流程...\033[0m")
+                tasks = await planner_agent.create_plan(user_input)
+
+            # 所有任务都带上运行ID
+            if tasks and RUN_ID:
+                for task in tasks:
+                    task.setdefault("parameters", {}).setdefault("run_id", RUN_ID)
             
             if tasks:
                 # 打印计划
@@ -475,13 +762,16 @@ async def chat(mcp_servers: list[MCPServer]):
                 if round_num == 0:  # 只在第一轮(索引为0)结束时执行
                     # 使用反馈智能体分析结果 - 不再传入执行结果，让它直接调用API
                     print("\n\033[93m正在分析执行结果...\033[0m")
-                    feedback_input = [{"role": "user", "content": "feedback"}]
-                    feedback = await Runner.run(reflection_agent, feedback_input)
-
-                    print(feedback)
-                    
                     last_feedback = None
-                    last_feedback = parse_feedback_items(feedback)  # 保存反馈用于下一次规划
+                    if RUN_ID:
+                        # 按运行评估，不经过反馈智能体；本运行的评估结果不可用时下一轮不自动生成计划
+                        last_feedback = await run_scoped_feedback(mcp_servers, RUN_ID)
+                        if last_feedback is None:
+                            print("\033[93m未能获取本运行的评估结果，下一轮请手动输入指令\033[0m")
+                    else:
+                        feedback = await Runner.run(reflection_agent, [{"role": "user", "content": "feedback"}])
+                        print(feedback)
+                        last_feedback = parse_feedback_items(feedback)  # 保存反馈用于下一次规划
                 else:
                     # 第二轮结束时的处理
                     print("\n\033[92m✅ 所有操作已完成。\033[0m")
@@ -505,28 +795,13 @@ async def chat(mcp_servers: list[MCPServer]):
             print("\n\033[93m您可以尝试重新输入或使用不同的表达方式\033[0m")
 
 async def mcp_run():
-    async with MCPServerStdio(
-        name = "molecular_generation_server",
-        cache_tools_list = True,
-        params = {"command": "uv", "args": ["run", "mol_generation_server.py"]} 
-    ) as mol_gen_server, MCPServerStdio(
-        name = "molecular_docking_server",
-        cache_tools_list = True,
-        params = {"command": "uv", "args": ["run", "mol_docking_server.py"]}
-    ) as docking_server, MCPServerStdio(
-        name = "molecular_eval_server",
-        cache_tools_list = True,
-        params = {"command": "uv", "args": ["run", "mol_eval_server.py"]}
-    ) as conf_eval_server, MCPServerStdio(
-        name = "molecular_download_server",
-        cache_tools_list = True,
-        params = {"command": "uv", "args": ["run", "mol_download_server.py"]}
-    ) as mol_download_server, MCPServerStdio(
-        name = "molecular_reflection_server",
-        cache_tools_list = True,
-        params = {"command": "uv", "args": ["run", "mol_reflection_server.py"]}
-    ) as mol_reflection_server:
-        await chat([mol_gen_server, docking_server, conf_eval_server, mol_download_server, mol_reflection_server])
+    # 各服务器并行启动；MOL_MCP_LAZY=1时只在首次调用其工具时启动，工具列表读取磁盘缓存
+    mcp_servers = create_mcp_servers()
+    try:
+        await start_mcp_servers(mcp_servers)
+        await chat(mcp_servers)
+    finally:
+        await stop_mcp_servers(mcp_servers)
 
 if __name__ == '__main__':
     asyncio.run(mcp_run())
\ No newline at end of file
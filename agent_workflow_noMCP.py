@@ -8,6 +8,10 @@ import requests, json
 import os.path
 from typing import Dict, Any, List
 import asyncio
+
+from eval_columns import EvalColumnStore, append_evaluation_csv
+import backend_client
+from pdbqt_utils import read_binding_energy, BINDING_ENERGY_THRESHOLD
 load_dotenv(override=True)
 
 API_KEY = os.getenv("API_KEY")
@@ -27,6 +31,7 @@ deepseek_model = OpenAIChatCompletionsModel(
 )
 
 # 移除function_tool装饰器，变为普通函数
+# 注意：这些函数直接请求后端，与mol_xxx_server.py中的同名工具是两套独立实现，修改后端接口时需要同时修改
 def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
     """执行分子生成计算
     
@@ -113,6 +118,7 @@ def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
         return {"status": "error", "message": f"API调用失败: {str(e)}"}
 
 # 移除function_tool装饰器，变为普通函数
+# 注意：这些函数直接请求后端，与mol_xxx_server.py中的同名工具是两套独立实现，修改后端接口时需要同时修改
 def download_molecule(molecule_name, output_path):
     """下载生成的分子文件
     
@@ -146,13 +152,9 @@ def download_molecule(molecule_name, output_path):
         download_url = f"http://localhost:5000/api/download/molecule_generation/{molecule_name}"
         
         print(f"正在从 {download_url} 下载分子文件...")
-        response = requests.get(download_url, stream=True, timeout=300)
+        saved = backend_client.save_output(download_url, output_path, timeout=300)
         
-        if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
+        if saved is not None:
             return {
                 "status": "success",
                 "message": f"分子文件成功下载到 {output_path}",
@@ -161,8 +163,7 @@ def download_molecule(molecule_name, output_path):
         else:
             return {
                 "status": "error",
-                "message": f"下载失败，服务器返回: {response.status_code}",
-                "response": response.text
+                "message": f"下载失败: {download_url}"
             }
     except Exception as e:
         print(f"分子下载失败: {str(e)}")
@@ -316,17 +317,12 @@ def batch_download_docking_results(result_files, output_dir):
             output_path = os.path.join(output_dir, result_file)
             
             print(f"正在从 {download_url} 下载对接结果文件...")
-            response = requests.get(download_url, stream=True, timeout=60)
-            
-            if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            if backend_client.save_output(download_url, output_path) is not None:
                 downloaded_files.append(result_file)
             else:
                 failed_files.append({
                     "filename": result_file,
-                    "error": f"下载失败，服务器返回: {response.status_code}"
+                    "error": "下载失败"
                 })
         except Exception as e:
             print(f"文件下载失败 {result_file}: {str(e)}")
@@ -450,13 +446,15 @@ def conformation_evaluation(pred_file, cond_file, dock_mode):
         print(f"API调用失败: {str(e)}")
         return {"status": "error", "message": f"API调用失败: {str(e)}"}
 
-def download_evaluation_result(result_file, output_path):
-    """下载构象评估结果文件
+def download_evaluation_result(result_file, output_path, pose_key=None, energy=None):
+    """下载构象评估结果文件，并追加到列式评估结果存储中
     
     Args:
         params: 包含以下字段的字典:
             result_file: 结果文件名 (如 "posebusters_results.csv")
             output_path: 保存文件的本地路径 (可选，默认为当前目录下的同名文件)
+            pose_key: 该结果对应的构象键（可选，如.pdbqt文件名）
+            energy: 该构象的对接结合能（可选）
     
     Returns:
         包含状态和结果的字典: {"status": "success/failure", "message": 操作结果或错误信息, "file_path": 保存的文件路径}
@@ -492,12 +490,12 @@ def download_evaluation_result(result_file, output_path):
         download_url = f"http://localhost:5000/api/download/conformation_evaluation/{result_file}"
         
         print(f"正在从 {download_url} 下载评估结果文件...")
-        response = requests.get(download_url, stream=True, timeout=60)
+        saved = backend_client.save_output(download_url, output_path)
         
-        if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        if saved is not None:
+
+            # 追加到列式存储，后续按构象查询时不需要重新解析CSV
+            append_evaluation_csv(output_path, pose_key=pose_key, energy=energy)
             
             return {
                 "status": "success",
@@ -507,8 +505,7 @@ def download_evaluation_result(result_file, output_path):
         else:
             return {
                 "status": "error",
-                "message": f"下载失败，服务器返回: {response.status_code}",
-                "response": response.text
+                "message": f"下载失败: {download_url}"
             }
     except Exception as e:
         print(f"评估结果下载失败: {str(e)}")
@@ -800,7 +797,9 @@ def complete_molecule_workflow(pdb_file, output_dir, ref_ligand="A:330", n_sampl
     }
     
     # 第5步：构象评估
-    print("步骤5/6: 执行构象评估...")
+    print("步骤5/6: 执行构象评估并下载评估结果...")
+    results["evaluation_results_download"] = []
+    all_success = True
 
     pred_files = [f for f in results["generated_files"]["docking_result_files"] if f.endswith('.pdbqt') and os.path.isfile(f)]
 
@@ -811,7 +810,6 @@ def complete_molecule_workflow(pdb_file, output_dir, ref_ligand="A:330", n_sampl
         }
     else:
         results["conformation_evaluation"] = []
-        all_success = True
 
         for pred_file in pred_files:
             eval_result = conformation_evaluation(pred_file, pdb_file, dock_mode)
@@ -826,23 +824,33 @@ def complete_molecule_workflow(pdb_file, output_dir, ref_ligand="A:330", n_sampl
                 # 提取出文件名
                 download_url = eval_result.get("result", {}).get("download_url")
                 if download_url:
-                    # 获取文件名部分（路径最后一部分）
+                    # 后端每次评估都会覆盖同名结果文件，因此评估后立即下载，本地按构象区分文件名
                     evaluation_file = download_url.split('/')[-1]
+                    pose_key = os.path.basename(pred_file)
+                    local_eval_path = os.path.join(output_dir, f"{os.path.splitext(pose_key)[0]}_{evaluation_file}")
+                    print(f"local_eval_path = {local_eval_path}")
+                    energy = read_binding_energy(pred_file)
+                    download_result = download_evaluation_result(evaluation_file, local_eval_path, pose_key,
+                                                                 None if energy != energy else energy)
+                    results["evaluation_results_download"].append({
+                        "remote_file": evaluation_file,
+                        "pose": pose_key,
+                        "download_result": download_result
+                    })
+                    if download_result["status"] != "success":
+                        all_success = False
             else:
                 all_success = False
 
-    # 第6步：下载构象评估结果文件
-    print("步骤6/6: 下载构象评估结果文件...")
-    results["evaluation_results_download"] = []
-    print(f"evaluation_file = {evaluation_file}")
-    
-    local_eval_path = os.path.join(output_dir, os.path.basename(evaluation_file))
-    print(f"local_eval_path = {local_eval_path}")
-    download_result = download_evaluation_result(evaluation_file, local_eval_path)
-    results["evaluation_results_download"].append({
-        "remote_file": evaluation_file,
-        "download_result": download_result
-    })
+    # 第6步：汇总评估结果
+    print("步骤6/6: 汇总构象评估结果...")
+    try:
+        passing = EvalColumnStore().passing_poses(energy_below=BINDING_ENERGY_THRESHOLD)
+        pose_keys = {os.path.basename(f) for f in pred_files}
+        results["passing_poses"] = [item for item in passing if item["pose"] in pose_keys]
+        print(f"通过全部检查且结合能小于{BINDING_ENERGY_THRESHOLD}的构象: {len(results['passing_poses'])} 个")
+    except Exception as e:
+        print(f"汇总评估结果失败: {str(e)}")
 
     if all_success:
         results["status"] = "success"
@@ -8,6 +8,9 @@ import requests, json
 import os.path
 from typing import Dict, Any, List
 import asyncio
+
+from artifact_store import save_response
+from eval_columns import append_evaluation_csv
 load_dotenv(override=True)
 
 API_KEY = os.getenv("API_KEY")
@@ -27,6 +30,7 @@ deepseek_model = OpenAIChatCompletionsModel(
 )
 
 # 移除function_tool装饰器，变为普通函数
+# 注意：这些函数直接请求后端，与mol_xxx_server.py中的同名工具是两套独立实现，修改后端接口时需要同时修改
 def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
     """执行分子生成计算
     
@@ -149,9 +153,7 @@ def download_molecule(molecule_name, output_path):
         response = requests.get(download_url, stream=True, timeout=300)
         
         if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            save_response(response, output_path)
             
             return {
                 "status": "success",
@@ -319,9 +321,7 @@ def batch_download_docking_results(result_files, output_dir):
             response = requests.get(download_url, stream=True, timeout=60)
             
             if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                save_response(response, output_path)
                 downloaded_files.append(result_file)
             else:
                 failed_files.append({
@@ -451,7 +451,7 @@ def conformation_evaluation(pred_file, cond_file, dock_mode):
         return {"status": "error", "message": f"API调用失败: {str(e)}"}
 
 def download_evaluation_result(result_file, output_path):
-    """下载构象评估结果文件
+    """下载构象评估结果文件，并追加到列式评估结果存储中
     
     Args:
         params: 包含以下字段的字典:
@@ -495,9 +495,9 @@ def download_evaluation_result(result_file, output_path):
         response = requests.get(download_url, stream=True, timeout=60)
         
         if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            save_response(response, output_path)
+            # 追加到列式存储，跨运行汇总评估结果
+            append_evaluation_csv(output_path)
             
             return {
                 "status": "success",
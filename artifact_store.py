@@ -0,0 +1,189 @@
+"""内容寻址的本地文件存储：下载的结果文件按sha256只保存一份
+
+对象文件只读保存在objects/<前2位>/<sha256>，其硬链接数减1即为被输出路径引用的次数。
+
+输出文件默认是对象的独立可写副本：文件系统支持reflink（btrfs、xfs等）时为写时复制的克隆，不占用额外空间，
+否则为普通复制。工具和用户可以照常原地修改输出文件，不会影响对象和其他输出。
+设置MOL_ARTIFACT_HARDLINK=1（或调用时link=True）时输出改为指向对象的硬链接，同一内容只占一份空间，
+但这样的输出是只读的：原地写入会同时修改对象和其他所有输出（以root运行时只读权限不能阻止），
+只能整体替换（写入临时文件后os.replace）。
+
+垃圾回收删除没有任何输出路径引用、且超过指定时间未被使用的对象，复制或克隆的输出不算引用，
+因此不使用硬链接时存储相当于最近下载内容的缓存。
+共享文件系统模式下对象路径会直接作为输入传给后端（不被输出路径引用），
+因此最近GC_GRACE_SECONDS内写入或再次使用过的对象总是保留，避免在后端读取期间被回收。
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ARTIFACT_DIR = Path(os.getenv("MOL_ARTIFACT_DIR", "/home/zhangfn/workflow/artifacts"))
+# 输出路径是否使用指向对象的硬链接（只读，见模块说明）
+ARTIFACT_HARDLINK = os.getenv("MOL_ARTIFACT_HARDLINK", "0") == "1"
+# 不小于后端请求的最长超时时间（对接为600秒）
+GC_GRACE_SECONDS = float(os.getenv("MOL_ARTIFACT_GC_GRACE", "3600"))
+# Linux的FICLONE ioctl：在支持reflink的文件系统上创建写时复制的克隆
+FICLONE = 0x40049409
+
+def _clone(source, target):
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def link_or_copy(source, output_path, link: bool = None) -> str:
+    """在output_path处生成source的副本，返回使用的方式: "existing"/"hardlink"/"reflink"/"copy"
+
+    link为True时生成硬链接（失败时退回复制），默认由MOL_ARTIFACT_HARDLINK决定；
+    否则优先生成写时复制的克隆，文件系统不支持时普通复制，输出都是可写的独立文件
+    """
+    link = ARTIFACT_HARDLINK if link is None else link
+    output_path = Path(output_path)
+    if link and output_path.exists() and os.path.samefile(source, output_path):
+        return "existing"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    method = None
+    if link:
+        try:
+            os.link(source, temp_path)
+            method = "hardlink"
+        except OSError:
+            pass
+    if method is None:
+        try:
+            _clone(source, temp_path)
+            method = "reflink"
+        except OSError:
+            # 跨文件系统或不支持reflink的文件系统：普通复制
+            shutil.copyfile(source, temp_path)
+            method = "copy"
+        os.chmod(temp_path, 0o644)
+    os.replace(temp_path, output_path)
+    return method
+
+def save_response(response, output_path, chunk_size: int = 8192) -> dict:
+    """把HTTP响应的内容流式写入内容寻址存储，并在output_path处生成输出文件，返回{"digest", "size", "method"}"""
+    return ArtifactStore().save_stream(response.iter_content(chunk_size=chunk_size), output_path)
+
+class ArtifactStore:
+    """内容寻址存储"""
+
+    def __init__(self, root: Path = ARTIFACT_DIR):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+
+    def path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def _commit(self, temp_path: str, digest: str) -> Path:
+        """把临时文件登记为对象，已存在相同内容时丢弃临时文件"""
+        target = self.path(digest)
+        if target.exists():
+            os.remove(temp_path)
+            # 刷新mtime，避免刚被再次使用的对象被按时间回收
+            os.utime(target)
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, target)
+        return target
+
+    def put_stream(self, chunks) -> tuple:
+        """边写入边计算哈希，返回(digest, size)"""
+        self.objects.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile("wb", dir=self.objects, delete=False) as temp_file:
+            try:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        temp_file.write(chunk)
+                        size += len(chunk)
+            except BaseException:
+                temp_file.close()
+                os.remove(temp_file.name)
+                raise
+        self._commit(temp_file.name, digest.hexdigest())
+        return digest.hexdigest(), size
+
+    def put_bytes(self, data: bytes) -> tuple:
+        """内存中的数据先计算哈希，对象已存在时不再写盘"""
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if target.exists():
+            os.utime(target)
+            return digest, len(data)
+        return self.put_stream([data])
+
+    def put_file(self, path) -> tuple:
+        def chunks():
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(1 << 20)
+                    if not chunk:
+                        return
+                    yield chunk
+        return self.put_stream(chunks())
+
+    def materialize(self, digest: str, output_path, link: bool = None) -> str:
+        """在output_path处生成对象的副本（见link_or_copy），返回使用的方式"""
+        return link_or_copy(self.path(digest), output_path, link)
+
+    def save_stream(self, chunks, output_path, link: bool = None) -> dict:
+        """保存数据流并在output_path处生成文件，返回{"digest", "size", "method"}"""
+        digest, size = self.put_stream(chunks)
+        return {"digest": digest, "size": size, "method": self.materialize(digest, output_path, link)}
+
+    def save_file(self, source_path, output_path, link: bool = None) -> dict:
+        """把已有文件登记到存储中并在output_path处生成文件"""
+        digest, size = self.put_file(source_path)
+        return {"digest": digest, "size": size, "method": self.materialize(digest, output_path, link)}
+
+    def gc(self, max_age_seconds: float = 0) -> dict:
+        """回收没有被任何输出路径引用（硬链接数为1）且超过max_age_seconds未使用的对象
+
+        max_age_seconds小于GC_GRACE_SECONDS时按GC_GRACE_SECONDS处理；
+        同时清理写入中断（进程崩溃）后遗留在objects/下、超过GC_GRACE_SECONDS的临时文件
+        """
+        removed, freed, kept, temp_removed = 0, 0, 0, 0
+        now = time.time()
+        max_age_seconds = max(max_age_seconds, GC_GRACE_SECONDS)
+        if not self.objects.exists():
+            return {"removed": 0, "freed_bytes": 0, "kept": 0, "temp_removed": 0}
+        for prefix in os.scandir(self.objects):
+            if not prefix.is_dir():
+                # put_stream的临时文件，正在写入的临时文件不会超过宽限时间
+                stat = prefix.stat()
+                if now - stat.st_mtime >= GC_GRACE_SECONDS:
+                    os.remove(prefix.path)
+                    temp_removed += 1
+                    freed += stat.st_size
+                continue
+            for entry in os.scandir(prefix.path):
+                stat = entry.stat()
+                if stat.st_nlink <= 1 and now - stat.st_mtime >= max_age_seconds:
+                    os.remove(entry.path)
+                    removed += 1
+                    freed += stat.st_size
+                else:
+                    kept += 1
+        return {"removed": removed, "freed_bytes": freed, "kept": kept, "temp_removed": temp_removed}
+
+    def usage(self) -> dict:
+        """统计对象数量、占用空间和被引用次数"""
+        count, size, references = 0, 0, 0
+        if self.objects.exists():
+            for prefix in os.scandir(self.objects):
+                if not prefix.is_dir():
+                    continue
+                for entry in os.scandir(prefix.path):
+                    stat = entry.stat()
+                    count += 1
+                    size += stat.st_size
+                    references += stat.st_nlink - 1
+        return {"objects": count, "bytes": size, "references": references}
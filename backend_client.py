@@ -0,0 +1,202 @@
+"""分子设计后端(Flask API)的共享HTTP客户端
+
+所有MCP服务器通过这里访问后端，后端地址可以通过环境变量MOL_BACKEND_URL配置。
+
+共享文件系统模式：后端与本进程运行在同一台机器并读写同一个工作目录时，文件字段不再以multipart上传内容，
+而是在表单中传入"<字段名>_path"（绝对路径）和"<字段名>_name"（后端命名输出文件时使用的文件名），
+后端报告的结果目录就是本地的共享downloads目录时，结果文件也直接从该目录读取，不再经HTTP下载。
+只在内存中的内容（如分块后的配体）先写入工作目录下的内容寻址存储，再传入对象路径。
+模式由环境变量MOL_SHARED_FS控制：auto（默认，自动检测）、on、off。
+
+Unix域套接字：设置MOL_BACKEND_UDS（如后端以gunicorn --bind unix:/run/mol_backend.sock启动）后，
+发往BACKEND_URL的请求改为经该套接字发送（httpx，长连接），不再经过TCP回环；其他后端地址仍使用TCP。
+"""
+import os
+import threading
+import uuid
+from pathlib import Path
+from urllib.parse import urlparse
+
+import httpx
+import requests
+
+from artifact_store import ArtifactStore
+from workspace import WORKFLOW_ROOT, SHARED_DOWNLOADS
+
+BACKEND_URL = os.getenv("MOL_BACKEND_URL", "http://localhost:5000")
+SHARED_FS = os.getenv("MOL_SHARED_FS", "auto").lower()
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+BACKEND_UDS = os.getenv("MOL_BACKEND_UDS")
+
+def api_url(path: str, base_url: str = None) -> str:
+    """拼接后端API地址，path已经是完整URL时原样返回"""
+    if path.startswith("http://") or path.startswith("https://"):
+        return path
+    return (base_url or BACKEND_URL).rstrip("/") + "/" + path.lstrip("/")
+
+_uds_client = None
+_uds_client_lock = threading.Lock()
+
+def uds_client(url: str):
+    """url指向BACKEND_URL且配置了MOL_BACKEND_UDS时返回经Unix域套接字发送请求的共享客户端，否则返回None"""
+    global _uds_client
+    if not BACKEND_UDS or not url.startswith(BACKEND_URL.rstrip("/") + "/"):
+        return None
+    with _uds_client_lock:
+        if _uds_client is None:
+            _uds_client = httpx.Client(transport=httpx.HTTPTransport(uds=BACKEND_UDS))
+        return _uds_client
+
+def post(path: str, base_url: str = None, **kwargs):
+    """向后端发送POST请求，返回的响应对象支持status_code、json()、text、content"""
+    url = api_url(path, base_url)
+    client = uds_client(url)
+    if client is not None:
+        return client.post(url, **kwargs)
+    return requests.post(url, **kwargs)
+
+def get(path: str, base_url: str = None, **kwargs):
+    """向后端发送GET请求，返回的响应对象支持status_code、json()、text、content"""
+    url = api_url(path, base_url)
+    client = uds_client(url)
+    if client is not None:
+        return client.get(url, **kwargs)
+    return requests.get(url, **kwargs)
+
+def iter_download(path: str, base_url: str = None, timeout: int = 60, chunk_size: int = 8192):
+    """流式下载后端文件，逐块返回内容，服务器返回错误时抛出RuntimeError"""
+    url = api_url(path, base_url)
+    client = uds_client(url)
+    if client is not None:
+        with client.stream("GET", url, timeout=timeout) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"服务器返回状态码: {response.status_code}")
+            yield from response.iter_bytes(chunk_size)
+        return
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"服务器返回状态码: {response.status_code}")
+        yield from response.iter_content(chunk_size=chunk_size)
+
+_shared_fs_cache = {}
+_shared_fs_lock = threading.Lock()
+
+def shared_filesystem(base_url: str = None) -> bool:
+    """判断后端是否与本进程共享工作目录（可以按路径传入文件），结果按后端地址缓存
+
+    auto模式下要求后端地址为本机，并在工作目录中写入一个探测文件，
+    由后端的/api/capabilities确认它支持按路径读写文件(shared_fs)且能看到该探测文件。
+    没有该接口的旧版后端、或运行在独立文件系统（如容器）中的后端都按上传模式处理。
+    """
+    return _shared_mode(base_url)["inputs"]
+
+def shared_downloads(base_url: str = None) -> bool:
+    """判断后端的结果文件是否写入本地的共享downloads目录（可以直接读取结果文件）
+
+    除共享工作目录外，还要求/api/capabilities返回的downloads路径与SHARED_DOWNLOADS相同，
+    否则共享目录中的同名文件可能是之前运行留下的旧文件，结果文件只能经HTTP下载。
+    """
+    return _shared_mode(base_url)["downloads"]
+
+def _shared_mode(base_url: str = None) -> dict:
+    if SHARED_FS in ("on", "1", "true"):
+        return {"inputs": True, "downloads": True}
+    if SHARED_FS in ("off", "0", "false"):
+        return {"inputs": False, "downloads": False}
+    base_url = (base_url or BACKEND_URL).rstrip("/")
+    # 经Unix域套接字访问的后端必然在本机
+    local = urlparse(base_url).hostname in LOOPBACK_HOSTS or uds_client(base_url + "/") is not None
+    if not local:
+        return {"inputs": False, "downloads": False}
+    # 并发分片/分块同时发起请求时只探测一次
+    with _shared_fs_lock:
+        if base_url not in _shared_fs_cache:
+            _shared_fs_cache[base_url] = _probe_shared_filesystem(base_url)
+        return _shared_fs_cache[base_url]
+
+def _probe_shared_filesystem(base_url: str) -> dict:
+    probe = WORKFLOW_ROOT / f".shared_fs_probe_{uuid.uuid4().hex}"
+    mode = {"inputs": False, "downloads": False}
+    try:
+        probe.touch()
+        response = get("/api/capabilities", base_url=base_url, params={"probe": str(probe)}, timeout=5)
+        capabilities = response.json() if response.status_code == 200 else {}
+        mode["inputs"] = bool(capabilities.get("shared_fs") and capabilities.get("probe_exists"))
+        downloads = capabilities.get("downloads")
+        mode["downloads"] = bool(mode["inputs"] and downloads and os.path.exists(downloads)
+                                 and SHARED_DOWNLOADS.exists() and os.path.samefile(downloads, SHARED_DOWNLOADS))
+    except Exception as e:
+        print(f"共享文件系统探测失败，使用上传模式: {str(e)}")
+    finally:
+        if probe.exists():
+            probe.unlink()
+    if mode["inputs"]:
+        print(f"后端 {base_url} 与本地共享工作目录，按路径传递文件；"
+              f"{'结果文件直接读取共享downloads目录' if mode['downloads'] else '后端结果目录不是共享downloads目录，结果文件经HTTP下载'}")
+    else:
+        print(f"后端 {base_url} 使用上传/下载模式")
+    return mode
+
+def _shared_path(path) -> str:
+    """返回后端可以直接读取的绝对路径，不在共享工作目录中的文件先放入内容寻址存储"""
+    path = Path(path).resolve()
+    if path.is_relative_to(WORKFLOW_ROOT.resolve()):
+        return str(path)
+    store = ArtifactStore()
+    return str(store.path(store.put_file(path)[0]))
+
+def attach_file(files: dict, data: dict, field: str, name: str, path=None, content: bytes = None, base_url: str = None):
+    """把一个文件字段加入请求：共享文件系统模式下只传路径，否则上传内容
+
+    Args:
+        files: requests的files参数，上传模式下写入
+        data: requests的data参数，共享文件系统模式下写入"<field>_path"和"<field>_name"
+        field: 后端API的文件字段名，如"pdb_file"
+        name: 上传的文件名，后端用它命名输出文件
+        path: 本地文件路径（与content二选一，都提供时以content为准）
+        content: 文件内容
+        base_url: 后端地址（可选，默认为BACKEND_URL）
+    """
+    if shared_filesystem(base_url):
+        if content is not None:
+            store = ArtifactStore()
+            shared_path = str(store.path(store.put_bytes(content)[0]))
+        else:
+            shared_path = _shared_path(path)
+        data[f"{field}_path"] = shared_path
+        data[f"{field}_name"] = name
+        return
+    if content is None:
+        with open(path, "rb") as f:
+            content = f.read()
+    files[field] = (name, content)
+
+def read_output(download_url: str, base_url: str = None, timeout: int = 60):
+    """读取后端生成的结果文件内容(bytes)，后端的结果目录就是共享downloads目录时直接读取，失败时返回None"""
+    name = os.path.basename(download_url)
+    if shared_downloads(base_url):
+        local_path = SHARED_DOWNLOADS / name
+        if local_path.is_file():
+            return local_path.read_bytes()
+    response = get(download_url, base_url=base_url, timeout=timeout)
+    return response.content if response.status_code == 200 else None
+
+def save_output(download_url: str, output_path, base_url: str = None, timeout: int = 60) -> dict:
+    """把后端生成的结果文件经内容寻址存储保存到output_path（输出方式见artifact_store.link_or_copy）
+
+    后端的结果目录就是共享downloads目录时直接从共享目录登记文件，否则流式下载。
+    后端会原地覆盖同名结果文件（如posebusters_results.csv），因此先登记到存储，不直接链接后端的文件。
+
+    Returns:
+        {"digest", "size", "method"}，下载失败时返回None
+    """
+    store = ArtifactStore()
+    if shared_downloads(base_url):
+        local_path = SHARED_DOWNLOADS / os.path.basename(download_url)
+        if local_path.is_file():
+            return store.save_file(local_path, output_path)
+    try:
+        return store.save_stream(iter_download(download_url, base_url=base_url, timeout=timeout), output_path)
+    except RuntimeError as e:
+        print(f"下载失败 {download_url}: {str(e)}")
+        return None
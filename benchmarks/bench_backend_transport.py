@@ -0,0 +1,103 @@
+"""后端传输延迟测试：比较TCP回环与Unix域套接字下载小文件（单个对接构象大小）的单次请求耗时
+
+本地启动一个同时监听TCP回环端口和Unix域套接字的HTTP服务器，分别测量:
+  - requests（每次请求新建TCP连接，backend_client未配置MOL_BACKEND_UDS时的方式）
+  - httpx长连接 + TCP回环
+  - backend_client.get + Unix域套接字（配置MOL_BACKEND_UDS时的方式）
+
+用法: python benchmarks/bench_backend_transport.py [请求次数，默认2000] [文件大小（字节），默认2048]
+"""
+import os
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def make_handler(payload, tcp):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 响应头和内容分两次写出，TCP长连接下需要关闭Nagle算法以免被延迟确认拖慢（Unix域套接字不支持该选项）
+        disable_nagle_algorithm = tcp
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+        def address_string(self):
+            # Unix域套接字的client_address为空字符串
+            return "local"
+    return Handler
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def measure(func, n_requests):
+    for _ in range(min(50, n_requests)):
+        func()
+    latencies = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return {
+        "median": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "total_ms": sum(latencies) / 1000
+    }
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    payload = os.urandom(size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "backend.sock")
+        tcp_server = serve(ThreadingHTTPServer(("127.0.0.1", 0), make_handler(payload, tcp=True)))
+        uds_server = serve(UnixHTTPServer(socket_path, make_handler(payload, tcp=False)))
+        base_url = f"http://localhost:{tcp_server.server_address[1]}"
+
+        # backend_client在导入时读取后端配置
+        os.environ["MOL_BACKEND_URL"] = base_url
+        os.environ["MOL_BACKEND_UDS"] = socket_path
+        import httpx
+        import requests
+        import backend_client
+
+        url = f"{base_url}/api/download/molecular_docking/3rfm_ligand_0_0.pdbqt"
+        with httpx.Client() as tcp_client:
+            cases = {
+                "requests (TCP，每次新建连接)": lambda: requests.get(url, timeout=60).content,
+                "httpx长连接 (TCP回环)": lambda: tcp_client.get(url, timeout=60).content,
+                "backend_client (Unix域套接字)": lambda: backend_client.get(url, timeout=60).content,
+            }
+            for func in cases.values():
+                assert func() == payload
+            results = {name: measure(func, n_requests) for name, func in cases.items()}
+
+        tcp_server.shutdown()
+        uds_server.shutdown()
+        uds_server.server_close()
+
+    print(f"请求次数: {n_requests}，文件大小: {size} 字节")
+    for name, result in results.items():
+        print(f"{name}: 中位数 {result['median']:.0f} us，p99 {result['p99']:.0f} us，合计 {result['total_ms']:.0f} ms")
+
+if __name__ == "__main__":
+    main()
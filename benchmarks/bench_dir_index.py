@@ -0,0 +1,58 @@
+"""目录索引性能测试：在包含大量对接结果文件的目录中，比较每次glob+正则排序与缓存索引的查询耗时
+
+用法: python benchmarks/bench_dir_index.py [文件数量，默认100000]
+"""
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dir_index import DirectoryIndex
+
+def glob_sorted(directory):
+    """原有实现：每次glob全部.pdbqt文件并按正则提取的序号排序"""
+    files = glob.glob(os.path.join(directory, "*.pdbqt"))
+    def extract_sort_key(file_path):
+        match = re.search(r'_([0-9]+)_', os.path.basename(file_path))
+        return int(match.group(1)) if match else float('inf')
+    return sorted(files, key=extract_sort_key)
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as tmp:
+        for idx in range(n_files):
+            open(os.path.join(tmp, f"3rfm_ligand_{idx // 10}_{idx % 10}.pdbqt"), "w").close()
+        open(os.path.join(tmp, "3rfm_mol.sdf"), "w").close()
+        # 让目录mtime早于扫描时刻，模拟稳定的目录
+        past = time.time() - 10
+        os.utime(tmp, (past, past))
+
+        glob_ms, _ = timed(lambda: glob_sorted(tmp), 3)
+        index = DirectoryIndex(tmp)
+        cold_ms, _ = timed(lambda: index.files(".pdbqt"), 1)
+        warm_files_ms, files = timed(lambda: index.files(".pdbqt"), 20)
+        warm_first_ms, _ = timed(lambda: index.first(".sdf"), 1000)
+
+        # 新增文件后索引应自动失效
+        open(os.path.join(tmp, "3rfm_ligand_999999_0.pdbqt"), "w").close()
+        refreshed_ms, refreshed = timed(lambda: index.files(".pdbqt"), 1)
+
+    print(f"文件数: {n_files}")
+    print(f"glob+正则排序: {glob_ms:.1f} ms/次")
+    print(f"索引首次扫描: {cold_ms:.1f} ms")
+    print(f"索引查询全部.pdbqt（复制列表）: {warm_files_ms:.2f} ms/次，共 {len(files)} 个")
+    print(f"索引查询第一个.sdf: {warm_first_ms * 1000:.1f} us/次")
+    print(f"新增文件后重新扫描: {refreshed_ms:.1f} ms，共 {len(refreshed)} 个")
+
+if __name__ == "__main__":
+    main()
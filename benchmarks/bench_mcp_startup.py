@@ -0,0 +1,78 @@
+"""MCP服务器启动测试：比较五个独立stdio服务器与合并服务器(mol_all_server.py)的启动耗时和内存占用
+
+每种配置启动全部服务器进程、完成MCP初始化并取得工具列表，记录耗时和服务器进程的RSS总和。
+为了在没有uv的环境中运行，这里直接用当前解释器启动服务器脚本，不包含uv解析依赖的耗时。
+
+用法: python benchmarks/bench_mcp_startup.py [重复次数，默认3]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from contextlib import AsyncExitStack
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from agents.mcp import MCPServerStdio
+
+from mol_all_server import SERVER_MODULES
+
+def configurations():
+    separate = [[f"{name}.py"] for name in SERVER_MODULES]
+    configs = {"五个独立服务器": separate, "合并服务器（1个进程）": [["mol_all_server.py"]]}
+    configs["合并服务器（2个分片）"] = [["mol_all_server.py", "--shard", str(i), "--shards", "2"] for i in range(2)]
+    return configs
+
+def child_rss_kb() -> int:
+    """当前进程所有子进程的RSS总和（KB），从/proc读取"""
+    total = 0
+    my_pid = str(os.getpid())
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                ppid = f.read().rsplit(")", 1)[1].split()[1]
+            if ppid != my_pid:
+                continue
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except (FileNotFoundError, ProcessLookupError, IndexError):
+            continue
+    return total
+
+async def start_servers(server_args):
+    """启动一组服务器并取得全部工具，返回(耗时秒, RSS KB, 工具名列表)"""
+    start = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        servers = []
+        for idx, args in enumerate(server_args):
+            server = MCPServerStdio(
+                name=f"bench_server_{idx}",
+                params={"command": sys.executable, "args": args, "cwd": ROOT, "env": {**os.environ, "PYTHONWARNINGS": "ignore"}}
+            )
+            servers.append(await stack.enter_async_context(server))
+        tools = [tool.name for server in servers for tool in await server.list_tools()]
+        elapsed = time.perf_counter() - start
+        rss = child_rss_kb()
+    return elapsed, rss, sorted(tools)
+
+async def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    reference = None
+    for name, server_args in configurations().items():
+        timings, rss_values = [], []
+        for _ in range(repeat):
+            elapsed, rss, tools = await start_servers(server_args)
+            timings.append(elapsed)
+            rss_values.append(rss)
+        if reference is None:
+            reference = tools
+        assert tools == reference, f"{name} 的工具列表与独立服务器不一致: {tools}"
+        print(f"{name}: {len(server_args)} 个进程，启动并取得 {len(tools)} 个工具 "
+              f"中位数 {statistics.median(timings) * 1000:.0f} ms，RSS合计 {statistics.median(rss_values) / 1024:.0f} MB")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""工具调用开销测试：比较本进程内直接调用(inprocess)、stdio子进程和SSE常驻服务器三种方式的单次调用耗时
+
+调用的是下载服务器的artifact_gc工具，内容寻址存储指向空的临时目录，工具本身几乎不做任何工作，
+测得的耗时基本就是调用方式本身的开销（参数/结果序列化、管道或HTTP往返、线程切换）。
+
+用法: python benchmarks/bench_tool_transport.py [调用次数，默认200]
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from agents.mcp import MCPServerStdio, MCPServerSse
+
+from mcp_launcher import InProcessMCPServer
+
+TOOL_NAME = "artifact_gc"
+TOOL_ARGS = {"max_age_hours": 1000}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"SSE服务器未在 {timeout} 秒内启动")
+
+async def measure(server, n_calls):
+    await server.connect()
+    try:
+        for _ in range(min(20, n_calls)):
+            result = await server.call_tool(TOOL_NAME, TOOL_ARGS)
+            assert not result.isError, result
+        latencies = []
+        for _ in range(n_calls):
+            start = time.perf_counter()
+            await server.call_tool(TOOL_NAME, TOOL_ARGS)
+            latencies.append((time.perf_counter() - start) * 1e6)
+    finally:
+        await server.cleanup()
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+async def main():
+    n_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "MOL_ARTIFACT_DIR": tmp, "PYTHONWARNINGS": "ignore"}
+        os.environ["MOL_ARTIFACT_DIR"] = tmp
+        port = free_port()
+        daemon = subprocess.Popen(
+            [sys.executable, "mol_download_server.py", "--transport", "sse", "--port", str(port)],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            await wait_for_port(port)
+            transports = {
+                "inprocess（本进程内调用）": InProcessMCPServer("download", "mol_download_server"),
+                "stdio（子进程）": MCPServerStdio(
+                    params={"command": sys.executable, "args": ["mol_download_server.py"], "cwd": ROOT, "env": env}),
+                "sse（常驻服务器）": MCPServerSse(params={"url": f"http://127.0.0.1:{port}/sse"}),
+            }
+            results = {name: await measure(server, n_calls) for name, server in transports.items()}
+        finally:
+            # uvicorn收到SIGTERM后会等待SSE连接全部关闭，测试结束后直接结束进程
+            daemon.kill()
+            daemon.wait()
+
+    print(f"工具: {TOOL_NAME}，调用次数: {n_calls}")
+    for name, (median, p99) in results.items():
+        print(f"{name}: 中位数 {median:.0f} us，p99 {p99:.0f} us")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -9,6 +9,10 @@ from dotenv import load_dotenv
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp.client.sse import sse_client
+
+from server_cli import DAEMON_PORTS, daemon_running, daemon_url
+from progress import progress_logging_callback
 
 # 加载 .env 文件，确保 API Key 受到保护
 load_dotenv()
@@ -37,17 +41,26 @@ class MCPMoleculeClient:
         if not (is_python or is_js):
             raise ValueError("服务器脚本必须是 .py 或 .js 文件")
 
-        command = "python" if is_python else "node"
-        server_params = StdioServerParameters(
-            command=command,
-            args=[server_script_path],
-            env=None
-        )
+        # 已有常驻服务器（--transport sse）时直接连接，不再启动新的子进程
+        if is_python and os.path.basename(server_script_path) in DAEMON_PORTS and daemon_running(server_script_path):
+            url = daemon_url(server_script_path)
+            print(f"连接常驻服务器: {url}")
+            transport = await self.exit_stack.enter_async_context(sse_client(url))
+        else:
+            command = "python" if is_python else "node"
+            server_params = StdioServerParameters(
+                command=command,
+                args=[server_script_path],
+                env=None
+            )
 
-        # 启动 MCP 服务器并建立通信
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.stdio, self.write))
+            # 启动 MCP 服务器并建立通信
+            transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
+        self.stdio, self.write = transport
+        # 长时间运行的工具会发送阶段性结果，收到时在终端打印进度
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(self.stdio, self.write, logging_callback=progress_logging_callback(os.path.basename(server_script_path)))
+        )
 
         await self.session.initialize()
 
@@ -0,0 +1,111 @@
+"""生成分子的结构去重：在对接前跳过本轮或历史轮次中已经对同一受体、同一对接模式对接过的分子"""
+import hashlib
+import os
+from pathlib import Path
+
+from sdf_utils import iter_sdf_records, parse_molblock
+
+# 跨轮次、跨运行持久化的已见结构集合，每行一个"<对接范围>:<结构键>"
+SEEN_KEYS_FILE = Path(os.getenv("MOL_DEDUP_SEEN_FILE", "/home/zhangfn/workflow/dedup/seen_keys.txt"))
+
+def structure_key(record: str):
+    """计算SDF记录的规范结构键，与原子顺序、坐标无关
+
+    对重原子图做Weisfeiler-Lehman迭代着色（元素、电荷、氢数、键级），再对颜色多重集取哈希。
+    不区分立体构型；记录无法解析时返回None。
+    """
+    atoms, bonds = parse_molblock(record)
+    if atoms is None:
+        return None
+
+    heavy = [idx for idx, atom in enumerate(atoms) if atom[0] != "H"]
+    heavy_set = set(heavy)
+    neighbors = {idx: [] for idx in heavy}
+    h_count = {idx: 0 for idx in heavy}
+    for a, b, order in bonds:
+        if a in heavy_set and b in heavy_set:
+            neighbors[a].append((b, order))
+            neighbors[b].append((a, order))
+        elif a in heavy_set:
+            h_count[a] += 1
+        elif b in heavy_set:
+            h_count[b] += 1
+
+    labels = {idx: f"{atoms[idx][0]}|{atoms[idx][1]}|{h_count[idx]}" for idx in heavy}
+    for _ in range(len(heavy)):
+        new_labels = {}
+        for idx in heavy:
+            neighborhood = sorted(f"{order}:{labels[nbr]}" for nbr, order in neighbors[idx])
+            new_labels[idx] = hashlib.sha1((labels[idx] + "(" + ",".join(neighborhood) + ")").encode()).hexdigest()
+        # 颜色划分不再细化时停止迭代
+        if len(set(new_labels.values())) == len(set(labels.values())):
+            labels = new_labels
+            break
+        labels = new_labels
+
+    return hashlib.sha1(",".join(sorted(labels.values())).encode()).hexdigest()
+
+def docking_scope(protein_content: bytes, dock_mode: str) -> str:
+    """对接范围：受体内容的哈希加对接模式，同一分子换受体或换模式时需要重新对接"""
+    return f"{hashlib.sha1(protein_content).hexdigest()}|{dock_mode}"
+
+class SeenSet:
+    """某个对接范围内持久化的已见结构集合，以追加方式写入文件"""
+
+    def __init__(self, scope: str, path: Path = SEEN_KEYS_FILE):
+        self.path = Path(path)
+        self.prefix = f"{scope}:"
+        self.keys = set()
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                # 只加载本范围的记录
+                self.keys = {line.strip()[len(self.prefix):] for line in f if line.startswith(self.prefix)}
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add_all(self, keys):
+        """记录新的结构键并追加写入文件"""
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self.keys]
+        if not new_keys:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write("".join(f"{self.prefix}{key}\n" for key in new_keys))
+        self.keys.update(new_keys)
+
+def filter_novel_molecules(ligand_path: str, output_path: str, seen: SeenSet):
+    """流式过滤SDF文件，只把未见过的分子写入output_path
+
+    Returns:
+        (stats, kept_indices, kept_keys): 去重统计、保留分子在原文件中的序号、保留分子的结构键
+            （与output_path中的记录一一对应，无法解析的记录为None）
+    """
+    stats = {"total": 0, "duplicate_in_batch": 0, "seen_before": 0, "unparsed": 0, "novel": 0}
+    kept_indices = []
+    kept_keys = []
+    batch_keys = set()
+    with open(output_path, "w") as out:
+        for idx, record in enumerate(iter_sdf_records(ligand_path)):
+            stats["total"] += 1
+            key = structure_key(record)
+            if key is None:
+                # 无法解析的记录保留，交给对接后端处理
+                stats["unparsed"] += 1
+            elif key in seen:
+                stats["seen_before"] += 1
+                continue
+            elif key in batch_keys:
+                stats["duplicate_in_batch"] += 1
+                continue
+            else:
+                batch_keys.add(key)
+            out.write(record)
+            kept_indices.append(idx)
+            kept_keys.append(key)
+    stats["novel"] = len(kept_indices)
+    stats["skipped"] = stats["total"] - stats["novel"]
+    return stats, kept_indices, kept_keys
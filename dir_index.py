@@ -0,0 +1,88 @@
+"""工作目录文件索引：缓存目录扫描结果，按扩展名分组并预先按配体/构象序号排序
+
+目录的mtime在增删、重命名文件时会改变，每次查询只需一次stat判断缓存是否失效。
+为避免同一mtime时间片内的修改被漏掉，mtime距扫描时刻过近时下一次查询仍会重新扫描。
+"""
+import os
+import threading
+import time
+
+from pdbqt_utils import RESULT_FILE_RE
+
+# mtime距扫描时刻小于该值（纳秒）时不信任缓存
+MTIME_SETTLE_NS = 1_000_000_000
+
+def result_sort_key(name: str):
+    """按(配体序号, 构象序号, 文件名)排序，无法解析序号的文件排在最后"""
+    match = RESULT_FILE_RE.search(name)
+    if not match:
+        return (float("inf"), float("inf"), name)
+    ligand, pose = match.groups()
+    return (int(ligand), -1 if pose is None else int(pose), name)
+
+class DirectoryIndex:
+    """单个目录的缓存索引"""
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._scanned_ns = 0
+        self._by_ext = {}
+        self._names = frozenset()
+
+    def _refresh(self):
+        try:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            self._mtime_ns, self._by_ext, self._names = None, {}, frozenset()
+            return
+        if mtime_ns == self._mtime_ns and self._scanned_ns - mtime_ns > MTIME_SETTLE_NS:
+            return
+
+        scanned_ns = time.time_ns()
+        by_ext = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    by_ext.setdefault(os.path.splitext(entry.name)[1], []).append(entry.name)
+        prefix = os.path.join(self.directory, "")
+        for names in by_ext.values():
+            names.sort(key=result_sort_key)
+        self._by_ext = {ext: [prefix + name for name in names] for ext, names in by_ext.items()}
+        self._names = frozenset(name for names in by_ext.values() for name in names)
+        self._mtime_ns, self._scanned_ns = mtime_ns, scanned_ns
+
+    def files(self, extension: str) -> list:
+        """返回指定扩展名（如".pdbqt"）的全部文件路径，已按配体/构象序号排序"""
+        with self._lock:
+            self._refresh()
+            return list(self._by_ext.get(extension, []))
+
+    def first(self, extension: str):
+        """返回排序后的第一个指定扩展名文件，没有时返回None"""
+        with self._lock:
+            self._refresh()
+            paths = self._by_ext.get(extension)
+            return paths[0] if paths else None
+
+    def count(self, extension: str) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._by_ext.get(extension, []))
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return os.path.basename(name) in self._names
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_index(directory) -> DirectoryIndex:
+    """获取目录的共享索引，同一进程内对同一目录只保留一份"""
+    key = os.path.abspath(str(directory))
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = DirectoryIndex(key)
+        return _INDEXES[key]
@@ -0,0 +1,253 @@
+"""posebusters评估结果的列式汇总：把每次下载的CSV追加到按列存储的二进制文件中，按构象查询时不再重新解析文本
+
+每一列是一个定长二进制文件（检查项uint8、数值float32、构象编号int32），读取时用np.memmap映射。
+schema.json记录列类型和有效行数，在所有列追加完成后最后写入，读取方只认schema中的行数。
+"""
+import csv
+import fcntl
+import json
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+EVAL_COLUMNS_DIR = Path(os.getenv("MOL_EVAL_COLUMNS_DIR", "/home/zhangfn/workflow/eval_columns"))
+
+# 检查项列：1为通过，0为未通过，255为缺失
+CHECK_MISSING = 255
+DTYPES = {"check": np.uint8, "float": np.float32, "int": np.int32}
+MISSING = {"check": CHECK_MISSING, "float": np.nan, "int": -1}
+
+# 系统列，不会从CSV中读取
+POSE_COLUMN = "pose_id"
+ENERGY_COLUMN = "energy"
+# CSV中可能标识构象的列名，以及可能给出结合能的列名
+KEY_COLUMN_NAMES = ("file", "filename", "mol_pred", "pred_file", "name", "molecule")
+ENERGY_COLUMN_NAMES = ("binding_energy", "energy", "vina_score", "docking_score")
+
+def _column_filename(name: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]", "_", name) + ".col"
+
+def _parse_check(value: str):
+    value = value.strip().lower()
+    if value in ("true", "yes", "1"):
+        return 1
+    if value in ("false", "no", "0"):
+        return 0
+    return None
+
+def _parse_float(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def _infer_type(values):
+    """推断CSV列的类型：全部为布尔值时为check，全部为数字时为float，否则返回None（不存储）"""
+    present = [value for value in values if value.strip()]
+    if not present:
+        return None
+    if all(_parse_check(value) is not None for value in present) and \
+            any(value.strip().lower() in ("true", "false", "yes", "no") for value in present):
+        return "check"
+    if all(_parse_float(value) is not None for value in present):
+        return "float"
+    return None
+
+class EvalColumnStore:
+    """按构象追加、按列查询的posebusters结果存储"""
+
+    def __init__(self, root: Path = EVAL_COLUMNS_DIR):
+        self.root = Path(root)
+
+    @contextmanager
+    def _locked(self):
+        """多个进程可能同时追加，写入期间持有文件锁"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def schema(self) -> dict:
+        path = self.root / "schema.json"
+        if not path.exists():
+            return {"n_rows": 0, "columns": {POSE_COLUMN: "int", ENERGY_COLUMN: "float"}}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def pose_keys(self) -> list:
+        """构象编号到构象键（通常为.pdbqt文件名）的映射列表"""
+        path = self.root / "keys.txt"
+        if not path.exists():
+            return []
+        with open(path, "r") as f:
+            return f.read().splitlines()
+
+    def __len__(self):
+        return self.schema()["n_rows"]
+
+    def column(self, name: str) -> np.ndarray:
+        """以只读memmap方式返回一列"""
+        schema = self.schema()
+        kind = schema["columns"][name]
+        if schema["n_rows"] == 0:
+            return np.zeros(0, dtype=DTYPES[kind])
+        return np.memmap(self.root / _column_filename(name), dtype=DTYPES[kind], mode="r", shape=(schema["n_rows"],))
+
+    def check_columns(self) -> list:
+        return [name for name, kind in self.schema()["columns"].items() if kind == "check"]
+
+    def append_csv(self, csv_path, pose_key: str = None, energy: float = None) -> int:
+        """把一个posebusters结果CSV追加到存储中
+
+        Args:
+            csv_path: 下载到本地的CSV文件路径
+            pose_key: 构象键（可选）。CSV中没有可识别的构象列时使用，多行时追加"#行号"
+            energy: 该构象的对接结合能（可选），CSV中没有结合能列时写入
+
+        Returns:
+            追加的行数
+        """
+        with open(csv_path, "r", newline="") as f:
+            rows = list(csv.DictReader(f))
+        if not rows:
+            return 0
+        names = [name for name in rows[0].keys() if name]
+        key_column = next((name for name in names if name.strip().lower() in KEY_COLUMN_NAMES), None)
+        energy_column = next((name for name in names if name.strip().lower() in ENERGY_COLUMN_NAMES), None)
+
+        if key_column:
+            keys = [os.path.basename(row[key_column] or "") or pose_key or "" for row in rows]
+        else:
+            fallback = pose_key or os.path.basename(str(csv_path))
+            keys = [fallback] if len(rows) == 1 else [f"{fallback}#{idx}" for idx in range(len(rows))]
+
+        new_columns = {}
+        for name in names:
+            if name in (key_column, energy_column) or name in (POSE_COLUMN, ENERGY_COLUMN):
+                continue
+            kind = _infer_type([row[name] or "" for row in rows])
+            if kind:
+                parse = _parse_check if kind == "check" else _parse_float
+                values = [parse(row[name] or "") for row in rows]
+                new_columns[name] = (kind, [MISSING[kind] if value is None else value for value in values])
+
+        if energy_column:
+            energies = [_parse_float(row[energy_column] or "") for row in rows]
+        else:
+            energies = [energy] * len(rows)
+        new_columns[ENERGY_COLUMN] = ("float", [np.nan if value is None else value for value in energies])
+
+        with self._locked():
+            schema = self.schema()
+            n_rows = schema["n_rows"]
+
+            key_list = self.pose_keys()
+            key_index = {key: idx for idx, key in enumerate(key_list)}
+            added_keys = [key for key in dict.fromkeys(keys) if key not in key_index]
+            for key in added_keys:
+                key_index[key] = len(key_index)
+            if added_keys:
+                with open(self.root / "keys.txt", "a") as f:
+                    f.write("".join(f"{key}\n" for key in added_keys))
+            new_columns[POSE_COLUMN] = ("int", [key_index[key] for key in keys])
+
+            for name, (kind, values) in new_columns.items():
+                known_kind = schema["columns"].get(name)
+                if known_kind and known_kind != kind:
+                    # 同名列类型变化时按已有类型写入，无法转换的值记为缺失
+                    if known_kind == "float":
+                        values = [np.nan if value == CHECK_MISSING and kind == "check" else value for value in values]
+                    else:
+                        values = [MISSING[known_kind]] * len(values)
+                    kind = known_kind
+                self._append(name, kind, np.array(values, dtype=DTYPES[kind]), n_rows, new=known_kind is None)
+                schema["columns"][name] = kind
+
+            # 本次CSV中没有的列补缺失值
+            for name, kind in schema["columns"].items():
+                if name not in new_columns:
+                    self._append(name, kind, np.full(len(rows), MISSING[kind], dtype=DTYPES[kind]), n_rows)
+
+            schema["n_rows"] = n_rows + len(rows)
+            temp_path = self.root / "schema.json.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(schema, f, ensure_ascii=False)
+            os.replace(temp_path, self.root / "schema.json")
+        return len(rows)
+
+    def _append(self, name, kind, values, n_rows, new=False):
+        path = self.root / _column_filename(name)
+        with open(path, "r+b" if path.exists() else "w+b") as f:
+            # 截断到有效行数，丢弃上次中断时写了一半的数据
+            f.truncate(0 if new else n_rows * values.itemsize)
+            f.seek(0, os.SEEK_END)
+            if new and n_rows:
+                f.write(np.full(n_rows, MISSING[kind], dtype=DTYPES[kind]).tobytes())
+            f.write(values.tobytes())
+
+    def latest_rows(self) -> np.ndarray:
+        """每个构象最近一次追加的行号"""
+        pose_ids = np.asarray(self.column(POSE_COLUMN))
+        reversed_ids = pose_ids[::-1]
+        _, first = np.unique(reversed_ids, return_index=True)
+        return np.sort(len(pose_ids) - 1 - first)
+
+    def query(self, energy_below: float = None, checks=None, latest_only: bool = True) -> np.ndarray:
+        """向量化查询满足条件的行号
+
+        Args:
+            energy_below: 结合能阈值（可选），只保留结合能小于该值的行
+            checks: 需要全部通过的检查项列表（可选，默认为全部检查项）。某行缺失的检查项（该次CSV中没有这一列）不算未通过
+            latest_only: 每个构象只看最近一次评估（默认为True）
+        """
+        rows = self.latest_rows() if latest_only else np.arange(len(self))
+        mask = np.ones(len(rows), dtype=bool)
+        for name in (self.check_columns() if checks is None else checks):
+            mask &= np.asarray(self.column(name))[rows] != 0
+        if energy_below is not None:
+            mask &= np.asarray(self.column(ENERGY_COLUMN))[rows] < energy_below
+        return rows[mask]
+
+    def passing_poses(self, energy_below: float = None, checks=None) -> list:
+        """返回通过全部检查项（且结合能小于阈值）的构象键及其结合能"""
+        rows = self.query(energy_below, checks)
+        keys = self.pose_keys()
+        pose_ids = np.asarray(self.column(POSE_COLUMN))[rows]
+        energies = np.asarray(self.column(ENERGY_COLUMN))[rows]
+        return [
+            {"pose": keys[pose_id], "energy": None if np.isnan(energy) else round(float(energy), 3)}
+            for pose_id, energy in zip(pose_ids.tolist(), energies.tolist())
+        ]
+
+def csv_checks_pass(csv_path):
+    """posebusters结果CSV中的检查项是否全部通过：全部通过为True，有未通过项为False，CSV中没有检查项时为None"""
+    with open(csv_path, "r", newline="") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        return None
+    names = [name for name in rows[0].keys()
+             if name and name.strip().lower() not in KEY_COLUMN_NAMES + ENERGY_COLUMN_NAMES]
+    checks = [name for name in names if _infer_type([row[name] or "" for row in rows]) == "check"]
+    if not checks:
+        return None
+    return all(_parse_check(row[name] or "") != 0 for row in rows for name in checks)
+
+def append_evaluation_csv(csv_path, pose_key: str = None, energy: float = None):
+    """把保存到本地的posebusters结果CSV追加到列式存储，失败时只打印提示
+
+    Returns:
+        追加的行数，失败时返回None
+    """
+    try:
+        n_rows = EvalColumnStore().append_csv(csv_path, pose_key=pose_key, energy=energy)
+        print(f"评估结果已追加到列式存储: {n_rows} 行")
+        return n_rows
+    except Exception as e:
+        print(f"评估结果追加到列式存储失败: {str(e)}")
+        return None
@@ -0,0 +1,160 @@
+"""构象几何预检：在本地剔除明显不合理的对接构象，避免为它们发起远程posebusters评估
+
+受体重原子按均匀网格建立空间索引，索引按受体文件内容的sha256缓存（进程内+磁盘）。
+所有构象的原子拼接后一次性查询网格，完成碰撞和口袋包埋检查；配体内部的键长检查按构象矩阵计算。
+"""
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from pose_analysis import load_pose_coordinates
+
+GEOMETRY_CACHE_DIR = Path(os.getenv("MOL_GEOMETRY_CACHE_DIR", "/home/zhangfn/workflow/geometry_cache"))
+
+DEFAULT_GEOMETRY_RULES = {
+    "clash_distance": 2.0,      # 配体与受体重原子间距小于该值视为碰撞（埃）
+    "max_clashes": 0,           # 允许的碰撞原子数
+    "min_bond_length": 1.0,     # 配体内部两个重原子间距的下限
+    "max_bond_length": 2.3,     # 每个重原子到最近邻重原子距离的上限（超过视为断键）
+    "contact_distance": 5.0,    # 到受体重原子距离小于该值的配体原子视为位于口袋内
+    "min_buried_fraction": 0.5, # 位于口袋内的配体原子比例下限
+}
+
+# 27个相邻网格（含自身）的偏移
+_NEIGHBOR_OFFSETS = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)])
+
+def load_receptor_atoms(pdb_path: str) -> np.ndarray:
+    """读取PDB文件中的受体重原子坐标（忽略氢原子和水分子），返回(N, 3)数组"""
+    coords = []
+    with open(pdb_path, "r") as f:
+        for line in f:
+            if not line.startswith(("ATOM", "HETATM")) or line[17:20] == "HOH":
+                continue
+            element = line[76:78].strip() or line[12:14].strip().lstrip("0123456789")
+            if element.upper() in ("H", "D"):
+                continue
+            coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    return np.array(coords, dtype=np.float64).reshape(-1, 3)
+
+class ReceptorGrid:
+    """受体重原子的均匀网格索引，网格边长不小于最大查询半径，因此只需检查相邻的27个网格"""
+
+    def __init__(self, coords: np.ndarray, cell_size: float):
+        self.cell_size = float(cell_size)
+        self.origin = coords.min(axis=0) - self.cell_size if len(coords) else np.zeros(3)
+        cells = self._cells(coords)
+        self.shape = cells.max(axis=0) + 2 if len(coords) else np.ones(3, dtype=np.int64)
+        keys = self._keys(cells)
+        order = np.argsort(keys, kind="stable")
+        self.coords = coords[order]
+        self.keys = keys[order]
+
+    @classmethod
+    def from_arrays(cls, coords, keys, origin, shape, cell_size):
+        grid = cls.__new__(cls)
+        grid.coords, grid.keys, grid.origin, grid.shape = coords, keys, origin, shape
+        grid.cell_size = float(cell_size)
+        return grid
+
+    def _cells(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def nearest_distances(self, points: np.ndarray) -> np.ndarray:
+        """返回每个查询点到受体重原子的最近距离；网格半径（cell_size）以外没有原子时为inf"""
+        nearest = np.full(len(points), np.inf)
+        if len(points) == 0 or len(self.coords) == 0:
+            return nearest
+        cells = self._cells(points)
+        for offset in _NEIGHBOR_OFFSETS:
+            neighbor = cells + offset
+            valid = ((neighbor >= 0) & (neighbor < self.shape)).all(axis=1)
+            keys = self._keys(neighbor[valid])
+            starts = np.searchsorted(self.keys, keys, side="left")
+            ends = np.searchsorted(self.keys, keys, side="right")
+            counts = ends - starts
+            if not counts.any():
+                continue
+            # 展开为(查询点, 受体原子)对，一次性计算距离
+            query = np.repeat(np.flatnonzero(valid), counts)
+            atom = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            dist = np.linalg.norm(points[query] - self.coords[atom], axis=1)
+            np.minimum.at(nearest, query, dist)
+        return nearest
+
+_GRID_CACHE = {}
+
+def get_receptor_grid(pdb_path: str, cell_size: float) -> ReceptorGrid:
+    """按受体文件内容哈希获取网格索引，优先使用进程内缓存，其次使用磁盘缓存"""
+    digest = hashlib.sha256(Path(pdb_path).read_bytes()).hexdigest()
+    cache_key = (digest, float(cell_size))
+    if cache_key in _GRID_CACHE:
+        return _GRID_CACHE[cache_key]
+
+    cache_file = GEOMETRY_CACHE_DIR / f"{digest}_{cell_size:g}.npz"
+    if cache_file.exists():
+        data = np.load(cache_file)
+        grid = ReceptorGrid.from_arrays(data["coords"], data["keys"], data["origin"], data["shape"], cell_size)
+    else:
+        grid = ReceptorGrid(load_receptor_atoms(pdb_path), cell_size)
+        try:
+            GEOMETRY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            np.savez(cache_file, coords=grid.coords, keys=grid.keys, origin=grid.origin, shape=grid.shape)
+        except OSError as e:
+            print(f"写入受体网格缓存失败: {e}")
+    _GRID_CACHE[cache_key] = grid
+    return grid
+
+def _ligand_geometry(coords: np.ndarray):
+    """返回配体内部最短的重原子间距和最大的最近邻距离"""
+    if len(coords) < 2:
+        return np.inf, 0.0
+    dist = np.linalg.norm(coords[:, None, :] - coords[None, :, :], axis=2)
+    np.fill_diagonal(dist, np.inf)
+    nearest = dist.min(axis=1)
+    return float(nearest.min()), float(nearest.max())
+
+def check_pose_geometry(pose_files, receptor_pdb: str, rules: dict = None) -> dict:
+    """对一批对接构象做本地几何检查
+
+    Returns:
+        dict: {构象文件: {"pass": 是否通过, "failed": 未通过的检查项列表, 以及各项指标}}
+    """
+    rules = {**DEFAULT_GEOMETRY_RULES, **(rules or {})}
+    cell_size = max(rules["clash_distance"], rules["contact_distance"])
+    grid = get_receptor_grid(receptor_pdb, cell_size)
+
+    poses = [load_pose_coordinates(path) for path in pose_files]
+    sizes = np.array([len(coords) for coords in poses])
+    pose_ids = np.repeat(np.arange(len(poses)), sizes)
+    all_points = np.concatenate(poses) if len(poses) else np.zeros((0, 3))
+
+    nearest = grid.nearest_distances(all_points)
+    clashes = np.bincount(pose_ids, weights=nearest < rules["clash_distance"], minlength=len(poses)).astype(int)
+    buried = np.bincount(pose_ids, weights=nearest < rules["contact_distance"], minlength=len(poses))
+    buried_fraction = buried / np.maximum(sizes, 1)
+
+    report = {}
+    for idx, path in enumerate(pose_files):
+        min_distance, max_nearest = _ligand_geometry(poses[idx])
+        failed = []
+        if sizes[idx] == 0:
+            failed.append("no_atoms")
+        if clashes[idx] > rules["max_clashes"]:
+            failed.append("clash")
+        if min_distance < rules["min_bond_length"] or max_nearest > rules["max_bond_length"]:
+            failed.append("bond_length")
+        if buried_fraction[idx] < rules["min_buried_fraction"]:
+            failed.append("outside_pocket")
+        report[path] = {
+            "pass": not failed,
+            "failed": failed,
+            "clash_atoms": int(clashes[idx]),
+            "buried_fraction": round(float(buried_fraction[idx]), 3),
+            "min_intra_distance": round(min_distance, 3) if np.isfinite(min_distance) else None,
+        }
+    return report
@@ -0,0 +1,276 @@
+"""工作流入口共用的MCP服务器启动逻辑：并行连接、按需（首次调用工具时）启动，以及工具列表的磁盘缓存
+
+MCPServerStdio的连接和清理必须在同一个任务中完成，因此每个服务器由一个独立的后台任务持有：
+任务内连接服务器后等待关闭信号，再在同一个任务中清理。多个服务器可以同时启动，互不等待。
+按需启动时，工具列表从上一次运行缓存的JSON文件中读取，构建智能体时不需要启动任何服务器进程；
+服务器首次被调用时才启动，并刷新缓存。
+对应端口上已有常驻服务器（python mol_xxx_server.py --transport sse）时直接通过SSE连接，不再启动stdio子进程。
+MOL_TOOL_TRANSPORT=inprocess时不经过MCP协议，直接在本进程中导入服务器模块并调用同一套工具函数。
+长时间运行的工具（生成、对接、评估）执行期间发送的阶段性结果交给on_progress处理，默认在终端打印进度。
+"""
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from agents.mcp import MCPServer, MCPServerStdio, MCPServerSse
+from mcp import ClientSession, Tool as MCPTool
+from mcp.types import CallToolResult, TextContent
+
+from server_cli import daemon_running, daemon_url, server_name
+from progress import progress_logging_callback
+
+# 各MCP服务器的启动配置：(名称, 服务器脚本)
+MCP_SERVER_SPECS = [
+    ("molecular_generation_server", "mol_generation_server.py"),
+    ("molecular_docking_server", "mol_docking_server.py"),
+    ("molecular_eval_server", "mol_eval_server.py"),
+    ("molecular_download_server", "mol_download_server.py"),
+    ("molecular_reflection_server", "mol_reflection_server.py"),
+]
+# 设置为N(>0)时改为启动N个合并服务器进程(mol_all_server.py)，各自提供一部分服务器的工具；1表示全部工具在同一个进程中
+MCP_SHARDS = int(os.getenv("MOL_MCP_SHARDS", "0"))
+# 设置为1时服务器在首次调用其工具时才启动
+MCP_LAZY = os.getenv("MOL_MCP_LAZY", "0") == "1"
+# 设置为0时不连接常驻服务器，总是启动新的stdio子进程
+MCP_ATTACH = os.getenv("MOL_MCP_ATTACH", "1") == "1"
+# 工具调用方式：mcp（默认，经MCP服务器进程）或inprocess（本进程内直接调用）
+TOOL_TRANSPORT = os.getenv("MOL_TOOL_TRANSPORT", "mcp")
+MCP_TOOLS_CACHE_DIR = Path(os.getenv("MOL_MCP_TOOLS_CACHE_DIR", "/home/zhangfn/workflow/mcp_tools_cache"))
+SERVER_DIR = Path(__file__).resolve().parent
+
+def mcp_server_specs(shards: int = MCP_SHARDS) -> list:
+    """返回需要启动的MCP服务器配置: [(名称, 服务器脚本, 额外启动参数, 分片序号)]"""
+    if shards <= 0:
+        return [(name, script, [], 0) for name, script in MCP_SERVER_SPECS]
+    return [
+        (f"molecular_all_server_{shard}", "mol_all_server.py", ["--shard", str(shard), "--shards", str(shards)], shard)
+        for shard in range(shards)
+    ]
+
+def source_fingerprint(args) -> str:
+    """由启动参数和服务器目录中全部.py文件的修改时间、大小计算缓存指纹，代码变化后缓存自动失效"""
+    digest = hashlib.sha256(json.dumps(args).encode())
+    for path in sorted(SERVER_DIR.glob("*.py")):
+        stat = path.stat()
+        digest.update(f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    return digest.hexdigest()
+
+class ManagedMCPServer(MCPServer):
+    """由独立后台任务持有的MCP服务器，支持并行连接和按需启动"""
+
+    def __init__(self, server: MCPServer, args=None, lazy: bool = False, cache_dir: Path = MCP_TOOLS_CACHE_DIR,
+                 on_progress=None, expected_name: str = None, fallback=None):
+        """
+        Args:
+            expected_name: 服务器初始化时应返回的名称(serverInfo.name)，不一致时不使用该服务器（可选）
+            fallback: 名称不一致时调用，返回替代的服务器（如stdio子进程），为空时连接失败
+        """
+        self.server = server
+        self.lazy = lazy
+        self.on_progress = on_progress
+        self.expected_name = expected_name
+        self.fallback = fallback
+        self.cache_path = Path(cache_dir) / f"{server.name}.json"
+        self.fingerprint = source_fingerprint(args or [])
+        self._task = None
+        self._ready = None
+        self._closing = None
+        self._tools = None
+
+    @property
+    def name(self) -> str:
+        return self.server.name
+
+    @property
+    def connected(self) -> bool:
+        ready = self._ready
+        return ready is not None and ready.done() and not ready.cancelled() and ready.exception() is None
+
+    async def _hold(self):
+        """连接服务器并保持，收到关闭信号后在同一个任务中清理"""
+        try:
+            server_name = await self._connect_session()
+            if self.expected_name and server_name is not None and server_name != self.expected_name:
+                # 端口上的常驻服务器不是预期的服务器或分片布局不同，继续使用会缺少部分工具
+                message = f"{self.name} 连接到的服务器是 {server_name}，不是预期的 {self.expected_name}"
+                if self.fallback is None:
+                    raise RuntimeError(message)
+                print(f"\033[93m{message}，改为启动stdio子进程\033[0m")
+                await self.server.cleanup()
+                self.server = self.fallback()
+                await self._connect_session()
+            self._tools = await self.server.list_tools()
+            self._save_cached_tools(self._tools)
+            self._ready.set_result(True)
+            await self._closing.wait()
+        except Exception as e:
+            # 连接失败时允许下一次调用重新启动
+            self._task = None
+            if not self._ready.done():
+                self._ready.set_exception(e)
+        except BaseException:
+            if not self._ready.done():
+                self._ready.cancel()
+            raise
+        finally:
+            await self.server.cleanup()
+
+    async def _connect_session(self):
+        """按agents的连接流程建立会话，创建ClientSession时传入logging_callback以接收工具的阶段性结果
+
+        agents的connect()创建ClientSession时不接受logging_callback；
+        服务器对象不提供create_streams/exit_stack（agents版本变化）时退回connect()，不接收阶段性结果
+
+        Returns:
+            服务器初始化时返回的名称，退回connect()时无法获取，返回None
+        """
+        server = self.server
+        if not (hasattr(server, "create_streams") and hasattr(server, "exit_stack")):
+            print(f"\033[93m{self.name} 不支持自定义会话，不接收工具的阶段性结果\033[0m")
+            await server.connect()
+            return None
+        read, write = await server.exit_stack.enter_async_context(server.create_streams())
+        session = await server.exit_stack.enter_async_context(
+            ClientSession(read, write, logging_callback=progress_logging_callback(self.name, self.on_progress)))
+        result = await session.initialize()
+        server.session = session
+        return result.serverInfo.name
+
+    async def connect(self):
+        """启动服务器（只启动一次），等待初始化完成"""
+        if self._task is None:
+            self._ready = asyncio.get_running_loop().create_future()
+            self._closing = asyncio.Event()
+            self._task = asyncio.create_task(self._hold(), name=f"mcp:{self.name}")
+        await asyncio.shield(self._ready)
+
+    async def cleanup(self):
+        if self._task is None:
+            return
+        self._closing.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def _load_cached_tools(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                cached = json.load(f)
+            if cached.get("fingerprint") != self.fingerprint:
+                return None
+            return [MCPTool.model_validate(tool) for tool in cached["tools"]]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_cached_tools(self, tools):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.cache_path.with_suffix(".json.tmp")
+            with open(temp_path, "w") as f:
+                json.dump({"fingerprint": self.fingerprint, "tools": [tool.model_dump(mode="json") for tool in tools]},
+                          f, ensure_ascii=False)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"保存工具列表缓存失败 {self.cache_path}: {str(e)}")
+
+    async def list_tools(self) -> list:
+        if self._tools is not None:
+            return self._tools
+        if self.lazy and not self.connected:
+            cached = self._load_cached_tools()
+            if cached is not None:
+                self._tools = cached
+                return cached
+        await self.connect()
+        return self._tools
+
+    async def call_tool(self, tool_name: str, arguments):
+        if not self.connected:
+            print(f"\033[93m正在启动 {self.name} ...\033[0m")
+        await self.connect()
+        return await self.server.call_tool(tool_name, arguments)
+
+class InProcessMCPServer(MCPServer):
+    """在本进程中直接调用服务器模块中FastMCP实例的工具，对智能体而言与MCP服务器完全相同
+
+    工具列表和参数结构来自同一个FastMCP实例，返回结果也转换为相同的CallToolResult，
+    只是省去了子进程、stdio管道和JSON-RPC序列化。同步工具在线程中执行，不阻塞事件循环。
+    只覆盖mol_xxx_server.py中的工具；agent_workflow_noMCP.py和agent_workflow_single_agent.py
+    仍使用各自直接请求后端的工具实现，不经过这里。
+    """
+
+    def __init__(self, name: str, module_name: str):
+        self._name = name
+        self.module_name = module_name
+        self.mcp = None
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    async def connect(self):
+        if self.mcp is None:
+            # 服务器模块导入时会以DEBUG级别配置根日志，先配置好根日志使其不生效
+            if not logging.getLogger().handlers:
+                logging.basicConfig(level=logging.WARNING)
+            self.mcp = importlib.import_module(self.module_name).mcp
+
+    async def cleanup(self):
+        pass
+
+    async def list_tools(self) -> list:
+        await self.connect()
+        return await self.mcp.list_tools()
+
+    async def call_tool(self, tool_name: str, arguments):
+        await self.connect()
+        tool = self.mcp._tool_manager.get_tool(tool_name)
+        try:
+            if tool is not None and not tool.is_async:
+                content = await asyncio.to_thread(asyncio.run, self.mcp.call_tool(tool_name, arguments or {}))
+            else:
+                content = await self.mcp.call_tool(tool_name, arguments or {})
+        except Exception as e:
+            # 与MCP服务器一致：工具出错时返回isError结果，而不是抛出异常
+            return CallToolResult(content=[TextContent(type="text", text=str(e))], isError=True)
+        return CallToolResult(content=list(content), isError=False)
+
+def create_mcp_servers(lazy: bool = MCP_LAZY, shards: int = MCP_SHARDS, attach: bool = MCP_ATTACH,
+                       transport: str = TOOL_TRANSPORT, on_progress=None) -> list:
+    """按配置创建MCP服务器（尚未连接），已有常驻服务器时通过SSE连接；transport为"inprocess"时在本进程中调用工具
+
+    on_progress(server_name, data)处理工具执行期间的阶段性结果，默认打印进度；本进程内调用时不发送阶段性结果
+    """
+    if transport == "inprocess":
+        return [InProcessMCPServer(name, os.path.splitext(script)[0]) for name, script in MCP_SERVER_SPECS]
+    if transport != "mcp":
+        raise ValueError(f"工具调用方式错误，必须是'mcp'或'inprocess': {transport}")
+    servers = []
+    for name, script, extra_args, shard in mcp_server_specs(shards):
+        args = ["run", script, *extra_args]
+
+        def stdio_server(name=name, args=args):
+            return MCPServerStdio(name=name, cache_tools_list=True, params={"command": "uv", "args": args})
+
+        if attach and daemon_running(script, shard):
+            url = daemon_url(script, shard)
+            print(f"连接常驻服务器 {name}: {url}")
+            # 端口上的进程可能是其他服务器或按不同分片数启动的，连接后按服务器名称确认，不一致时改用stdio
+            server = ManagedMCPServer(MCPServerSse(name=name, cache_tools_list=True, params={"url": url}),
+                                      args=args, lazy=lazy, on_progress=on_progress,
+                                      expected_name=server_name(script, shard, shards), fallback=stdio_server)
+        else:
+            server = ManagedMCPServer(stdio_server(), args=args, lazy=lazy, on_progress=on_progress)
+        servers.append(server)
+    return servers
+
+async def start_mcp_servers(servers) -> list:
+    """并行连接全部服务器；按需启动的服务器只在没有工具列表缓存时才启动"""
+    await asyncio.gather(*(server.list_tools() if getattr(server, "lazy", False) else server.connect() for server in servers))
+    return servers
+
+async def stop_mcp_servers(servers):
+    await asyncio.gather(*(server.cleanup() for server in servers), return_exceptions=True)
@@ -0,0 +1,58 @@
+"""合并的分子设计MCP服务器：在一个进程中提供生成、对接、评估、下载、反馈五个服务器的全部工具
+
+工具和资源直接取自各服务器模块的FastMCP实例，名称、说明和参数结构与单独启动时完全一致。
+可以按服务器模块分片到多个进程：第i个分片（共N个）只导入并提供序号对N取余等于i的模块的工具。
+
+用法: python mol_all_server.py [--shard i --shards N] [--transport sse [--port 8110]]
+"""
+import importlib
+from mcp.server.fastmcp import FastMCP
+
+from server_cli import server_arg_parser, run_server, server_name
+
+import logging
+logging.basicConfig(level=logging.DEBUG)
+logging.debug("合并的分子设计服务器启动中...")
+
+# 按固定顺序排列的服务器模块，分片时按序号分配
+SERVER_MODULES = [
+    "mol_generation_server",
+    "mol_docking_server",
+    "mol_eval_server",
+    "mol_download_server",
+    "mol_reflection_server",
+]
+
+def shard_modules(shard: int = 0, shards: int = 1) -> list:
+    """返回第shard个分片负责的服务器模块名"""
+    if shards < 1 or not 0 <= shard < shards:
+        raise ValueError(f"分片参数错误: shard={shard}, shards={shards}")
+    return [name for idx, name in enumerate(SERVER_MODULES) if idx % shards == shard]
+
+def build_server(modules=None, name: str = "MoleculeAllServer") -> FastMCP:
+    """导入指定的服务器模块，把它们的工具和资源注册到一个新的FastMCP实例中"""
+    server = FastMCP(name)
+    for module_name in (SERVER_MODULES if modules is None else modules):
+        module = importlib.import_module(module_name)
+        for tool in module.mcp._tool_manager.list_tools():
+            server.add_tool(tool.fn, name=tool.name, description=tool.description)
+        for resource in module.mcp._resource_manager.list_resources():
+            server.add_resource(resource)
+        for template in module.mcp._resource_manager.list_templates():
+            server.resource(template.uri_template, name=template.name, description=template.description,
+                            mime_type=template.mime_type)(template.fn)
+    return server
+
+def main():
+    parser = server_arg_parser("合并的分子设计MCP服务器")
+    parser.add_argument("--shard", type=int, default=0, help="当前分片序号（从0开始）")
+    parser.add_argument("--shards", type=int, default=1, help="分片总数")
+    args = parser.parse_args()
+
+    modules = shard_modules(args.shard, args.shards)
+    mcp = build_server(modules, name=server_name("mol_all_server.py", args.shard, args.shards))
+    run_server(mcp, "mol_all_server.py", f"合并的分子设计服务器（分片 {args.shard}/{args.shards}，模块: {modules}）",
+               args=args, shard=args.shard)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,22 @@
 import json
 import os
-import requests
+import itertools
+import tempfile
 from typing import Dict, Any
 from mcp.server.fastmcp import FastMCP
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import backend_client
+from pdbqt_utils import parse_binding_energy, parse_result_filename, FUNNEL_PRESCREEN_MODE, FUNNEL_REFINE_MODE, FUNNEL_REFINE_SUFFIX
+from sdf_utils import iter_sdf_records, iter_sdf_chunks
+from dedup import SeenSet, docking_scope, filter_novel_molecules
+from prefilter import prefilter_sdf
+from pocket import crop_pocket
+import results_store
+from dir_index import get_index
+from workspace import get_workspace
+from server_cli import run_server
+from progress import with_progress
 
 import logging
 logging.basicConfig(level=logging.DEBUG)
@@ -14,35 +28,307 @@ mcp = FastMCP("MoleculeDockingServer")
 DEFAULT_LIGAND_DIR = "/home/zhangfn/workflow/downloads"
 DEFAULT_PROTEIN_DIR = "/home/zhangfn/workflow/uploads"
 
+# 漏斗模式默认进入精细对接的分子比例
+FUNNEL_DEFAULT_TOP_FRACTION = 0.2
+
+# 多分子SDF按块拆分后并发对接
+DOCKING_CHUNK_SIZE = int(os.getenv("MOL_DOCK_CHUNK_SIZE", "10"))
+DOCKING_MAX_WORKERS = int(os.getenv("MOL_DOCK_MAX_WORKERS", "4"))
+
 def find_first_file_with_ext(directory: str, extension: str) -> str:
-    """在目录中找到第一个指定扩展名的文件"""
-    for file in os.listdir(directory):
-        if file.endswith(extension):
-            return os.path.join(directory, file)
+    """在目录中找到第一个指定扩展名的文件（按缓存的目录索引排序）"""
+    path = get_index(directory).first(extension)
+    if path:
+        return path
     raise FileNotFoundError(f"{directory} 中没有找到以 {extension} 结尾的文件")
 
+def post_docking(ligand_name, ligand_content, protein_name, protein_content, dock_mode):
+    """调用后端分子对接API，共享文件系统模式下配体和受体只传路径"""
+    files = {}
+    data = {
+        'dock_mode': dock_mode
+    }
+    backend_client.attach_file(files, data, 'ligand_sdf', ligand_name, content=ligand_content)
+    backend_client.attach_file(files, data, 'protein_pdb', protein_name, content=protein_content)
+    return backend_client.post(
+        "/api/molecular_docking",
+        files=files,
+        data=data,
+        timeout=600  # 根据计算时长调整，分子对接可能需要更长时间
+    )
+
+def extract_result_files(result):
+    """从API响应中提取结果文件列表"""
+    result_files = result.get('result_files', [])
+
+    # 如果API未返回文件列表，则从结果中提取
+    if not result_files and 'download_urls' in result:
+        result_files = [os.path.basename(url) for url in result['download_urls']]
+    return result_files
+
+def read_result_file(result_file):
+    """读取对接结果文件内容，优先读取本地共享目录，不存在时从后端下载"""
+    local_path = os.path.join(DEFAULT_LIGAND_DIR, result_file)
+    if os.path.exists(local_path):
+        with open(local_path, 'r') as f:
+            return f.read()
+    content = backend_client.read_output(f"/api/download/molecular_docking/{result_file}")
+    return content.decode() if content is not None else None
+
+def dock_chunk(chunk_index, offset, records, ligand_name, protein_name, protein_content, dock_mode, progress=None):
+    """对接一个配体分块，并将结果文件按全局配体序号重命名为<pdb>_ligand_<i>_<pose>.pdbqt
+
+    progress不为空时，分块完成后汇报该分块中每个构象的结合能
+    """
+    stem, ext = os.path.splitext(protein_name)
+    # 每个分块使用独立的受体文件名，避免并发分块在后端互相覆盖结果文件
+    chunk_protein_name = f"{stem}_chunk{chunk_index}{ext}"
+    chunk_ligand_name = f"{os.path.splitext(ligand_name)[0]}_chunk{chunk_index}.sdf"
+    chunk = {"chunk": chunk_index, "offset": offset, "n_ligands": len(records)}
+
+    result_files = []
+    poses = []
+    try:
+        response = post_docking(chunk_ligand_name, "".join(records).encode(), chunk_protein_name, protein_content, dock_mode)
+        if response.status_code != 200:
+            chunk.update({"status": "error", "message": f"API返回错误: {response.status_code}", "response": response.text})
+            if progress:
+                progress.advance(message=f"{dock_mode}对接第 {chunk_index} 块失败", partial={**chunk, "dock_mode": dock_mode})
+            return chunk
+
+        for chunk_file in extract_result_files(response.json()):
+            ligand_index, pose = parse_result_filename(chunk_file)
+            content = read_result_file(chunk_file)
+            if ligand_index is None or content is None:
+                chunk.setdefault("failed_files", []).append(chunk_file)
+                continue
+            pose_suffix = f"_{pose}" if pose is not None else ""
+            result_file = f"{stem}_ligand_{offset + ligand_index}{pose_suffix}.pdbqt"
+            with open(os.path.join(DEFAULT_LIGAND_DIR, result_file), 'w') as f:
+                f.write(content)
+            chunk_path = os.path.join(DEFAULT_LIGAND_DIR, chunk_file)
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+            result_files.append(result_file)
+            poses.append({"file": os.path.join(DEFAULT_LIGAND_DIR, result_file), "ligand_index": offset + ligand_index,
+                          "pose": pose, "binding_energy": parse_binding_energy(content)})
+        status = "success" if "failed_files" not in chunk else "partial"
+    except Exception as e:
+        # 单个分块出错（超时、连接失败、结果解析或写入失败）不影响其他分块，已取回的结果文件仍然保留
+        chunk["message"] = f"API调用失败: {str(e)}"
+        status = "partial" if result_files else "error"
+
+    chunk.update({"status": status, "result_files": result_files})
+    if progress:
+        outcome = "失败" if status == "error" else "完成"
+        progress.advance(message=f"{dock_mode}对接第 {chunk_index} 块{outcome}（配体 {offset}-{offset + len(records) - 1}）",
+                         partial={"chunk": chunk_index, "dock_mode": dock_mode, "status": chunk["status"], "poses": poses})
+    return chunk
+
+def run_docking(ligand_path, ligand_name, protein_name, protein_content, dock_mode, chunk_size, progress=None):
+    """流式切分配体SDF并发对接，配体数不超过chunk_size时直接整体提交
+
+    progress不为空时每完成一个分块汇报一次进度和该分块的构象结合能
+
+    Returns:
+        与molecular_docking相同格式的结果字典
+    """
+    chunks = iter_sdf_chunks(ligand_path, chunk_size) if chunk_size > 0 else iter([])
+    first_chunk = next(chunks, None)
+    second_chunk = next(chunks, None)
+
+    if second_chunk is None:
+        with open(ligand_path, 'rb') as ligand_file:
+            ligand_content = ligand_file.read()
+        print(f"正在调用分子对接API，模式: {dock_mode}...")
+        response = post_docking(ligand_name, ligand_content, protein_name, protein_content, dock_mode)
+        print(f"API响应: {response.text}")
+        if response.status_code != 200:
+            return {
+                "status": "error",
+                "message": f"API返回错误: {response.status_code}",
+                "response": response.text
+            }
+        result = response.json()
+        result_files = extract_result_files(result)
+        if progress:
+            progress.advance(message=f"{dock_mode}对接完成",
+                             partial={"dock_mode": dock_mode, "status": "success", "result_files": result_files})
+        return {
+            "status": "success",
+            "message": f"分子对接计算完成 ({dock_mode}模式)",
+            "result": result,
+            "result_files": result_files
+        }
+
+    print(f"正在分块并发调用分子对接API，模式: {dock_mode}，每块 {chunk_size} 个配体...")
+    chunk_results = {}
+    with ThreadPoolExecutor(max_workers=DOCKING_MAX_WORKERS) as executor:
+        pending = set()
+        offset = 0
+        for chunk_index, records in enumerate(itertools.chain([first_chunk, second_chunk], chunks)):
+            # 限制排队中的分块数量，保证内存占用与文件大小无关
+            if len(pending) >= 2 * DOCKING_MAX_WORKERS:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = future.result()
+                    chunk_results[chunk["chunk"]] = chunk
+            pending.add(executor.submit(dock_chunk, chunk_index, offset, records, ligand_name,
+                                        protein_name, protein_content, dock_mode, progress))
+            offset += len(records)
+        for future in pending:
+            chunk = future.result()
+            chunk_results[chunk["chunk"]] = chunk
+
+    chunks = [chunk_results[idx] for idx in sorted(chunk_results)]
+    result_files = [f for chunk in chunks for f in chunk.get("result_files", [])]
+    failed = [chunk for chunk in chunks if chunk["status"] != "success"]
+    if len(failed) == len(chunks):
+        status = "error"
+    else:
+        status = "partial" if failed else "success"
+    return {
+        "status": status,
+        "message": f"分子对接计算完成 ({dock_mode}模式)，{offset} 个配体分为 {len(chunks)} 块，{len(chunks) - len(failed)} 块成功",
+        "result": {"chunks": chunks},
+        "result_files": result_files
+    }
+
+def best_scores_by_ligand(result_files):
+    """汇总每个配体所有构象中的最低结合能: {配体序号: (结合能, 结果文件)}"""
+    best = {}
+    for result_file in result_files:
+        ligand_index, _ = parse_result_filename(result_file)
+        if ligand_index is None:
+            continue
+        content = read_result_file(result_file)
+        energy = parse_binding_energy(content) if content else None
+        if energy is None:
+            continue
+        if ligand_index not in best or energy < best[ligand_index][0]:
+            best[ligand_index] = (energy, result_file)
+    return best
+
+def funnel_docking(ligand_path, ligand_name, protein_path, protein_content, chunk_size, top_k=None, top_fraction=None,
+                   protein_name=None, progress=None):
+    """多精度对接漏斗：vina粗筛全部分子，按结合能排序后仅对前top_k（或前top_fraction比例）的分子进行adgpu精细对接"""
+    protein_name = protein_name or os.path.basename(protein_path)
+
+    # 第1层：vina粗筛
+    print(f"漏斗对接第1层: {FUNNEL_PRESCREEN_MODE} 粗筛全部分子...")
+    prescreen = run_docking(ligand_path, ligand_name, protein_name, protein_content, FUNNEL_PRESCREEN_MODE, chunk_size, progress)
+    if prescreen["status"] == "error":
+        return {"status": "error", "message": f"粗筛对接失败: {prescreen['message']}", "prescreen": prescreen}
+    prescreen_files = prescreen["result_files"]
+    prescreen_scores = best_scores_by_ligand(prescreen_files)
+    if not prescreen_scores:
+        return {"status": "error", "message": "粗筛对接结果中未解析到结合能", "result_files": prescreen_files}
+
+    ranked = sorted(prescreen_scores, key=lambda idx: prescreen_scores[idx][0])
+    if top_k is None:
+        top_k = max(1, int(round(len(ranked) * (top_fraction or FUNNEL_DEFAULT_TOP_FRACTION))))
+    selected_set = set(ranked[:int(top_k)])
+
+    # 第2层：adgpu精细对接，受体使用独立文件名以免覆盖粗筛结果
+    selected = []
+    stem, ext = os.path.splitext(protein_name)
+    with tempfile.NamedTemporaryFile('w', suffix='.sdf', delete=False) as subset_file:
+        for idx, record in enumerate(iter_sdf_records(ligand_path)):
+            if idx in selected_set:
+                subset_file.write(record)
+                selected.append(idx)
+    print(f"漏斗对接第2层: {FUNNEL_REFINE_MODE} 精细对接 {len(selected)}/{len(ranked)} 个分子...")
+    try:
+        refine = run_docking(subset_file.name, ligand_name, f"{stem}{FUNNEL_REFINE_SUFFIX}{ext}", protein_content, FUNNEL_REFINE_MODE, chunk_size, progress)
+    finally:
+        os.remove(subset_file.name)
+    refine_files = refine.get("result_files", [])
+    # 精细对接结果中的配体序号对应子集中的位置，映射回原始序号
+    refine_scores = {selected[idx]: score for idx, score in best_scores_by_ligand(refine_files).items() if idx < len(selected)}
+
+    ranking = []
+    for ligand_index in ranked:
+        if ligand_index in refine_scores:
+            tier, (score, result_file) = FUNNEL_REFINE_MODE, refine_scores[ligand_index]
+        else:
+            tier, (score, result_file) = FUNNEL_PRESCREEN_MODE, prescreen_scores[ligand_index]
+        ranking.append({
+            "ligand_index": ligand_index,
+            "tier": tier,
+            "binding_energy": score,
+            "prescreen_energy": prescreen_scores[ligand_index][0],
+            "best_pose_file": result_file
+        })
+    # 精细对接的分子排在前面，各层内部按结合能排序
+    ranking.sort(key=lambda item: (item["tier"] != FUNNEL_REFINE_MODE, item["binding_energy"]))
+    for rank, item in enumerate(ranking):
+        item["rank"] = rank + 1
+
+    result = {
+        "status": "success" if refine["status"] == "success" else "partial",
+        "message": f"漏斗对接完成: {len(ranked)} 个分子经{FUNNEL_PRESCREEN_MODE}粗筛，{len(refine_scores)} 个分子经{FUNNEL_REFINE_MODE}精细对接",
+        "ranking": ranking,
+        "result_files": prescreen_files + refine_files
+    }
+    if refine["status"] != "success":
+        result["refine_error"] = refine["message"]
+    return result
+
+def collect_run_results(result, workspace):
+    """把后端写入共享目录的结果文件移入运行目录，并把结果中的文件名替换为去掉运行标记后的名称"""
+    collected = []
+    for result_file in result['result_files']:
+        local_path = workspace.collect_output(result_file, lambda: read_result_file(result_file))
+        if local_path is None:
+            result.setdefault("failed_files", []).append(result_file)
+            continue
+        collected.append(local_path.name)
+    result['result_files'] = collected
+    for item in result.get('ranking', []):
+        item['best_pose_file'] = workspace.untag(item['best_pose_file'])
+
 @mcp.tool()
-def molecular_docking(ligand_sdf=None, protein_pdb=None, dock_mode="adgpu"):
+@with_progress
+def molecular_docking(ligand_sdf=None, protein_pdb=None, dock_mode="adgpu", funnel_top_k=None, funnel_top_fraction=None, chunk_size=None, dedup=False, prefilter=False, prefilter_rules=None, pocket_radius=None, pocket_ref="A:330", run_id=None, progress=None):
     """执行分子对接计算
     
     Args:
         ligand_sdf: 配体文件绝对路径（必须为.sdf格式）
         protein_pdb: 受体文件绝对路径（必须为.pdb格式）
-        dock_mode: 对接模式，可选值为"adgpu"或"vina"
+        dock_mode: 对接模式，可选值为"adgpu"、"vina"或"funnel"（先vina粗筛全部分子，再对排名靠前的分子进行adgpu精细对接）
+        funnel_top_k: funnel模式下进入精细对接的分子数量（可选）
+        funnel_top_fraction: funnel模式下进入精细对接的分子比例（可选，默认为0.2，funnel_top_k优先）
+        chunk_size: 每个并发对接任务包含的配体数量（可选，默认为10，0表示不分块）
+        dedup: 是否跳过历史轮次中已经用同一受体、同一对接模式对接过的相同结构分子（可选，默认为False）。
+            开启时本次对接成功的分子也会被记录，供之后开启dedup的轮次跳过
+        prefilter: 是否在对接前按重原子数、分子量、片段数预筛选分子（可选，默认为False）
+        prefilter_rules: 预筛选规则（可选），如{"min_heavy_atoms": 8, "max_heavy_atoms": 70, "max_fragments": 1, "min_mol_weight": 120, "max_mol_weight": 700}
+        pocket_radius: 口袋裁剪半径（埃，可选）。设置后只上传pocket_ref周围该半径内的受体残基
+        pocket_ref: 口袋中心的参考配体，可以是残基标识（默认"A:330"）或SDF文件的绝对路径
+        run_id: 运行ID（可选）。设置后默认配体和受体只在该运行的工作目录中查找，对接结果也写入该目录
     
     Returns:
         包含状态和结果的字典: {"status": "success/failure", "result": 计算结果或错误信息, "result_files": 结果文件列表}
+        funnel模式额外返回"ranking"：按结合能排序的分子列表，"tier"字段标明该结合能来自哪一层对接
+        开启dedup/prefilter时额外返回"dedup"/"prefilter"统计，以及"kept_indices"：实际对接的分子在原文件中的序号
+        开启口袋裁剪时额外返回"pocket"：裁剪前后的原子数、残基数和文件大小
+        每完成一个对接分块，通过进度通知发送该分块中各构象的结合能
     """
+    try:
+        workspace = get_workspace(run_id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
     # 如果用户没有提供ligand_sdf和protein_pdb参数，使用默认值
     if not ligand_sdf:
         try:
-            ligand_sdf = find_first_file_with_ext(DEFAULT_LIGAND_DIR, '.sdf')
+            ligand_sdf = find_first_file_with_ext(str(workspace.downloads), '.sdf')
             print(f"使用ligand_sdf: {ligand_sdf}")
         except Exception as e:
             return {"status": "error", "message": f"未提供配体SDF文件，且默认路径中未找到合适文件：{str(e)}"}
     if not protein_pdb:
         try:
-            protein_pdb = find_first_file_with_ext(DEFAULT_PROTEIN_DIR, '.pdb')
+            protein_pdb = find_first_file_with_ext(str(workspace.uploads), '.pdb')
             print(f"使用protein_pdb: {protein_pdb}")
         except Exception as e:
             return {"status": "error", "message": f"未提供受体PDB文件，且默认路径中未找到合适文件：{str(e)}"}
@@ -85,62 +371,99 @@ def molecular_docking(ligand_sdf=None, protein_pdb=None, dock_mode="adgpu"):
         return {"status": "error", "message": f"受体文件格式错误，必须是.pdb格式: {protein_path}"}
     
     # 对接模式检查
-    if dock_mode not in ['adgpu', 'vina']:
-        return {"status": "error", "message": f"对接模式错误，必须是'adgpu'或'vina': {dock_mode}"}
+    if dock_mode not in ['adgpu', 'vina', 'funnel']:
+        return {"status": "error", "message": f"对接模式错误，必须是'adgpu'、'vina'或'funnel': {dock_mode}"}
     
+    chunk_size = DOCKING_CHUNK_SIZE if chunk_size is None else int(chunk_size)
+
+    ligand_name = os.path.basename(ligand_path)
+    temp_paths = []
+    # 过滤后的分子在原始文件中的序号，None表示未过滤
+    kept_indices = None
+    filter_stats = {}
+
+    def new_temp_sdf():
+        with tempfile.NamedTemporaryFile('w', suffix='.sdf', delete=False) as temp_file:
+            temp_paths.append(temp_file.name)
+        return temp_file.name
+
     # 构建API请求负载
     try:
-        with open(ligand_path, 'rb') as ligand_file, open(protein_path, 'rb') as protein_file:
-            files = {
-                'ligand_sdf': (os.path.basename(ligand_path), ligand_file.read()),
-                'protein_pdb': (os.path.basename(protein_path), protein_file.read())
-            }
-            
-            data = {
-                'dock_mode': dock_mode
-            }
-            
-            # 调用Flask API
-            print(f"正在调用分子对接API，模式: {dock_mode}...")
-            response = requests.post(
-                "http://localhost:5000/api/molecular_docking",
-                files=files,
-                data=data,
-                timeout=600  # 根据计算时长调整，分子对接可能需要更长时间
-            )
-            
-            print(f"API响应: {response.text}")
-            if response.status_code == 200:
-                result = response.json()
-                
-                # 确保从API响应中正确提取结果文件列表
-                result_files = result.get('result_files', [])
-                
-                # 如果API未返回文件列表，则从结果中提取
-                if not result_files and 'download_urls' in result:
-                    result_files = [os.path.basename(url) for url in result['download_urls']]
-                
-                print(f"提取到的结果文件列表: {result_files}")
-                
-                return {
-                    "status": "success", 
-                    "message": f"分子对接计算完成 ({dock_mode}模式)",
-                    "result": result,
-                    "result_files": result_files  # 确保返回文件列表
-                }
-            else:
+        # 口袋裁剪：上传裁剪后的内容，文件名保持不变以免影响结果文件的命名
+        upload_path = protein_path
+        if pocket_radius:
+            upload_path, filter_stats["pocket"] = crop_pocket(protein_path, pocket_ref, pocket_radius)
+            print(f"受体口袋裁剪完成: {filter_stats['pocket']}")
+
+        with open(upload_path, 'rb') as protein_file:
+            protein_content = protein_file.read()
+
+        # 预筛选：剔除从SDF即可判定不合格的分子
+        if prefilter:
+            filtered_path = new_temp_sdf()
+            prefilter_stats, kept_indices = prefilter_sdf(ligand_path, filtered_path, prefilter_rules)
+            print(f"分子预筛选: 共 {prefilter_stats['total']} 个分子，剔除 {prefilter_stats['rejected']} 个，耗时 {prefilter_stats['timings']}")
+            filter_stats["prefilter"] = prefilter_stats
+            ligand_path = filtered_path
+
+        # 去重：只对从未用该受体和对接模式对接过的结构进行对接
+        seen = None
+        if dedup and (kept_indices is None or kept_indices):
+            seen = SeenSet(docking_scope(protein_content, dock_mode))
+            novel_path = new_temp_sdf()
+            dedup_stats, novel_indices, docked_keys = filter_novel_molecules(ligand_path, novel_path, seen)
+            print(f"结构去重: 共 {dedup_stats['total']} 个分子，跳过 {dedup_stats['skipped']} 个重复分子")
+            kept_indices = novel_indices if kept_indices is None else [kept_indices[idx] for idx in novel_indices]
+            filter_stats["dedup"] = dedup_stats
+            ligand_path = novel_path
+
+        if kept_indices is not None:
+            filter_stats["kept_indices"] = kept_indices
+            if not kept_indices:
                 return {
-                    "status": "error", 
-                    "message": f"API返回错误: {response.status_code}", 
-                    "response": response.text
+                    "status": "success",
+                    "message": "没有需要对接的分子（均被预筛选剔除或已对接过），跳过本次对接",
+                    "result_files": [],
+                    **filter_stats
                 }
+
+        # 受体文件名带运行标记，避免并发运行在后端共享目录中互相覆盖结果文件
+        protein_name = workspace.tag(os.path.basename(protein_path))
+        if dock_mode == 'funnel':
+            result = funnel_docking(ligand_path, ligand_name, protein_path, protein_content, chunk_size,
+                                    top_k=funnel_top_k, top_fraction=funnel_top_fraction, protein_name=protein_name,
+                                    progress=progress)
+        else:
+            result = run_docking(ligand_path, ligand_name, protein_name, protein_content, dock_mode, chunk_size, progress)
+        if result["status"] != "error":
+            if seen is not None:
+                # 只记录实际得到构象的分子，失败分块中的分子下次仍会对接；
+                # 漏斗精细对接结果中的序号对应子集中的位置，这些分子都已在粗筛结果中记录
+                refine_prefix = f"{os.path.splitext(protein_name)[0]}{FUNNEL_REFINE_SUFFIX}_"
+                docked = {parse_result_filename(f)[0] for f in result['result_files'] if not f.startswith(refine_prefix)}
+                docked.discard(None)
+                try:
+                    seen.add_all(docked_keys[idx] for idx in sorted(docked) if idx < len(docked_keys) and docked_keys[idx])
+                except Exception as e:
+                    print(f"记录已对接结构失败: {str(e)}")
+            if not workspace.is_shared:
+                collect_run_results(result, workspace)
+            print(f"提取到的结果文件列表: {result['result_files']}")
+            pose_paths = [os.path.join(workspace.downloads, f) for f in result['result_files']]
+            results_store.safe_record(results_store.record_poses, pose_paths, receptor=protein_path, dock_mode=dock_mode,
+                                      ligand_sdf=params['ligand_sdf'], kept_indices=kept_indices, run_id=run_id)
+        result.update(filter_stats)
+        return result
     except Exception as e:
         print(f"API调用失败: {str(e)}")
         return {"status": "error", "message": f"API调用失败: {str(e)}"}
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
 def main():
-    logging.info("分子对接服务器启动，使用stdio通信...")
-    mcp.run(transport="stdio")
+    run_server(mcp, "mol_docking_server.py", "分子对接服务器")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
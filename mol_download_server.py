@@ -1,9 +1,17 @@
+import base64
 import json
 import os
-import requests
+import re
 from typing import Dict, Any
 from mcp.server.fastmcp import FastMCP
 
+import backend_client
+from workspace import Workspace, get_workspace, SHARED_DOWNLOADS
+from artifact_store import ArtifactStore, link_or_copy
+from dir_index import result_sort_key
+from pdbqt_utils import read_binding_energy
+from server_cli import run_server
+
 import logging
 logging.basicConfig(level=logging.DEBUG)
 logging.debug("分子下载服务器启动中...")
@@ -11,17 +19,197 @@ logging.debug("分子下载服务器启动中...")
 # 初始化 MCP 服务器
 mcp = FastMCP("MoleculeDownloadingServer")
 
+# 作为MCP资源公开的工作目录子目录
+ARTIFACT_KINDS = ("downloads", "uploads", "ref")
+# 按文本返回的文件类型，其余文件按二进制返回
+TEXT_SUFFIXES = {".sdf", ".pdbqt", ".pdb", ".mol2", ".json", ".csv", ".txt", ".log"}
+# read_artifact工具单次最多返回的字节数，避免整个文件进入智能体的上下文
+READ_ARTIFACT_MAX_BYTES = int(os.getenv("MOL_READ_ARTIFACT_MAX_BYTES", "65536"))
+# 结果文件URI: artifacts://<kind>/<name>（共享目录）或 artifacts://runs/<run_id>/<kind>/<name>（指定运行）
+ARTIFACT_URI_RE = re.compile(r"^artifacts://(?:runs/(?P<run_id>[^/]+)/)?(?P<kind>[^/]+)/(?P<name>[^/]+)$")
+
+def extract_zip_to_store(zip_ref, output_path, store):
+    """把压缩包中的文件逐个写入内容寻址存储，再在输出目录中生成输出文件，返回写入统计"""
+    stats = {"files": 0, "bytes": 0, "hardlink": 0, "reflink": 0, "copy": 0, "existing": 0}
+    for member in zip_ref.infolist():
+        # 与extractall一样忽略目录项、绝对路径和指向上级目录的路径
+        parts = member.filename.replace("\\", "/").split("/")
+        if member.is_dir() or member.filename.startswith("/") or ".." in parts:
+            continue
+        with zip_ref.open(member) as src:
+            saved = store.save_stream(iter(lambda: src.read(1 << 20), b""), os.path.join(output_path, *parts))
+        stats["files"] += 1
+        stats["bytes"] += saved["size"]
+        stats[saved["method"]] += 1
+    return stats
+
+def copy_directory(directory, output_path, link=None):
+    """把本地目录中的文件直接复制（或克隆、硬链接，见link_or_copy）到输出目录，不登记到内容寻址存储，返回写入统计
+
+    link为False时总是生成独立副本，用于后端会原地覆盖文件的共享downloads目录
+    """
+    stats = {"files": 0, "bytes": 0, "hardlink": 0, "reflink": 0, "copy": 0, "existing": 0}
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            method = link_or_copy(entry.path, os.path.join(output_path, entry.name), link)
+            stats["files"] += 1
+            stats["bytes"] += entry.stat().st_size
+            stats[method] += 1
+    return stats
+
+def artifact_uri(kind, name, run_id=None) -> str:
+    prefix = f"artifacts://runs/{run_id}/" if run_id else "artifacts://"
+    return f"{prefix}{kind}/{name}"
+
+def resolve_artifact(kind, name, run_id=None):
+    """把结果文件URI的各部分解析为本地文件路径，只允许访问工作目录中的文件"""
+    if kind not in ARTIFACT_KINDS:
+        raise ValueError(f"文件类别错误，必须是{'、'.join(ARTIFACT_KINDS)}之一: {kind}")
+    if not name or name in (".", "..") or name != os.path.basename(name):
+        raise ValueError(f"文件名错误: {name}")
+    path = getattr(Workspace(run_id or None), kind) / name
+    if not path.is_file():
+        raise FileNotFoundError(f"文件不存在: {artifact_uri(kind, name, run_id)}")
+    return path
+
+def read_artifact_range(path, start=0, end=None) -> bytes:
+    """只读取文件中[start, end]范围内的字节（与HTTP Range一样包含end），end为None时读到文件末尾"""
+    start = int(start)
+    if start < 0 or (end is not None and int(end) < start):
+        raise ValueError(f"字节范围错误: {start}-{end}")
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read() if end is None else f.read(int(end) - start + 1)
+
+def artifact_content(path, data: bytes):
+    """文本类型的文件返回字符串，其余返回bytes（MCP资源中以base64传输）"""
+    return data.decode(errors="replace") if path.suffix.lower() in TEXT_SUFFIXES else data
+
+def scan_artifacts(run_id=None, kinds=ARTIFACT_KINDS, suffix=None, with_scores=False) -> list:
+    """列出工作目录中的结果文件，只读取目录项，不读取文件内容（with_scores时读取.pdbqt文件头部的结合能）"""
+    workspace = Workspace(run_id or None)
+    artifacts = []
+    for kind in kinds:
+        directory = getattr(workspace, kind)
+        if not directory.is_dir():
+            continue
+        with os.scandir(directory) as entries:
+            files = sorted((entry for entry in entries if entry.is_file()), key=lambda entry: result_sort_key(entry.name))
+        for entry in files:
+            if suffix and not entry.name.endswith(suffix):
+                continue
+            item = {"uri": artifact_uri(kind, entry.name, workspace.run_id), "kind": kind, "name": entry.name,
+                    "size": entry.stat().st_size}
+            if with_scores and entry.name.endswith(".pdbqt"):
+                energy = read_binding_energy(entry.path)
+                item["binding_energy"] = None if energy != energy else energy
+            artifacts.append(item)
+    return artifacts
+
+@mcp.resource("artifacts://index", mime_type="application/json")
+def artifact_index():
+    """共享工作目录中全部结果文件的列表（URI和大小）"""
+    return scan_artifacts()
+
+@mcp.resource("artifacts://runs/{run_id}/index", mime_type="application/json")
+def run_artifact_index(run_id: str):
+    """指定运行的工作目录中全部结果文件的列表（URI和大小）"""
+    return scan_artifacts(run_id)
+
+@mcp.resource("artifacts://{kind}/{name}")
+def artifact_resource(kind: str, name: str):
+    """共享工作目录中的结果文件，kind为downloads、uploads或ref"""
+    path = resolve_artifact(kind, name)
+    return artifact_content(path, read_artifact_range(path))
+
+@mcp.resource("artifacts://{kind}/{name}/bytes/{start}-{end}")
+def artifact_range_resource(kind: str, name: str, start: str, end: str):
+    """共享工作目录中结果文件的一段字节（包含start和end）"""
+    path = resolve_artifact(kind, name)
+    return artifact_content(path, read_artifact_range(path, start, end))
+
+@mcp.resource("artifacts://runs/{run_id}/{kind}/{name}")
+def run_artifact_resource(run_id: str, kind: str, name: str):
+    """指定运行的工作目录中的结果文件"""
+    path = resolve_artifact(kind, name, run_id)
+    return artifact_content(path, read_artifact_range(path))
+
+@mcp.resource("artifacts://runs/{run_id}/{kind}/{name}/bytes/{start}-{end}")
+def run_artifact_range_resource(run_id: str, kind: str, name: str, start: str, end: str):
+    """指定运行的工作目录中结果文件的一段字节（包含start和end）"""
+    path = resolve_artifact(kind, name, run_id)
+    return artifact_content(path, read_artifact_range(path, start, end))
+
+@mcp.tool()
+def list_artifacts(kind=None, suffix=None, with_scores=False, run_id=None):
+    """列出工作目录中的结果文件及其资源URI，不下载、不读取文件内容
+
+    Args:
+        kind: 文件类别（可选），"downloads"（生成和对接结果）、"uploads"或"ref"，默认列出全部
+        suffix: 只列出该扩展名的文件（可选），如".pdbqt"、".sdf"
+        with_scores: 是否同时读取.pdbqt文件的结合能（可选，默认为False，只读取文件头部）
+        run_id: 运行ID（可选）。设置后列出该运行工作目录中的文件
+
+    Returns:
+        dict: 包含状态和文件列表，每个文件带有"uri"（可用read_artifact或MCP资源读取）、"kind"、"name"、"size"
+    """
+    try:
+        if kind and kind not in ARTIFACT_KINDS:
+            return {"status": "error", "message": f"文件类别错误，必须是{'、'.join(ARTIFACT_KINDS)}之一: {kind}"}
+        artifacts = scan_artifacts(run_id, (kind,) if kind else ARTIFACT_KINDS, suffix, with_scores)
+        return {"status": "success", "message": f"共 {len(artifacts)} 个文件", "artifacts": artifacts}
+    except Exception as e:
+        return {"status": "error", "message": f"列出结果文件失败: {str(e)}"}
+
+@mcp.tool()
+def read_artifact(uri, offset=0, length=None):
+    """按URI读取结果文件的内容，可以只读取其中一段，不需要把文件下载到本地
+
+    Args:
+        uri: 结果文件的URI，如"artifacts://downloads/3rfm_ligand_0_0.pdbqt"（可由list_artifacts获得）
+        offset: 起始字节位置（可选，默认为0）
+        length: 读取的字节数（可选，默认且最多为READ_ARTIFACT_MAX_BYTES）
+
+    Returns:
+        dict: 包含状态、文件大小、本次读取的范围和内容；二进制文件的内容以base64编码，
+            "next_offset"不为空时表示文件还有剩余内容
+    """
+    match = ARTIFACT_URI_RE.match(str(uri))
+    if not match:
+        return {"status": "error", "message": f"URI格式错误，应为artifacts://<kind>/<name>或artifacts://runs/<run_id>/<kind>/<name>: {uri}"}
+    try:
+        path = resolve_artifact(match["kind"], match["name"], match["run_id"])
+        size = path.stat().st_size
+        offset = int(offset or 0)
+        length = min(int(length), READ_ARTIFACT_MAX_BYTES) if length else READ_ARTIFACT_MAX_BYTES
+        data = read_artifact_range(path, offset, offset + length - 1) if length > 0 else b""
+        content = artifact_content(path, data)
+        end = offset + len(data)
+        return {
+            "status": "success",
+            "uri": uri,
+            "size": size,
+            "offset": offset,
+            "length": len(data),
+            "encoding": "text" if isinstance(content, str) else "base64",
+            "content": content if isinstance(content, str) else base64.b64encode(content).decode(),
+            "next_offset": end if end < size else None
+        }
+    except Exception as e:
+        return {"status": "error", "message": f"读取结果文件失败: {str(e)}"}
+
 @mcp.tool()
-def download_all_outputs(output_path=None):
+def download_all_outputs(output_path=None, run_id=None):
     """下载整个 download 目录的所有文件，并解压到指定目录
     
     Args:
         output_path: 解压后保存文件的本地目录（可选，默认当前目录 ./downloaded_outputs）
+        run_id: 运行ID（可选）。设置后只复制该运行工作目录中的结果文件，不从后端下载整个共享目录
     
     Returns:
         dict: 包含状态、提示信息和文件保存目录
     """
-    import requests, zipfile, io, os
+    import zipfile, io, os
 
     print(f"收到下载所有输出文件的请求，output_path={output_path}")
     
@@ -35,19 +223,49 @@ def download_all_outputs(output_path=None):
         except Exception as e:
             return {"status": "error", "message": f"无法创建输出目录: {str(e)}"}
 
-    download_url = "http://localhost:5000/api/download_all"
+    if run_id:
+        try:
+            workspace = get_workspace(run_id)
+            # 运行目录中只有本运行的结果文件，后端不会改写，直接复制（或硬链接），不再经过存储
+            stats = copy_directory(workspace.downloads, output_path)
+            return {
+                "status": "success",
+                "message": f"运行 {run_id} 的 {stats['files']} 个结果文件已保存到 {output_path}",
+                "output_path": output_path,
+                "stats": stats
+            }
+        except Exception as e:
+            return {"status": "error", "message": f"复制运行结果文件失败: {str(e)}"}
+
+    # 后端直接写入共享downloads目录时复制该目录中的文件，不再下载压缩包，也不登记到存储
+    if backend_client.shared_downloads():
+        try:
+            stats = copy_directory(SHARED_DOWNLOADS, output_path, link=False)
+            print(f"共享目录文件统计: {stats}")
+            return {
+                "status": "success",
+                "message": f"共享目录中的所有文件已保存到 {output_path}",
+                "output_path": output_path,
+                "stats": stats
+            }
+        except Exception as e:
+            return {"status": "error", "message": f"复制共享目录文件失败: {str(e)}"}
+
+    download_url = backend_client.api_url("/api/download_all")
     print(f"正在从 {download_url} 下载所有文件...")
 
     try:
-        response = requests.get(download_url, stream=True, timeout=300)
+        response = backend_client.get(download_url, timeout=300)
         if response.status_code == 200:
             with zipfile.ZipFile(io.BytesIO(response.content)) as zip_ref:
-                zip_ref.extractall(output_path)
+                stats = extract_zip_to_store(zip_ref, output_path, ArtifactStore())
+            print(f"解压统计: {stats}")
 
             return {
                 "status": "success",
                 "message": f"所有文件已成功下载并解压到 {output_path}",
-                "output_path": output_path
+                "output_path": output_path,
+                "stats": stats
             }
         else:
             return {
@@ -59,9 +277,31 @@ def download_all_outputs(output_path=None):
         print(f"下载或解压失败: {str(e)}")
         return {"status": "error", "message": f"下载失败: {str(e)}"}
 
+@mcp.tool()
+def artifact_gc(max_age_hours=24):
+    """回收本地内容寻址存储中不再被任何输出文件引用的对象
+
+    Args:
+        max_age_hours: 只回收超过该时长（小时）未被使用的对象（可选，默认为24，0表示回收全部未引用对象；
+            最近MOL_ARTIFACT_GC_GRACE秒内使用过的对象可能正作为输入被后端读取，总是保留）
+
+    Returns:
+        dict: 包含状态、回收的对象数和释放的字节数，以及回收后的存储占用
+    """
+    try:
+        store = ArtifactStore()
+        result = store.gc(float(max_age_hours) * 3600)
+        return {
+            "status": "success",
+            "message": f"回收 {result['removed']} 个对象，释放 {result['freed_bytes']} 字节",
+            "gc": result,
+            "usage": store.usage()
+        }
+    except Exception as e:
+        return {"status": "error", "message": f"垃圾回收失败: {str(e)}"}
+
 def main():
-    logging.info("分子下载服务器启动，使用stdio通信...")
-    mcp.run(transport="stdio")
+    run_server(mcp, "mol_download_server.py", "分子下载服务器")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
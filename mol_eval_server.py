@@ -1,10 +1,20 @@
 import json
 import os
-import requests
 from typing import Dict, Any
 from mcp.server.fastmcp import FastMCP
-import re
-import glob
+import numpy as np
+
+import backend_client
+from pose_analysis import cluster_pose_files
+from geometry_check import check_pose_geometry
+from pocket import crop_pocket
+from pdbqt_utils import score_files, select_top_poses, read_binding_energy, funnel_tier_mode, BINDING_ENERGY_THRESHOLD
+from eval_columns import append_evaluation_csv, csv_checks_pass
+import results_store
+from dir_index import get_index
+from workspace import get_workspace
+from server_cli import run_server
+from progress import with_progress
 
 import logging
 logging.basicConfig(level=logging.DEBUG)
@@ -13,27 +23,117 @@ logging.debug("分子构象评估服务器启动中...")
 # 初始化 MCP 服务器
 mcp = FastMCP("MoleculeEvalServer")
 
+def evaluate_pose(pred_path, cond_file, upload_cond_file, dock_mode, result_dir=None):
+    """调用后端评估单个预测构象，返回该构象的评估结果字典
+
+    Args:
+        pred_path: 预测构象文件路径（.pdbqt）
+        cond_file: 条件蛋白质文件路径，上传时使用其文件名
+        upload_cond_file: 实际上传的条件蛋白质文件（口袋裁剪后的文件或cond_file本身）
+        dock_mode: 对接模式
+        result_dir: 保存posebusters结果CSV的目录（可选）。设置后结果CSV保存为"<构象文件名>_<结果文件名>"，
+            追加到列式评估结果存储中，并在返回结果中给出"posebusters_file"和"posebusters_pass"
+    """
+    if not os.path.exists(pred_path):
+        return {"file": pred_path, "status": "error", "message": f"预测构象文件不存在"}
+    if not pred_path.endswith('.pdbqt'):
+        return {"file": pred_path, "status": "error", "message": f"文件格式错误，不是.pdbqt: {pred_path}"}
+
+    try:
+        files = {}
+        data = {
+            'dock_mode': dock_mode
+        }
+        # 共享文件系统模式下只传路径，否则上传文件内容
+        backend_client.attach_file(files, data, 'pred_file', os.path.basename(pred_path), path=pred_path)
+        backend_client.attach_file(files, data, 'cond_file', os.path.basename(cond_file), path=upload_cond_file)
+
+        print(f"调用API进行评估，文件: {pred_path}")
+        response = backend_client.post(
+            "/api/conformation_evaluation",
+            files=files,
+            data=data,
+            timeout=300
+        )
+
+        if response.status_code == 200:
+            item = {
+                "file": pred_path,
+                "status": "success",
+                "result": response.json()
+            }
+            download_url = item["result"].get("download_url") if isinstance(item["result"], dict) else None
+            if download_url and result_dir:
+                save_posebusters_result(item, download_url, result_dir)
+            return item
+        return {
+            "file": pred_path,
+            "status": "error",
+            "message": f"API错误: {response.status_code}",
+            "response": response.text
+        }
+    except Exception as e:
+        return {
+            "file": pred_path,
+            "status": "error",
+            "message": f"API调用失败: {str(e)}"
+        }
+
+def save_posebusters_result(item, download_url, result_dir):
+    """保存单个构象的posebusters结果CSV并追加到列式存储，检查项是否全部通过记录在item["posebusters_pass"]中"""
+    # 后端每次评估都会覆盖同名结果文件，因此评估后立即保存，本地按构象区分文件名
+    pose_key = os.path.basename(item["file"])
+    csv_path = os.path.join(str(result_dir), f"{os.path.splitext(pose_key)[0]}_{os.path.basename(download_url)}")
+    if backend_client.save_output(download_url, csv_path) is None:
+        return
+    energy = read_binding_energy(item["file"])
+    append_evaluation_csv(csv_path, pose_key=pose_key, energy=None if energy != energy else energy)
+    item["posebusters_file"] = csv_path
+    try:
+        item["posebusters_pass"] = csv_checks_pass(csv_path)
+    except Exception as e:
+        print(f"解析posebusters结果失败 {csv_path}: {str(e)}")
+
 @mcp.tool()
-def conformation_evaluation(pred_file=None, cond_file=None, dock_mode="vina"):
-    """执行构象评估计算"""
-
-    def get_default_pred_files():
-        pdbqt_files = glob.glob("/home/zhangfn/workflow/downloads/*.pdbqt")
-        def extract_sort_key(file_path):
-            filename = os.path.basename(file_path)
-            match = re.search(r'_([0-9]+)_', filename)
-            return int(match.group(1)) if match else float('inf')
-        return sorted(pdbqt_files, key=extract_sort_key)
-
-    def get_default_cond_file():
-        pdb_files = glob.glob("/home/zhangfn/workflow/uploads/*.pdb")
-        return pdb_files[0] if pdb_files else None
-
-    # 设置默认参数
+@with_progress
+def conformation_evaluation(pred_file=None, cond_file=None, dock_mode="vina", rmsd_cutoff=None,
+                            geometry_prefilter=False, geometry_rules=None, pocket_radius=None, pocket_ref="A:330",
+                            top_n=None, top_n_scope="ligand", score_threshold=None, run_id=None, progress=None):
+    """执行构象评估计算
+
+    Args:
+        pred_file: 预测构象文件路径（.pdbqt），可以是单个路径或路径列表（可选，默认为下载目录中的全部.pdbqt文件）
+        cond_file: 条件蛋白质文件路径（.pdb）（可选，默认为上传目录中的.pdb文件）
+        dock_mode: 对接模式，可选值为"adgpu"、"vina"或"funnel"。funnel模式下精细对接结果（"_refine_"文件）按adgpu评估，
+            其余粗筛结果按vina评估
+        rmsd_cutoff: 构象聚类的RMSD阈值（埃，可选）。设置后同一配体中RMSD小于阈值的构象只评估结合能最低的代表构象，
+            其余构象沿用代表构象的评估结果
+        geometry_prefilter: 是否先在本地做几何预检（受体碰撞、键长、口袋包埋），未通过的构象不再提交远程评估
+        geometry_rules: 几何预检阈值（可选），覆盖geometry_check.DEFAULT_GEOMETRY_RULES中的同名项
+        pocket_radius: 口袋裁剪半径（埃，可选）。设置后只上传pocket_ref周围该半径内的受体残基作为条件蛋白质
+        pocket_ref: 口袋中心的参考配体，可以是残基标识（默认"A:330"）或SDF文件的绝对路径
+        top_n: 只评估结合能最低的N个构象（可选）
+        top_n_scope: top_n的统计范围，"ligand"为每个配体各取N个（默认），"overall"为全部构象中取N个
+        score_threshold: 结合能阈值（可选）。设置top_n或score_threshold时只评估结合能小于该阈值的构象，
+            未设置时默认使用反馈阶段的结合能标准（-5）
+        run_id: 运行ID（可选）。设置后默认的预测构象和条件蛋白质只在该运行的工作目录中查找
+
+    Returns:
+        包含状态和每个文件评估结果的字典，聚类时每个结果额外带有"cluster_representative"字段；
+        posebusters结果CSV保存在下载目录中并追加到列式评估结果存储，"posebusters_pass"为其检查项是否全部通过
+        每评估完一个构象，通过进度通知发送该构象的评估结果
+    """
+
+    try:
+        workspace = get_workspace(run_id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    # 设置默认参数：从缓存的目录索引中取，文件已按配体/构象序号排序
     if not pred_file:
-        pred_file = get_default_pred_files()
+        pred_file = get_index(workspace.downloads).files('.pdbqt')
     if not cond_file:
-        cond_file = get_default_cond_file()
+        cond_file = get_index(workspace.uploads).first('.pdb')
 
     print(f"收到构象评估请求，pred_file: {pred_file}, cond_file: {cond_file}, dock_mode: {dock_mode}")
 
@@ -50,67 +150,115 @@ def conformation_evaluation(pred_file=None, cond_file=None, dock_mode="vina"):
         return {"status": "error", "message": f"条件蛋白质文件不存在: {cond_file}"}
     if not cond_file.endswith('.pdb'):
         return {"status": "error", "message": f"条件蛋白质文件格式错误，必须是.pdb格式: {cond_file}"}
-    if dock_mode not in ['adgpu', 'vina']:
-        return {"status": "error", "message": f"对接模式错误，必须是'adgpu'或'vina': {dock_mode}"}
+    if dock_mode not in ['adgpu', 'vina', 'funnel']:
+        return {"status": "error", "message": f"对接模式错误，必须是'adgpu'、'vina'或'funnel': {dock_mode}"}
+
+    # 口袋裁剪：上传裁剪后的条件蛋白质，本地几何预检仍使用完整受体
+    upload_cond_file = cond_file
+    pocket_stats = None
+    if pocket_radius:
+        try:
+            upload_cond_file, pocket_stats = crop_pocket(cond_file, pocket_ref, pocket_radius)
+            print(f"受体口袋裁剪完成: {pocket_stats}")
+        except Exception as e:
+            return {"status": "error", "message": f"受体口袋裁剪失败: {str(e)}"}
+
+    # 按对接结合能挑选构象：结合能不达标或排名靠后的构象不提交评估
+    skipped = []
+    if top_n or score_threshold is not None:
+        if top_n_scope not in ['ligand', 'overall']:
+            return {"status": "error", "message": f"top_n_scope错误，必须是'ligand'或'overall': {top_n_scope}"}
+        threshold = BINDING_ENERGY_THRESHOLD if score_threshold is None else float(score_threshold)
+        existing = [path for path in pred_file if os.path.exists(path) and path.endswith('.pdbqt')]
+        table = score_files(existing)
+        selected = select_top_poses(table, int(top_n) if top_n else None, top_n_scope == 'ligand', threshold)
+        selected_files = {existing[idx] for idx in selected.tolist()}
+        for idx, path in enumerate(existing):
+            if path not in selected_files:
+                energy = float(table["energy"][idx])
+                skipped.append({
+                    "file": path,
+                    "status": "skipped",
+                    "message": "结合能未达到阈值或排名不在前列，未提交评估",
+                    "binding_energy": None if np.isnan(energy) else round(energy, 3)
+                })
+        existing_files = set(existing)
+        pred_file = [path for path in pred_file if path in selected_files or path not in existing_files]
+        print(f"按结合能挑选构象（阈值 {threshold}，top_n={top_n}，范围 {top_n_scope}）: {len(existing)} 个构象中选中 {len(selected_files)} 个")
+
+    # 本地几何预检：明显不合理的构象直接判为不通过
+    rejected = []
+    if geometry_prefilter:
+        existing = [path for path in pred_file if os.path.exists(path) and path.endswith('.pdbqt')]
+        report = check_pose_geometry(existing, cond_file, geometry_rules)
+        for path, item in report.items():
+            if not item["pass"]:
+                rejected.append({
+                    "file": path,
+                    "status": "rejected",
+                    "message": f"本地几何预检未通过: {', '.join(item['failed'])}",
+                    "geometry": item
+                })
+        rejected_files = {item["file"] for item in rejected}
+        pred_file = [path for path in pred_file if path not in rejected_files]
+        print(f"本地几何预检完成: {len(existing)} 个构象中 {len(rejected)} 个未通过")
+
+    # 构象聚类：只评估每个簇的代表构象
+    membership = {}
+    if rmsd_cutoff:
+        existing = [path for path in pred_file if os.path.exists(path) and path.endswith('.pdbqt')]
+        membership = cluster_pose_files(existing, float(rmsd_cutoff))
+        n_representatives = len(set(membership.values()))
+        print(f"构象聚类完成（RMSD阈值 {rmsd_cutoff}）: {len(existing)} 个构象归为 {n_representatives} 个簇")
 
     results = []
+    evaluated = {}
+    n_to_evaluate = sum(1 for pred_path in pred_file if membership.get(pred_path, pred_path) == pred_path)
     for pred_path in pred_file:
-        if not os.path.exists(pred_path):
-            results.append({"file": pred_path, "status": "error", "message": f"预测构象文件不存在"})
-            continue
-        if not pred_path.endswith('.pdbqt'):
-            results.append({"file": pred_path, "status": "error", "message": f"文件格式错误，不是.pdbqt: {pred_path}"})
+        representative = membership.get(pred_path, pred_path)
+        if representative != pred_path:
+            # 非代表构象稍后沿用代表构象的结果
             continue
+        pose_mode = funnel_tier_mode(pred_path) if dock_mode == 'funnel' else dock_mode
+        item = evaluate_pose(pred_path, cond_file, upload_cond_file, pose_mode, workspace.downloads)
+        results.append(item)
+        if progress:
+            progress.advance(total=n_to_evaluate, message=f"构象评估完成: {pred_path}", partial=item)
 
-        try:
-            with open(pred_path, 'rb') as pf, open(cond_file, 'rb') as cf:
-                files = {
-                    'pred_file': pf,
-                    'cond_file': cf
-                }
-                data = {
-                    'dock_mode': dock_mode
-                }
-
-                print(f"调用API进行评估，文件: {pred_path}")
-                response = requests.post(
-                    "http://localhost:5000/api/conformation_evaluation",
-                    files=files,
-                    data=data,
-                    timeout=300
-                )
-
-                if response.status_code == 200:
-                    results.append({
-                        "file": pred_path,
-                        "status": "success",
-                        "result": response.json()
-                    })
-                else:
-                    results.append({
-                        "file": pred_path,
-                        "status": "error",
-                        "message": f"API错误: {response.status_code}",
-                        "response": response.text
-                    })
-        except Exception as e:
-            results.append({
-                "file": pred_path,
-                "status": "error",
-                "message": f"API调用失败: {str(e)}"
-            })
+    if membership:
+        evaluated = {item["file"]: item for item in results}
+        for item in results:
+            item["cluster_representative"] = item["file"]
+        for pred_path in pred_file:
+            representative = membership.get(pred_path, pred_path)
+            if representative != pred_path and representative in evaluated:
+                propagated = {key: value for key, value in evaluated[representative].items() if key != "file"}
+                results.append({"file": pred_path, **propagated, "cluster_representative": representative})
+
+    message = f"共处理 {len(results) + len(rejected) + len(skipped)} 个文件"
+    if skipped:
+        message += f"，其中 {len(skipped)} 个因结合能未入选而跳过"
+    if rejected:
+        message += f"，其中 {len(rejected)} 个未通过本地几何预检"
+    if membership:
+        message += f"，实际评估 {len(evaluated)} 个代表构象"
+    results.extend(rejected)
+    results.extend(skipped)
+    results_store.safe_record(results_store.record_evaluations, results, run_id=run_id)
 
-    return {
+    output = {
         "status": "success",
-        "message": f"共处理 {len(results)} 个文件",
+        "message": message,
         "results": results
     }
+    if pocket_stats:
+        output["pocket"] = pocket_stats
+    return output
 
 
 
 def main():
-    logging.info("分子构象评估服务器启动，使用stdio通信...")
-    mcp.run(transport="stdio")
+    run_server(mcp, "mol_eval_server.py", "分子构象评估服务器")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,10 +1,19 @@
 import json
 import os
-import requests
 from typing import Dict, Any
 from mcp.server.fastmcp import FastMCP
 from pathlib import Path
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import backend_client
+from sdf_utils import split_sdf_records, merge_sdf_records
+from pocket import crop_pocket
+import results_store
+from dir_index import get_index
+from workspace import get_workspace, SHARED_DOWNLOADS
+from server_cli import run_server
+from progress import with_progress
 
 logging.basicConfig(level=logging.DEBUG)
 logging.debug("分子生成服务器启动中...")
@@ -16,17 +25,143 @@ WORKING_DIR = Path("/home/zhangfn/workflow")
 REF_FOLDER = WORKING_DIR / "ref"
 UPLOAD_FOLDER = WORKING_DIR / "uploads"
 
+# 大批量生成时按分片拆分请求，分片可以分发到多个后端（逗号分隔）
+GENERATION_SHARD_SIZE = int(os.getenv("MOL_GEN_SHARD_SIZE", "20"))
+GENERATION_BACKENDS = [url.strip() for url in os.getenv("MOL_GEN_BACKENDS", backend_client.BACKEND_URL).split(",") if url.strip()]
+GENERATION_MAX_WORKERS = int(os.getenv("MOL_GEN_MAX_WORKERS", "4"))
+
+def post_generation(pdb_name, pdb_content, ref_ligand, n_samples, base_url=None):
+    """调用后端分子生成API，ref_ligand为SDF文件路径时上传文件内容（共享文件系统模式下只传路径）"""
+    files = {}
+    data = {'n_samples': n_samples}
+    backend_client.attach_file(files, data, 'pdb_file', pdb_name, content=pdb_content, base_url=base_url)
+
+    if ref_ligand != 'A:330' and os.path.exists(ref_ligand):
+        backend_client.attach_file(files, data, 'ref_ligand_file', os.path.basename(ref_ligand), path=ref_ligand,
+                                   base_url=base_url)
+    else:
+        data['ref_ligand'] = ref_ligand
+
+    return backend_client.post(
+        "/api/molecule_generation",
+        base_url=base_url,
+        files=files,
+        data=data,
+        timeout=300
+    )
+
+def run_generation_shard(shard_index, pdb_path, pdb_content, ref_ligand, n_samples, base_url):
+    """执行单个生成分片，并取回该分片生成的SDF记录"""
+    stem, ext = os.path.splitext(os.path.basename(pdb_path))
+    # 每个分片使用独立的受体文件名，避免并发分片在后端互相覆盖输出文件
+    shard_pdb_name = f"{stem}_shard{shard_index}{ext}"
+    shard = {"shard": shard_index, "backend": base_url, "n_samples": n_samples}
+    try:
+        response = post_generation(shard_pdb_name, pdb_content, ref_ligand, n_samples, base_url)
+        if response.status_code != 200:
+            shard.update({"status": "error", "message": f"API返回错误: {response.status_code}", "response": response.text})
+            return shard
+
+        result = response.json()
+        download_url = result.get('download_url', '')
+        shard["molecule_name"] = os.path.basename(download_url)
+        sdf_content = backend_client.read_output(download_url, base_url=base_url)
+        if sdf_content is None:
+            shard.update({"status": "error", "message": "分片结果下载失败"})
+            return shard
+
+        shard["records"] = split_sdf_records(sdf_content.decode())
+        shard.update({"status": "success", "n_generated": len(shard["records"])})
+    except Exception as e:
+        shard.update({"status": "error", "message": f"API调用失败: {str(e)}"})
+    return shard
+
+def sharded_generation(pdb_path, ref_ligand, n_samples, shard_size, pdb_content=None, workspace=None, progress=None):
+    """将大批量生成请求拆分为多个分片并发执行，合并各分片的SDF结果
+
+    pdb_content不为空时上传该内容（如裁剪后的口袋），文件名仍沿用pdb_path；
+    workspace不为空时上传文件名带运行标记，合并结果写入该运行的downloads目录；
+    合并结果只在本地，后端上没有该文件，因此结果中只有本地路径file_path，没有download_url；
+    progress不为空时每完成一个分片汇报一次进度和该分片生成的分子
+    """
+    workspace = workspace or get_workspace()
+    if pdb_content is None:
+        with open(pdb_path, 'rb') as f:
+            pdb_content = f.read()
+
+    upload_name = workspace.tag(os.path.basename(str(pdb_path)))
+    shard_sizes = [shard_size] * (n_samples // shard_size)
+    if n_samples % shard_size:
+        shard_sizes.append(n_samples % shard_size)
+    print(f"分子生成请求拆分为 {len(shard_sizes)} 个分片: {shard_sizes}")
+
+    with ThreadPoolExecutor(max_workers=min(GENERATION_MAX_WORKERS, len(shard_sizes))) as executor:
+        futures = [
+            executor.submit(run_generation_shard, idx, upload_name, pdb_content, ref_ligand, size,
+                            GENERATION_BACKENDS[idx % len(GENERATION_BACKENDS)])
+            for idx, size in enumerate(shard_sizes)
+        ]
+        if progress:
+            for future in as_completed(futures):
+                # 阶段性结果中带有该分片的SDF记录，客户端可以不等全部分片完成就开始处理这些分子
+                shard = future.result()
+                progress.advance(total=len(futures), message=f"分子生成第 {shard['shard']} 个分片完成", partial=dict(shard))
+        # 按分片顺序收集结果，保证合并后的分子编号稳定
+        shards = [future.result() for future in futures]
+
+    succeeded = [shard for shard in shards if shard["status"] == "success"]
+    if not succeeded:
+        return {
+            "status": "error",
+            "message": "所有分子生成分片均失败",
+            "shards": shards
+        }
+
+    # 合并后的文件沿用不分片时的命名，写入对接默认读取的目录
+    stem = os.path.splitext(upload_name)[0]
+    molecule_name = succeeded[0]["molecule_name"].replace(f"{stem}_shard{succeeded[0]['shard']}", stem, 1)
+    molecule_name = workspace.untag(molecule_name)
+    records = [record for shard in succeeded for record in shard.pop("records")]
+    merged_path = workspace.downloads / molecule_name
+    with open(merged_path, 'w') as f:
+        f.write(merge_sdf_records(records, title_prefix=os.path.splitext(molecule_name)[0]))
+
+    # 清理后端写入共享目录的分片文件，避免被当作默认配体；远程后端的分片文件不在本地，不按文件名删除本地同名文件
+    for shard in succeeded:
+        if not backend_client.shared_downloads(shard["backend"]):
+            continue
+        shard_file = SHARED_DOWNLOADS / shard["molecule_name"]
+        if shard_file != merged_path and shard_file.exists():
+            shard_file.unlink()
+
+    failed_count = len(shards) - len(succeeded)
+    return {
+        "status": "success" if not failed_count else "partial",
+        "message": f"分子生成计算完成，{len(succeeded)}/{len(shards)} 个分片成功，共 {len(records)} 个分子",
+        "result": {
+            "molecule_name": molecule_name,
+            "file_path": str(merged_path),
+            "n_generated": len(records)
+        },
+        "shards": shards
+    }
+
 @mcp.tool()
-def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
+@with_progress
+def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1, shard_size=None, pocket_radius=None, run_id=None, progress=None):
     """执行分子生成计算
 
     Args:
         pdb_file: 受体文件绝对路径（必须为.pdb格式）、也可能是"uploaded_pdb"字段
         ref_ligand: 参考配体信息，可以是"A:330"（默认值，无参考配体）、"best_ref_ligand_sdf"（使用REF_FOLDER中的最佳参考配体）或者SDF文件的绝对路径
         n_samples: 生成样本数量（可选，默认为1）
+        shard_size: 每个分片的生成数量（可选，默认为20），n_samples超过该值时拆分为多个分片并发生成
+        pocket_radius: 口袋裁剪半径（埃，可选）。设置后只上传参考配体周围该半径内的受体残基
+        run_id: 运行ID（可选）。设置后"uploaded_pdb"、"best_ref_ligand_sdf"只在该运行的工作目录中查找，生成结果也写入该目录
 
     Returns:
-        包含状态和结果的字典: {"status": "success/failure", "result": 计算结果或错误信息}
+        包含状态和结果的字典: {"status": "success/partial/error", "result": 计算结果或错误信息, "shards": 各分片的执行情况（仅分片时返回）}
+        分片生成时每完成一个分片，通过进度通知发送该分片的执行情况和生成的SDF记录
     """
     # 构建params字典
     params = {
@@ -37,18 +172,25 @@ def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
 
     print(f"收到分子生成请求，参数: {params}")
 
+    try:
+        workspace = get_workspace(run_id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    upload_folder = workspace.uploads
+    ref_folder = workspace.ref
+
     # 参数校验和文件路径处理
     pdb_path = params['pdb_file']
 
     if pdb_path == "uploaded_pdb":
         try:
-            pdb_files = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith(".pdb")]
+            pdb_files = get_index(upload_folder).files(".pdb")
             if not pdb_files:
                 return {"status": "error", "message": "UPLOAD_FOLDER 中未找到 .pdb 文件"}
             elif len(pdb_files) > 1:
                 return {"status": "error", "message": "UPLOAD_FOLDER 中存在多个 .pdb 文件，请手动指定"}
             else:
-                pdb_path = UPLOAD_FOLDER / pdb_files[0]
+                pdb_path = Path(pdb_files[0])
                 print(f"使用上传的 .pdb 文件: {pdb_path}")
         except Exception as e:
             return {"status": "error", "message": f"读取上传的 .pdb 文件失败: {str(e)}"}
@@ -64,14 +206,15 @@ def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
     # 处理best_ref_ligand_sdf特殊值
     if ref_ligand == 'best_ref_ligand_sdf':
         try:
-            # 寻找REF_FOLDER中的SDF文件
-            sdf_files = [f for f in os.listdir(REF_FOLDER) if f.endswith('.sdf')]
-            if not sdf_files:
+            # 从结果索引中查询通过评估且结合能最低的参考配体，索引不可用时退回到目录中的第一个SDF文件
+            best_ref = results_store.safe_record(results_store.best_reference, ref_folder)
+            if not best_ref:
+                best_ref = get_index(ref_folder).first('.sdf')
+            if not best_ref:
                 print(f"警告: REF_FOLDER中没有找到SDF文件，将使用默认参考配体")
                 ref_ligand = 'A:330'
             else:
-                # 使用找到的第一个SDF文件
-                ref_ligand = os.path.join(REF_FOLDER, sdf_files[0])
+                ref_ligand = best_ref
                 print(f"找到最佳参考配体: {ref_ligand}")
         except Exception as e:
             print(f"查找最佳参考配体时出错: {str(e)}，将使用默认参考配体")
@@ -81,45 +224,64 @@ def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
     if ref_ligand != 'A:330' and (not os.path.exists(ref_ligand) or not ref_ligand.endswith('.sdf')):
         return {"status": "error", "message": f"参考配体文件不存在或格式错误(应为.sdf): {ref_ligand}"}
 
-    n_samples = params.get('n_samples', 1)
+    n_samples = int(params.get('n_samples', 1))
+    shard_size = int(shard_size or GENERATION_SHARD_SIZE)
+    if shard_size <= 0:
+        return {"status": "error", "message": f"分片大小必须为正整数: {shard_size}"}
+
+    # 口袋裁剪：上传裁剪后的内容，文件名保持不变以免影响后端输出文件的命名
+    upload_path = pdb_path
+    pocket_stats = None
+    if pocket_radius:
+        try:
+            upload_path, pocket_stats = crop_pocket(pdb_path, ref_ligand, pocket_radius)
+            print(f"受体口袋裁剪完成: {pocket_stats}")
+        except Exception as e:
+            return {"status": "error", "message": f"受体口袋裁剪失败: {str(e)}"}
 
     # 构建API请求负载
     try:
-        with open(pdb_path, 'rb') as f:
+        with open(upload_path, 'rb') as f:
             pdb_content = f.read()
 
-        files = {'pdb_file': (os.path.basename(pdb_path), pdb_content)}
-
-        data = {'n_samples': n_samples}
-
-        # 如果是SDF文件，也读取到内存中
-        if ref_ligand != 'A:330' and os.path.exists(ref_ligand):
-            with open(ref_ligand, 'rb') as ref_file:
-                ref_content = ref_file.read()
-            files['ref_ligand_file'] = (os.path.basename(ref_ligand), ref_content)
-        else:
-            data['ref_ligand'] = ref_ligand
+        if n_samples > shard_size:
+            result = sharded_generation(pdb_path, ref_ligand, n_samples, shard_size, pdb_content, workspace, progress)
+            if result["status"] != "error":
+                results_store.safe_record(results_store.record_molecules, result["result"]["file_path"], run_id=run_id)
+            if pocket_stats:
+                result["pocket"] = pocket_stats
+            return result
 
         # 调用Flask API
         print(f"正在调用分子生成API...")
-        response = requests.post(
-            "http://localhost:5000/api/molecule_generation",
-            files=files,
-            data=data,
-            timeout=300
-        )
+        response = post_generation(workspace.tag(os.path.basename(pdb_path)), pdb_content, ref_ligand, n_samples)
 
         print(f"API响应: {response.text}")
         if response.status_code == 200:
             result = response.json()
             # 从下载URL中提取分子文件名
-            molecule_name = os.path.basename(result.get('download_url', ''))
+            download_url = result.get('download_url', '')
+            backend_name = os.path.basename(download_url)
+            molecule_name = workspace.untag(backend_name)
             result['molecule_name'] = molecule_name  # 添加分子名称到结果中
-            return {
+
+            # 指定run_id时把结果移入该运行的目录
+            molecule_path = None
+            if backend_name:
+                molecule_path = workspace.collect_output(backend_name, lambda: backend_client.read_output(download_url))
+            if molecule_path and molecule_path.is_file():
+                result['file_path'] = str(molecule_path)
+                results_store.safe_record(results_store.record_molecules, molecule_path, run_id=run_id)
+            if progress:
+                progress.advance(total=1, message="分子生成完成", partial={"molecule_name": molecule_name, "file_path": result.get('file_path')})
+            output = {
                 "status": "success",
                 "message": "分子生成计算完成",
                 "result": result
             }
+            if pocket_stats:
+                output["pocket"] = pocket_stats
+            return output
         else:
             return {
                 "status": "error",
@@ -131,8 +293,7 @@ def molecule_generation(pdb_file, ref_ligand="A:330", n_samples=1):
         return {"status": "error", "message": f"API调用失败: {str(e)}"}
 
 def main():
-    logging.info("分子生成服务器启动，使用stdio通信...")
-    mcp.run(transport="stdio")
+    run_server(mcp, "mol_generation_server.py", "分子生成服务器")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,14 @@
 import json
 import os
-import requests
 from typing import Dict, Any
 from mcp.server.fastmcp import FastMCP
+import time
+
+from pdbqt_utils import score_directory, best_energy_per_ligand, BINDING_ENERGY_THRESHOLD
+import results_store
+import backend_client
+from workspace import get_workspace
+from server_cli import run_server
 
 import logging
 logging.basicConfig(level=logging.DEBUG)
@@ -11,25 +17,32 @@ logging.debug("结果反馈服务器启动中...")
 # 初始化 MCP 服务器
 mcp = FastMCP("MolReflectionServer")
 
+
 @mcp.tool()
-def molecule_reflection():
+def molecule_reflection(run_id=None):
     """评估分子对接结合能和构象质量
     
     评估两个指标：
     1. 对接结合能是否小于-5
     2. Posebusters构象评估的各项指标是否均为True
+
+    未指定run_id时由后端根据共享downloads目录中的结果评估；
+    指定run_id时在本地按运行评估（见run_reflection），不调用后端API，
+    因为本运行的结果文件已从共享目录移入该运行的工作目录。
+
+    Args:
+        run_id: 运行ID（可选）
     
     Returns:
-        dict: 包含评估结果的状态和详细信息
+        dict: 包含评估结果的状态和详细信息，"scope"为"shared"或"run"
     """
-    import requests
-    
+    if run_id:
+        return run_reflection(run_id)
+
     print("正在调用结果反馈API...")
     
-    reflection_url = "http://localhost:5000/api/reflection"
-    
     try:
-        response = requests.post(reflection_url, timeout=60)
+        response = backend_client.post("/api/reflection", timeout=60)
         
         if response.status_code == 200:
             result = response.json()
@@ -38,10 +51,12 @@ def molecule_reflection():
             all_results = result.get("results", [])
             passed_count = sum(1 for item in all_results if item.get("overall_pass") == "YES")
             total_count = len(all_results)
+            results_store.safe_record(results_store.record_reflection, all_results)
             
             # 构建返回消息
             summary = {
                 "status": "success",
+                "scope": "shared",
                 "message": all_results
             }
             
@@ -74,9 +89,91 @@ def molecule_reflection():
         print(error_msg)
         return {"status": "error", "message": error_msg}
 
+@mcp.tool()
+def local_binding_energy(result_dir=None, threshold=BINDING_ENERGY_THRESHOLD, use_index=True, run_id=None):
+    """在本地直接从对接结果(.pdbqt)中提取结合能并判断是否小于阈值，不调用后端API
+
+    Args:
+        result_dir: 对接结果目录（可选，默认为/home/zhangfn/workflow/downloads，指定run_id时为该运行的downloads目录）
+        threshold: 结合能阈值（可选，默认为-5）
+        use_index: 是否优先从结果索引中查询（可选，默认为True），索引中缺少该目录中某些文件的记录时扫描目录
+        run_id: 运行ID（可选）
+
+    Returns:
+        dict: 包含状态、每个配体的最低结合能及是否通过，以及耗时（毫秒）；
+            配体按(文件名前缀, 配体序号)区分，不同受体或漏斗精细对接的同序号配体分别统计
+    """
+    if not result_dir:
+        try:
+            result_dir = str(get_workspace(run_id).downloads)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+    if not os.path.isdir(result_dir):
+        return {"status": "error", "message": f"对接结果目录不存在: {result_dir}"}
+
+    start = time.perf_counter()
+    best = results_store.safe_record(results_store.best_energy_by_directory, result_dir, run_id) if use_index else None
+    source = "index"
+    n_files = None
+    if not best:
+        table = score_directory(result_dir)
+        best = best_energy_per_ligand(table)
+        source = "scan"
+        n_files = len(table["file"])
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    results = [
+        {
+            "prefix": prefix,
+            "ligand_index": ligand,
+            "filename": filename,
+            "binding_energy": energy,
+            "binding_energy_pass": energy < threshold
+        }
+        for (prefix, ligand), (energy, filename) in sorted(best.items(), key=lambda item: (item[0][0] or "", item[0][1]))
+    ]
+    passed_count = sum(1 for item in results if item["binding_energy_pass"])
+    print(f"本地结合能评估完成（{source}）: {passed_count}/{len(results)} 个配体结合能小于 {threshold}，耗时 {elapsed_ms:.1f} ms")
+    return {
+        "status": "success",
+        "message": results,
+        "source": source,
+        "n_files": n_files,
+        "elapsed_ms": round(elapsed_ms, 3)
+    }
+
+def run_reflection(run_id, threshold=BINDING_ENERGY_THRESHOLD):
+    """按运行评估：结合能取本运行downloads目录中各配体的最低结合能（local_binding_energy），
+    构象评估结果取结果索引中本运行对该构象的posebusters评估（conformation_evaluation记录）
+
+    返回的每一项格式与后端/api/reflection相同；最低结合能构象未做过构象评估时posebusters_pass为None，视为未通过
+    """
+    energies = local_binding_energy(threshold=threshold, run_id=run_id)
+    if energies["status"] != "success":
+        return energies
+    posebusters = results_store.safe_record(results_store.posebusters_results, run_id) or {}
+
+    all_results = []
+    for item in energies["message"]:
+        posebusters_pass = posebusters.get(item["filename"])
+        all_results.append({
+            **item,
+            "posebusters_pass": posebusters_pass,
+            "overall_pass": "YES" if item["binding_energy_pass"] and posebusters_pass else "NO"
+        })
+    results_store.safe_record(results_store.record_reflection, all_results, run_id=run_id)
+
+    passed_count = sum(1 for item in all_results if item["overall_pass"] == "YES")
+    print(f"运行 {run_id} 评估完成: {passed_count}/{len(all_results)} 个配体通过所有评估指标")
+    return {
+        "status": "success",
+        "scope": "run",
+        "run_id": run_id,
+        "message": all_results
+    }
+
 def main():
-    logging.info("结果反馈服务器启动，使用stdio通信...")
-    mcp.run(transport="stdio")
+    run_server(mcp, "mol_reflection_server.py", "结果反馈服务器")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""PDBQT对接结果文件处理工具"""
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# AutoDock Vina: "REMARK VINA RESULT:    -7.3      0.000      0.000"
+VINA_RESULT_RE = re.compile(r"REMARK VINA RESULT:\s+(-?\d+\.?\d*)")
+# AutoDock-GPU: "USER    Estimated Free Energy of Binding    =   -6.51 kcal/mol"
+ADGPU_RESULT_RE = re.compile(r"Estimated Free Energy of Binding\s*=\s*(-?\d+\.?\d*)")
+# 对接结果文件命名: <pdb>_ligand_<i>_<pose>.pdbqt 或 <pdb>_ligand_<i>.pdbqt
+RESULT_FILE_RE = re.compile(r"_ligand_(\d+)(?:_(\d+))?\.pdbqt$")
+
+# 反馈阶段判定结合能合格的阈值：结合能需小于该值
+BINDING_ENERGY_THRESHOLD = -5
+
+# 漏斗对接：先用vina粗筛全部分子，再用adgpu精细对接排名靠前的分子，精细对接结果的受体名带"_refine"后缀
+FUNNEL_PRESCREEN_MODE = "vina"
+FUNNEL_REFINE_MODE = "adgpu"
+FUNNEL_REFINE_SUFFIX = "_refine"
+
+def parse_binding_energy(text: str):
+    """从PDBQT文本中提取第一个结合能（kcal/mol），未找到时返回None"""
+    match = VINA_RESULT_RE.search(text) or ADGPU_RESULT_RE.search(text)
+    return float(match.group(1)) if match else None
+
+def parse_result_filename(filename: str):
+    """从对接结果文件名中解析(配体序号, 构象序号)，不符合命名规则时返回(None, None)"""
+    match = RESULT_FILE_RE.search(os.path.basename(filename))
+    if not match:
+        return None, None
+    pose = int(match.group(2)) if match.group(2) is not None else None
+    return int(match.group(1)), pose
+
+def result_prefix(filename: str):
+    """对接结果文件名中"_ligand_"之前的部分（受体名，漏斗精细对接为"<受体>_refine"），不符合命名规则时返回None
+
+    同一目录中不同受体、不同对接批次的结果共用配体序号，按配体汇总时需要同时按前缀区分
+    """
+    name = os.path.basename(filename)
+    match = RESULT_FILE_RE.search(name)
+    return name[:match.start()] if match else None
+
+def funnel_tier_mode(filename: str):
+    """漏斗对接结果文件实际使用的对接模式：精细对接结果为FUNNEL_REFINE_MODE，其余为FUNNEL_PRESCREEN_MODE"""
+    prefix = result_prefix(filename)
+    if prefix and prefix.endswith(FUNNEL_REFINE_SUFFIX):
+        return FUNNEL_REFINE_MODE
+    return FUNNEL_PRESCREEN_MODE
+
+# 结合能记录位于文件头部的REMARK/USER行，只需扫描开头部分
+HEADER_SCAN_BYTES = 4096
+# 文件数超过该值时才使用进程池，避免小批量时的进程启动开销
+PARALLEL_MIN_FILES = 512
+
+_VINA_RESULT_BYTES_RE = re.compile(rb"REMARK VINA RESULT:\s+(-?\d+\.?\d*)")
+_ADGPU_RESULT_BYTES_RE = re.compile(rb"Estimated Free Energy of Binding\s*=\s*(-?\d+\.?\d*)")
+
+def read_binding_energy(path: str) -> float:
+    """通过内存映射读取PDBQT文件的结合能，优先只扫描文件头部，未找到时返回nan"""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return float("nan")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for window in (mm[:HEADER_SCAN_BYTES], mm) if size > HEADER_SCAN_BYTES else (mm[:],):
+                    match = _VINA_RESULT_BYTES_RE.search(window) or _ADGPU_RESULT_BYTES_RE.search(window)
+                    if match:
+                        return float(match.group(1))
+    except (OSError, ValueError):
+        pass
+    return float("nan")
+
+def _read_energies(paths):
+    return [read_binding_energy(path) for path in paths]
+
+def score_files(paths, max_workers: int = None) -> dict:
+    """批量提取PDBQT文件的结合能，文件较多时使用进程池并行
+
+    Returns:
+        dict: 列式分数表 {"file": 文件名列表, "prefix": 文件名前缀列表, "ligand": int32数组, "pose": int32数组,
+        "energy": float32数组}，无法从文件名解析的前缀记为None、序号记为-1，未找到结合能记为nan
+    """
+    paths = list(paths)
+    if len(paths) >= PARALLEL_MIN_FILES:
+        workers = max_workers or os.cpu_count() or 1
+        batch_size = max(64, len(paths) // (workers * 4) + 1)
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            energies = [energy for batch in executor.map(_read_energies, batches) for energy in batch]
+    else:
+        energies = _read_energies(paths)
+
+    ligands = np.full(len(paths), -1, dtype=np.int32)
+    poses = np.full(len(paths), -1, dtype=np.int32)
+    for idx, path in enumerate(paths):
+        ligand, pose = parse_result_filename(path)
+        if ligand is not None:
+            ligands[idx] = ligand
+            poses[idx] = pose if pose is not None else -1
+    return {
+        "file": [os.path.basename(path) for path in paths],
+        "prefix": [result_prefix(path) for path in paths],
+        "ligand": ligands,
+        "pose": poses,
+        "energy": np.array(energies, dtype=np.float32),
+    }
+
+def score_directory(directory: str, max_workers: int = None) -> dict:
+    """对目录中所有.pdbqt文件打分，返回格式同score_files"""
+    with os.scandir(directory) as entries:
+        paths = [entry.path for entry in entries if entry.name.endswith(".pdbqt") and entry.is_file()]
+    return score_files(paths, max_workers=max_workers)
+
+def best_energy_per_ligand(table: dict) -> dict:
+    """按配体汇总最低结合能: {(文件名前缀, 配体序号): (结合能, 文件名)}"""
+    best = {}
+    for name, prefix, ligand, energy in zip(table["file"], table["prefix"], table["ligand"].tolist(),
+                                            table["energy"].tolist()):
+        if ligand < 0 or np.isnan(energy):
+            continue
+        key = (prefix, ligand)
+        if key not in best or energy < best[key][0]:
+            # float32列转换回来会带有多余的尾数，按PDBQT的精度取整
+            best[key] = (round(energy, 3), name)
+    return best
+
+def select_top_poses(table: dict, top_n: int = None, per_ligand: bool = True, threshold: float = None) -> np.ndarray:
+    """按结合能从分数表中挑选构象
+
+    Args:
+        table: score_files返回的列式分数表
+        top_n: 保留结合能最低的构象数（可选，为空时不限数量）
+        per_ligand: 为True时每个配体（按文件名前缀和配体序号区分）各保留top_n个，否则在全部构象中保留top_n个
+        threshold: 结合能阈值（可选），只保留结合能小于该值的构象
+
+    Returns:
+        被选中构象在分数表中的下标，按结合能从低到高排列
+    """
+    energy = table["energy"]
+    candidates = np.flatnonzero(~np.isnan(energy))
+    if threshold is not None:
+        candidates = candidates[energy[candidates] < threshold]
+    candidates = candidates[np.argsort(energy[candidates], kind="stable")]
+    if top_n is None:
+        return candidates
+    if not per_ligand:
+        return candidates[:top_n]
+
+    # 按(文件名前缀, 配体序号)分组，无法解析配体序号的文件各自成组
+    group_ids = {}
+    groups = np.array([
+        group_ids.setdefault((prefix, ligand), len(group_ids)) if ligand >= 0 else -1 - idx
+        for idx, (prefix, ligand) in enumerate(zip(table["prefix"], table["ligand"].tolist()))
+    ], dtype=np.int64)[candidates]
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    group_start = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    rank = np.arange(len(order)) - np.repeat(group_start, np.diff(np.r_[group_start, len(order)]))
+    keep = np.zeros(len(candidates), dtype=bool)
+    keep[order[rank < top_n]] = True
+    return candidates[keep]
@@ -0,0 +1,116 @@
+"""受体口袋裁剪：只保留参考配体周围一定半径内的残基，减少上传数据量和后端的受体处理时间
+
+裁剪结果按(受体内容哈希, 参考配体, 半径)缓存，参考配体为SDF文件时哈希其内容而不是路径。
+"""
+import hashlib
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from sdf_utils import iter_sdf_records, parse_molblock
+
+POCKET_CACHE_DIR = Path(os.getenv("MOL_POCKET_CACHE_DIR", "/home/zhangfn/workflow/pocket_cache"))
+DEFAULT_POCKET_RADIUS = 10.0
+
+# "A:330"形式的残基标识：链ID:残基号
+RESIDUE_REF_RE = re.compile(r'^([A-Za-z0-9]):(-?\d+)$')
+
+def _residue_id(line: str) -> tuple:
+    """PDB原子行的残基标识: (链ID, 残基号, 插入码)"""
+    return line[21], line[22:26].strip(), line[26]
+
+def reference_coordinates(pdb_lines: list, ref_ligand: str):
+    """获取参考配体的坐标
+
+    Returns:
+        (coords, residue): coords为(M, 3)数组；ref_ligand为残基标识时residue为该残基在PDB中的标识，否则为None
+    """
+    match = RESIDUE_REF_RE.match(ref_ligand)
+    if match:
+        chain, resseq = match.groups()
+        coords = [
+            (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+            for line in pdb_lines
+            if line.startswith(("ATOM", "HETATM")) and line[21] == chain and line[22:26].strip() == resseq
+        ]
+        if not coords:
+            raise ValueError(f"受体中未找到参考残基: {ref_ligand}")
+        return np.array(coords), (chain, resseq)
+
+    if not ref_ligand.endswith('.sdf') or not os.path.exists(ref_ligand):
+        raise ValueError(f"参考配体必须是残基标识（如A:330）或存在的SDF文件: {ref_ligand}")
+    record = next(iter_sdf_records(ref_ligand), None)
+    atoms, _ = parse_molblock(record) if record else (None, None)
+    if not atoms:
+        raise ValueError(f"无法解析参考配体SDF文件: {ref_ligand}")
+    return np.array([atom[2:] for atom in atoms]), None
+
+def _cache_key(pdb_content: bytes, ref_ligand: str, radius: float) -> str:
+    digest = hashlib.sha256(pdb_content)
+    if os.path.exists(ref_ligand):
+        with open(ref_ligand, 'rb') as f:
+            digest.update(f.read())
+    else:
+        digest.update(ref_ligand.encode())
+    digest.update(f"{radius:.3f}".encode())
+    return digest.hexdigest()
+
+def crop_pocket(pdb_path, ref_ligand: str = "A:330", radius: float = DEFAULT_POCKET_RADIUS):
+    """裁剪受体口袋，返回裁剪后PDB文件的路径（命中缓存时直接返回缓存文件）
+
+    任一原子距参考配体原子不超过radius的残基整体保留；参考配体为残基标识时该残基本身总是保留，
+    以便后端仍能按残基标识定位参考配体。
+
+    Returns:
+        (cropped_path, stats): stats包含原始/保留的原子数、残基数和文件大小
+    """
+    pdb_path = Path(pdb_path)
+    pdb_content = pdb_path.read_bytes()
+    radius = float(radius)
+    cached_path = POCKET_CACHE_DIR / f"{pdb_path.stem}_{_cache_key(pdb_content, ref_ligand, radius)[:16]}.pdb"
+    if cached_path.exists():
+        return cached_path, {"cached": True, "original_bytes": len(pdb_content), "cropped_bytes": cached_path.stat().st_size}
+
+    lines = pdb_content.decode(errors="replace").splitlines(keepends=True)
+    ref_coords, ref_residue = reference_coordinates(lines, ref_ligand)
+
+    atom_lines = [idx for idx, line in enumerate(lines) if line.startswith(("ATOM", "HETATM"))]
+    coords = np.array([(float(lines[idx][30:38]), float(lines[idx][38:46]), float(lines[idx][46:54]))
+                       for idx in atom_lines]).reshape(-1, 3)
+    residues, residue_index = np.unique(
+        np.array(["|".join(_residue_id(lines[idx])) for idx in atom_lines]), return_inverse=True)
+
+    # 分块计算到参考配体的最近距离，避免大受体时距离矩阵过大
+    close = np.zeros(len(coords), dtype=bool)
+    for start in range(0, len(coords), 8192):
+        block = coords[start:start + 8192]
+        dist2 = ((block[:, None, :] - ref_coords[None, :, :]) ** 2).sum(axis=2)
+        close[start:start + 8192] = dist2.min(axis=1) <= radius ** 2
+    keep_residue = np.bincount(residue_index, weights=close, minlength=len(residues)) > 0
+    if ref_residue:
+        keep_residue |= np.array([name.split("|")[:2] == list(ref_residue) for name in residues])
+    keep_atom = keep_residue[residue_index]
+
+    kept_lines = set(np.array(atom_lines)[keep_atom].tolist())
+    output = [line for idx, line in enumerate(lines)
+              if idx in kept_lines or line.startswith(("CRYST1", "HEADER"))]
+    output.append("END\n")
+
+    POCKET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # 先写临时文件再改名，避免并发请求读到写了一半的缓存
+    temp_path = cached_path.with_suffix(f".{os.getpid()}.tmp")
+    temp_path.write_text("".join(output))
+    os.replace(temp_path, cached_path)
+
+    stats = {
+        "cached": False,
+        "original_atoms": len(atom_lines),
+        "kept_atoms": int(keep_atom.sum()),
+        "original_residues": len(residues),
+        "kept_residues": int(keep_residue.sum()),
+        "original_bytes": len(pdb_content),
+        "cropped_bytes": cached_path.stat().st_size,
+    }
+    return cached_path, stats
@@ -0,0 +1,80 @@
+"""对接构象分析：按配体对构象做RMSD聚类，只把每个簇的代表构象送去评估"""
+import os
+
+import numpy as np
+
+from pdbqt_utils import parse_result_filename, result_prefix, read_binding_energy
+
+DEFAULT_RMSD_CUTOFF = 1.0
+
+def load_pose_coordinates(path: str) -> np.ndarray:
+    """读取PDBQT文件中第一个MODEL的重原子坐标，返回(N, 3)数组"""
+    coords = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("ENDMDL"):
+                break
+            if line.startswith(("ATOM", "HETATM")):
+                # 第77-79列为AutoDock原子类型，跳过极性氢(HD)和非极性氢(H)
+                if line[77:79].strip() in ("H", "HD", "HS"):
+                    continue
+                coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    return np.array(coords, dtype=np.float64).reshape(-1, 3)
+
+def pairwise_rmsd(coords: np.ndarray) -> np.ndarray:
+    """计算同一配体各构象两两之间的RMSD（原位比较，不做叠合）
+
+    Args:
+        coords: (P, N, 3)数组，P个构象、每个构象N个原子且原子顺序一致
+
+    Returns:
+        (P, P) RMSD矩阵
+    """
+    flat = coords.reshape(len(coords), -1)
+    sq = (flat ** 2).sum(axis=1)
+    dist2 = sq[:, None] + sq[None, :] - 2.0 * flat @ flat.T
+    return np.sqrt(np.maximum(dist2, 0.0) / coords.shape[1])
+
+def cluster_poses(rmsd: np.ndarray, order: np.ndarray, cutoff: float) -> np.ndarray:
+    """按给定顺序（通常为结合能从低到高）做贪心聚类，返回每个构象所属簇代表的下标"""
+    representative = np.full(len(rmsd), -1, dtype=np.int64)
+    for idx in order:
+        if representative[idx] >= 0:
+            continue
+        members = (representative < 0) & (rmsd[idx] <= cutoff)
+        representative[members] = idx
+    return representative
+
+def cluster_pose_files(pose_files, cutoff: float = DEFAULT_RMSD_CUTOFF) -> dict:
+    """将对接结果文件按配体分组并做RMSD聚类
+
+    配体按(所在目录, 文件名前缀, 配体序号)区分，不同受体或漏斗精细对接中序号相同的配体不会互相聚类；
+    原子数不一致（不同配体或解析失败）的构象也不会被合并到同一个簇。
+
+    Returns:
+        dict: {构象文件: 所属簇代表构象文件}，代表构象映射到自身
+    """
+    groups = {}
+    for path in pose_files:
+        ligand_index, _ = parse_result_filename(path)
+        key = (os.path.dirname(path), result_prefix(path), ligand_index) if ligand_index is not None else path
+        groups.setdefault(key, []).append(path)
+
+    membership = {}
+    for paths in groups.values():
+        coords = [load_pose_coordinates(path) for path in paths]
+        # 按原子数再分组，保证同组构象的坐标可以直接比较
+        by_size = {}
+        for path, xyz in zip(paths, coords):
+            by_size.setdefault(len(xyz), []).append((path, xyz))
+        for n_atoms, items in by_size.items():
+            if n_atoms == 0 or len(items) == 1:
+                membership.update({path: path for path, _ in items})
+                continue
+            group_paths = [path for path, _ in items]
+            rmsd = pairwise_rmsd(np.stack([xyz for _, xyz in items]))
+            energies = np.array([read_binding_energy(path) for path in group_paths])
+            order = np.argsort(np.where(np.isnan(energies), np.inf, energies), kind="stable")
+            representative = cluster_poses(rmsd, order, cutoff)
+            membership.update({path: group_paths[rep] for path, rep in zip(group_paths, representative)})
+    return membership
@@ -0,0 +1,207 @@
+"""生成分子的向量化预筛选：在对接前按SDF中可直接计算的描述符剔除明显不合格的分子
+
+整个SDF文件以字节数组读入，按V2000定宽格式用下标运算批量提取原子/键信息，
+描述符（重原子数、分子量、片段数）对整批分子一次性计算。
+"""
+import time
+
+import numpy as np
+
+DEFAULT_RULES = {
+    "min_heavy_atoms": 8,
+    "max_heavy_atoms": 70,
+    "max_fragments": 1,
+    "min_mol_weight": 120.0,
+    "max_mol_weight": 700.0,
+}
+
+# 元素 -> (原子量, 默认价态)，价态用于估算隐式氢
+ELEMENTS = {
+    "H": (1.008, 1), "B": (10.81, 3), "C": (12.011, 4), "N": (14.007, 3), "O": (15.999, 2),
+    "F": (18.998, 1), "Si": (28.085, 4), "P": (30.974, 3), "S": (32.06, 2), "Cl": (35.45, 1),
+    "Se": (78.971, 2), "Br": (79.904, 1), "I": (126.904, 1), "Na": (22.990, 0), "K": (39.098, 0),
+    "Mg": (24.305, 0), "Ca": (40.078, 0), "Zn": (65.38, 0), "Fe": (55.845, 0),
+}
+
+def _element_code(symbol: str) -> int:
+    padded = (symbol + "  ")[:2].encode()
+    return padded[0] * 256 + (padded[1] if padded[1] != 32 else 0)
+
+_CODES = np.array(sorted(_element_code(symbol) for symbol in ELEMENTS), dtype=np.int64)
+_CODE_TO_SYMBOL = {_element_code(symbol): symbol for symbol in ELEMENTS}
+_MASSES = np.array([ELEMENTS[_CODE_TO_SYMBOL[code]][0] for code in _CODES])
+_VALENCES = np.array([ELEMENTS[_CODE_TO_SYMBOL[code]][1] for code in _CODES])
+_H_CODE = _element_code("H")
+_WHITESPACE = np.frombuffer(b" \t\r\n", dtype=np.uint8)
+
+def _gather(buf, starts, offset, width):
+    """取每行第offset列起的width个字节，返回(N, width)数组（V2000各行长度足够，只需防止越过文件末尾）"""
+    idx = np.minimum(starts[:, None] + (offset + np.arange(width))[None, :], len(buf) - 1)
+    return buf[idx]
+
+def _fixed_int(chars):
+    """将右对齐的定宽整数字段批量转换为整数（非数字字符按0处理）"""
+    digits = chars.astype(np.int32) - 48
+    digits[(digits < 0) | (digits > 9)] = 0
+    return digits @ (10 ** np.arange(chars.shape[1] - 1, -1, -1, dtype=np.int32))
+
+def load_sdf_batch(path: str) -> dict:
+    """把整个SDF文件批量解析为NumPy数组
+
+    Returns:
+        dict: record_start/record_end为每条记录的字节范围，n_atoms/n_bonds为每条记录的原子/键数，
+        atom_record/atom_code为每个原子所属记录及元素编码，bond_a/bond_b/bond_order为全局原子序号表示的键
+    """
+    buf = np.fromfile(path, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == 10)
+    line_starts = np.concatenate(([0], newlines + 1))
+    if len(buf) == 0 or buf[-1] == 10:
+        line_starts = line_starts[:-1]
+
+    # $$$$ 分隔行：只检查行首为$的位置
+    dollar = line_starts[buf[np.minimum(line_starts, len(buf) - 1)] == ord("$")]
+    is_delim = (_gather(buf, dollar, 0, 4) == ord("$")).all(axis=1)
+    delim_lines = np.searchsorted(line_starts, dollar[is_delim])
+    record_first_line = np.concatenate(([0], delim_lines[:-1] + 1)) if len(delim_lines) else np.zeros(0, dtype=np.int64)
+    record_end = np.append(line_starts, len(buf))[delim_lines + 1]
+    # 与sdf_utils.iter_sdf_records一致：最后一条记录缺少$$$$时仍算作一条记录
+    tail_line = delim_lines[-1] + 1 if len(delim_lines) else 0
+    tail_start = line_starts[tail_line] if tail_line < len(line_starts) else len(buf)
+    if np.isin(buf[tail_start:], _WHITESPACE, invert=True).any():
+        record_first_line = np.append(record_first_line, tail_line)
+        record_end = np.append(record_end, len(buf))
+    record_start = line_starts[record_first_line]
+
+    # 计数行（第4行）中的原子数和键数
+    counts_line = record_first_line + 3
+    counts_starts = line_starts[np.minimum(counts_line, len(line_starts) - 1)]
+    n_atoms = _fixed_int(_gather(buf, counts_starts, 0, 3))
+    n_bonds = _fixed_int(_gather(buf, counts_starts, 3, 3))
+
+    n_records = len(record_start)
+    atom_offset = np.concatenate(([0], np.cumsum(n_atoms)[:-1])).astype(np.int64)
+    atom_record = np.repeat(np.arange(n_records), n_atoms)
+    atom_line = np.repeat(counts_line + 1 - atom_offset, n_atoms) + np.arange(n_atoms.sum())
+    element_chars = _gather(buf, line_starts[np.minimum(atom_line, len(line_starts) - 1)], 31, 2).astype(np.int64)
+    second = np.where((element_chars[:, 1] == 32) | (element_chars[:, 1] == 0), 0, element_chars[:, 1])
+    atom_code = element_chars[:, 0] * 256 + second
+
+    bond_offset = np.concatenate(([0], np.cumsum(n_bonds)[:-1])).astype(np.int64)
+    bond_record = np.repeat(np.arange(n_records), n_bonds)
+    bond_line = np.repeat(counts_line + 1 + n_atoms - bond_offset, n_bonds) + np.arange(n_bonds.sum())
+    bond_chars = _gather(buf, line_starts[np.minimum(bond_line, len(line_starts) - 1)], 0, 9)
+    bond_a = _fixed_int(bond_chars[:, 0:3]) - 1 + atom_offset[bond_record]
+    bond_b = _fixed_int(bond_chars[:, 3:6]) - 1 + atom_offset[bond_record]
+    bond_order = _fixed_int(bond_chars[:, 6:9])
+
+    return {
+        "buf": buf,
+        "record_start": record_start,
+        "record_end": record_end,
+        "n_atoms": n_atoms,
+        "n_bonds": n_bonds,
+        "atom_record": atom_record,
+        "atom_code": atom_code,
+        "bond_a": bond_a,
+        "bond_b": bond_b,
+        "bond_order": bond_order,
+    }
+
+def _count_fragments(n_records, atom_record, is_heavy, bond_a, bond_b):
+    """用标签传播+指针跳跃批量计算每条记录的重原子连通片段数"""
+    labels = np.arange(len(atom_record))
+    keep = is_heavy[bond_a] & is_heavy[bond_b]
+    a, b = bond_a[keep], bond_b[keep]
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, a, low)
+        np.minimum.at(new_labels, b, low)
+        new_labels = new_labels[new_labels[new_labels]]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    roots = is_heavy & (labels == np.arange(len(labels)))
+    return np.bincount(atom_record[roots], minlength=n_records)
+
+def compute_descriptors(batch: dict) -> dict:
+    """对整批分子计算重原子数、分子量（含估算的隐式氢）和重原子片段数"""
+    n_records = len(batch["record_start"])
+    atom_record = batch["atom_record"]
+    codes = batch["atom_code"]
+
+    pos = np.clip(np.searchsorted(_CODES, codes), 0, len(_CODES) - 1)
+    known = _CODES[pos] == codes
+    masses = np.where(known, _MASSES[pos], 0.0)
+    valences = np.where(known, _VALENCES[pos], 0)
+    is_heavy = codes != _H_CODE
+
+    # 隐式氢 = 默认价态 - 已成键级数之和（芳香键按1.5计）
+    bond_valence = np.where(batch["bond_order"] == 4, 1.5, batch["bond_order"]).astype(float)
+    used = np.bincount(batch["bond_a"], weights=bond_valence, minlength=len(codes)) \
+        + np.bincount(batch["bond_b"], weights=bond_valence, minlength=len(codes))
+    implicit_h = np.where(is_heavy, np.maximum(valences - np.round(used), 0), 0)
+
+    heavy_atoms = np.bincount(atom_record, weights=is_heavy, minlength=n_records).astype(int)
+    mol_weight = np.bincount(atom_record, weights=masses + implicit_h * ELEMENTS["H"][0], minlength=n_records)
+    fragments = _count_fragments(n_records, atom_record, is_heavy, batch["bond_a"], batch["bond_b"])
+    unknown = np.bincount(atom_record, weights=~known, minlength=n_records).astype(int)
+
+    return {
+        "heavy_atoms": heavy_atoms,
+        "mol_weight": mol_weight,
+        "fragments": fragments,
+        "unknown_elements": unknown,
+    }
+
+def rule_violations(descriptors: dict, rules: dict = None) -> dict:
+    """返回每条规则不满足的布尔掩码: {规则名: 掩码}"""
+    rules = {**DEFAULT_RULES, **(rules or {})}
+    heavy = descriptors["heavy_atoms"]
+    weight = descriptors["mol_weight"]
+    return {
+        "heavy_atoms": (heavy < rules["min_heavy_atoms"]) | (heavy > rules["max_heavy_atoms"]),
+        "fragments": descriptors["fragments"] > rules["max_fragments"],
+        "mol_weight": (weight < rules["min_mol_weight"]) | (weight > rules["max_mol_weight"]),
+    }
+
+def apply_rules(descriptors: dict, rules: dict = None) -> np.ndarray:
+    """按规则返回保留分子的布尔掩码"""
+    violations = rule_violations(descriptors, rules)
+    return ~np.logical_or.reduce(list(violations.values()))
+
+def prefilter_sdf(ligand_path: str, output_path: str, rules: dict = None):
+    """预筛选SDF文件，把通过规则的分子写入output_path
+
+    Returns:
+        (stats, kept_indices): 筛选统计（含各阶段耗时）和保留分子在原文件中的序号
+    """
+    timings = {}
+    start = time.perf_counter()
+    batch = load_sdf_batch(ligand_path)
+    timings["parse_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    descriptors = compute_descriptors(batch)
+    violations = rule_violations(descriptors, rules)
+    keep = ~np.logical_or.reduce(list(violations.values()))
+    timings["filter_ms"] = (time.perf_counter() - start) * 1000
+
+    buf = batch["buf"]
+    with open(output_path, "wb") as out:
+        for begin, end in zip(batch["record_start"][keep], batch["record_end"][keep]):
+            record = buf[begin:end].tobytes()
+            if end == len(buf) and record.rstrip().splitlines()[-1].strip() != b"$$$$":
+                # 缺少$$$$的最后一条记录写出时补齐
+                record = record.rstrip(b"\r\n") + b"\n$$$$\n"
+            out.write(record)
+
+    kept_indices = np.flatnonzero(keep).tolist()
+    stats = {
+        "total": int(len(keep)),
+        "kept": len(kept_indices),
+        "rejected": int(len(keep) - len(kept_indices)),
+        "rejected_by_rule": {name: int(mask.sum()) for name, mask in violations.items()},
+        "timings": {name: round(value, 3) for name, value in timings.items()},
+    }
+    return stats, kept_indices
@@ -0,0 +1,91 @@
+"""长时间运行的工具的进度通知：工具在工作线程中执行，每完成一个分块/分片/文件就向客户端发送进度和阶段性结果
+
+阶段性结果通过MCP日志通知发送（logger为PROGRESS_LOGGER，data为字典），客户端在logging_callback中即可收到，
+不依赖客户端在请求中携带progressToken；客户端携带了progressToken时同时发送标准的进度通知。
+在本进程内调用（没有请求上下文）时不发送任何通知，工具行为不变。
+"""
+import asyncio
+import functools
+import inspect
+import threading
+
+from mcp.server.fastmcp import Context
+
+PROGRESS_LOGGER = "mol_progress"
+
+class ProgressReporter:
+    """线程安全的进度汇报器，通知由工具所在的事件循环异步发送，汇报方不等待发送完成"""
+
+    def __init__(self, tool: str, ctx: Context = None, loop=None):
+        self.tool = tool
+        self.loop = loop
+        self.session = None
+        self.progress_token = None
+        self.completed = 0
+        self._lock = threading.Lock()
+        try:
+            request_context = ctx.request_context if ctx is not None else None
+        except ValueError:
+            # 本进程内调用时没有请求上下文
+            request_context = None
+        if request_context is not None:
+            self.session = request_context.session
+            meta = request_context.meta
+            self.progress_token = meta.progressToken if meta else None
+
+    def advance(self, total=None, message: str = "", partial=None, step: int = 1):
+        """完成step个单位的工作，partial为这部分工作的结果（需可JSON序列化）"""
+        with self._lock:
+            self.completed += step
+            progress = self.completed
+        self.report(progress, total, message, partial)
+
+    def report(self, progress, total=None, message: str = "", partial=None):
+        if self.session is None:
+            return
+        data = {"tool": self.tool, "progress": progress, "total": total, "message": message}
+        if partial is not None:
+            data["partial"] = partial
+        self._send(self.session.send_log_message(level="info", data=data, logger=PROGRESS_LOGGER))
+        if self.progress_token is not None:
+            self._send(self.session.send_progress_notification(self.progress_token, progress, total))
+
+    def _send(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        # 客户端已断开等发送失败不影响工具本身的执行
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+def with_progress(func):
+    """把带progress参数的同步工具函数包装为异步MCP工具
+
+    包装后的工具在工作线程中执行，不阻塞服务器的事件循环，进度通知可以在工具执行期间实时发出；
+    工具的参数结构中progress参数替换为FastMCP注入的Context，对客户端不可见。
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, ctx: Context = None, **kwargs):
+        reporter = ProgressReporter(func.__name__, ctx, asyncio.get_running_loop())
+        return await asyncio.to_thread(func, *args, progress=reporter, **kwargs)
+
+    signature = inspect.signature(func)
+    params = [param for name, param in signature.parameters.items() if name != "progress"]
+    params.append(inspect.Parameter("ctx", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Context))
+    wrapper.__signature__ = signature.replace(parameters=params)
+    return wrapper
+
+def print_progress(server_name: str, data: dict):
+    """默认的阶段性结果处理：在终端打印进度"""
+    total = f"/{data['total']}" if data.get("total") else ""
+    print(f"\033[96m[{server_name}] {data.get('tool')} 进度 {data.get('progress')}{total}: {data.get('message')}\033[0m")
+
+def progress_logging_callback(server_name: str, on_progress=None):
+    """创建ClientSession的logging_callback：收到阶段性结果时调用on_progress(server_name, data)，默认打印进度
+
+    on_progress在客户端的事件循环中同步调用，可以据此提前开始下游处理（如对已完成分块的构象做后续分析）
+    """
+    handler = on_progress or print_progress
+
+    async def callback(params):
+        if params.logger == PROGRESS_LOGGER and isinstance(params.data, dict):
+            handler(server_name, params.data)
+
+    return callback
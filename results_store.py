@@ -0,0 +1,308 @@
+"""本地结果索引：用SQLite记录分子、对接构象、结合能和评估结果，供各阶段按索引查询
+
+表结构: runs -> molecules -> poses -> scores / evals，另有refs记录参考配体文件与构象的对应关系。
+各服务器进程共用同一个数据库文件，使用WAL模式以支持并发读写。
+"""
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from pdbqt_utils import parse_result_filename, result_prefix, score_files
+from sdf_utils import iter_sdf_records
+from dir_index import get_index
+
+RESULTS_DB = Path(os.getenv("MOL_RESULTS_DB", "/home/zhangfn/workflow/results.db"))
+DEFAULT_RUN_ID = "default"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS molecules (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    round INTEGER,
+    sdf_path TEXT NOT NULL,
+    mol_index INTEGER NOT NULL,
+    title TEXT,
+    UNIQUE (sdf_path, mol_index)
+);
+CREATE TABLE IF NOT EXISTS poses (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    round INTEGER,
+    molecule_id INTEGER REFERENCES molecules(id),
+    file TEXT NOT NULL,
+    path TEXT,
+    receptor TEXT,
+    dock_mode TEXT,
+    ligand_index INTEGER,
+    pose_index INTEGER,
+    UNIQUE (run_id, file)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    pose_id INTEGER PRIMARY KEY REFERENCES poses(id),
+    energy REAL
+);
+CREATE TABLE IF NOT EXISTS evals (
+    pose_id INTEGER NOT NULL REFERENCES poses(id),
+    source TEXT NOT NULL,
+    status TEXT,
+    binding_energy_pass INTEGER,
+    posebusters_pass INTEGER,
+    overall_pass INTEGER,
+    detail TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (pose_id, source)
+);
+CREATE TABLE IF NOT EXISTS refs (
+    path TEXT PRIMARY KEY,
+    pose_id INTEGER REFERENCES poses(id),
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_molecules_run ON molecules (run_id, round);
+CREATE INDEX IF NOT EXISTS idx_poses_run ON poses (run_id, round);
+CREATE INDEX IF NOT EXISTS idx_poses_ligand ON poses (run_id, ligand_index);
+CREATE INDEX IF NOT EXISTS idx_poses_path ON poses (path);
+CREATE INDEX IF NOT EXISTS idx_poses_run_path ON poses (run_id, path);
+CREATE INDEX IF NOT EXISTS idx_scores_energy ON scores (energy);
+CREATE INDEX IF NOT EXISTS idx_evals_pass ON evals (overall_pass);
+CREATE INDEX IF NOT EXISTS idx_refs_pose ON refs (pose_id);
+"""
+
+# 参考配体文件名去掉该后缀后与对接构象文件名对应，如3rfm_ligand_0_1_processed.sdf -> 3rfm_ligand_0_1.pdbqt
+REF_SUFFIX_RE = re.compile(r"_processed$")
+
+def connect(db_path=None) -> sqlite3.Connection:
+    """打开结果数据库，首次使用时建表"""
+    db_path = Path(db_path or RESULTS_DB)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+@contextmanager
+def transaction(db_path=None):
+    """打开结果数据库并在一个事务中执行，正常结束时提交、异常时回滚，最后关闭连接"""
+    conn = connect(db_path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def safe_record(func, *args, **kwargs):
+    """写入结果索引失败时只打印警告，不影响调用方的计算结果"""
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        print(f"写入结果索引失败: {str(e)}")
+        return None
+
+def _ensure_run(conn, run_id):
+    conn.execute("INSERT OR IGNORE INTO runs (run_id, created_at) VALUES (?, ?)", (run_id, time.time()))
+
+def _pass_flag(value):
+    """把后端返回的"YES"/"NO"/布尔值统一为1/0，未知时为None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return 1 if value.upper() in ("YES", "TRUE") else 0
+    return int(bool(value))
+
+def record_molecules(sdf_path, run_id=None, round_index=None) -> int:
+    """记录生成的SDF文件中的分子，返回记录的分子数"""
+    run_id = run_id or DEFAULT_RUN_ID
+    sdf_path = str(sdf_path)
+    rows = [(run_id, round_index, sdf_path, idx, record.split("\n", 1)[0].strip())
+            for idx, record in enumerate(iter_sdf_records(sdf_path))]
+    with transaction() as conn:
+        _ensure_run(conn, run_id)
+        conn.executemany(
+            "INSERT INTO molecules (run_id, round, sdf_path, mol_index, title) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (sdf_path, mol_index) DO UPDATE SET run_id = excluded.run_id, round = excluded.round, title = excluded.title",
+            rows)
+    return len(rows)
+
+def record_poses(pose_paths, receptor=None, dock_mode=None, ligand_sdf=None, kept_indices=None,
+                 run_id=None, round_index=None) -> int:
+    """记录对接构象及其结合能
+
+    Args:
+        pose_paths: 本地对接结果文件路径列表
+        ligand_sdf: 对接使用的原始配体SDF路径（可选），用于关联molecules表
+        kept_indices: 实际对接的分子在原始SDF中的序号（可选，对接前有过滤时传入）
+    """
+    run_id = run_id or DEFAULT_RUN_ID
+    pose_paths = [str(path) for path in pose_paths if os.path.exists(path)]
+    table = score_files(pose_paths)
+    with transaction() as conn:
+        _ensure_run(conn, run_id)
+        molecule_ids = {}
+        if ligand_sdf:
+            molecule_ids = dict(conn.execute(
+                "SELECT mol_index, id FROM molecules WHERE sdf_path = ?", (str(ligand_sdf),)).fetchall())
+        for path, ligand, pose, energy in zip(pose_paths, table["ligand"].tolist(),
+                                              table["pose"].tolist(), table["energy"].tolist()):
+            mol_index = ligand if kept_indices is None or ligand < 0 else kept_indices[ligand]
+            pose_id = conn.execute(
+                "INSERT INTO poses (run_id, round, molecule_id, file, path, receptor, dock_mode, ligand_index, pose_index) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, file) DO UPDATE SET round = excluded.round, "
+                "molecule_id = excluded.molecule_id, path = excluded.path, receptor = excluded.receptor, "
+                "dock_mode = excluded.dock_mode, ligand_index = excluded.ligand_index, pose_index = excluded.pose_index "
+                "RETURNING id",
+                (run_id, round_index, molecule_ids.get(mol_index), os.path.basename(path), path, receptor, dock_mode,
+                 ligand if ligand >= 0 else None, pose if pose >= 0 else None)).fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO scores (pose_id, energy) VALUES (?, ?)",
+                         (pose_id, None if energy != energy else round(energy, 3)))
+            # 重新对接后旧的评估结果不再有效
+            conn.execute("DELETE FROM evals WHERE pose_id = ?", (pose_id,))
+    return len(pose_paths)
+
+def _pose_id(conn, filename, run_id):
+    """按文件名查找构象，未记录过的构象补建一条记录"""
+    filename = os.path.basename(filename)
+    row = conn.execute("SELECT id FROM poses WHERE run_id = ? AND file = ?", (run_id, filename)).fetchone()
+    if row:
+        return row[0]
+    ligand, pose = parse_result_filename(filename)
+    _ensure_run(conn, run_id)
+    return conn.execute(
+        "INSERT INTO poses (run_id, file, ligand_index, pose_index) VALUES (?, ?, ?, ?) RETURNING id",
+        (run_id, filename, ligand, pose)).fetchone()[0]
+
+def record_evaluations(results, source="posebusters", run_id=None) -> int:
+    """记录构象评估结果（conformation_evaluation返回的results列表）"""
+    run_id = run_id or DEFAULT_RUN_ID
+    now = time.time()
+    with transaction() as conn:
+        for item in results:
+            pose_id = _pose_id(conn, item["file"], run_id)
+            posebusters_pass = 0 if item.get("status") == "rejected" else _pass_flag(item.get("posebusters_pass"))
+            conn.execute(
+                "INSERT OR REPLACE INTO evals (pose_id, source, status, posebusters_pass, detail, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (pose_id, source, item.get("status"), posebusters_pass, json.dumps(item, ensure_ascii=False), now))
+    return len(results)
+
+def record_reflection(items, run_id=None) -> int:
+    """记录结果反馈阶段每个构象的结合能和是否通过评估"""
+    run_id = run_id or DEFAULT_RUN_ID
+    now = time.time()
+    with transaction() as conn:
+        for item in items:
+            filename = item.get("filename")
+            if not filename:
+                continue
+            pose_id = _pose_id(conn, filename, run_id)
+            energy = item.get("binding_energy")
+            if isinstance(energy, (int, float)):
+                conn.execute("INSERT OR REPLACE INTO scores (pose_id, energy) VALUES (?, ?)", (pose_id, energy))
+            conn.execute(
+                "INSERT OR REPLACE INTO evals (pose_id, source, status, binding_energy_pass, posebusters_pass, "
+                "overall_pass, detail, created_at) VALUES (?, 'reflection', 'success', ?, ?, ?, ?, ?)",
+                (pose_id, _pass_flag(item.get("binding_energy_pass")), _pass_flag(item.get("posebusters_pass")),
+                 _pass_flag(item.get("overall_pass")), json.dumps(item, ensure_ascii=False), now))
+    return len(items)
+
+def posebusters_results(run_id=None) -> dict:
+    """查询运行中各构象的posebusters评估是否通过: {文件名: True/False/None}，None表示结果未知"""
+    run_id = run_id or DEFAULT_RUN_ID
+    with transaction() as conn:
+        rows = conn.execute("""
+            SELECT poses.file, evals.posebusters_pass FROM poses
+            JOIN evals ON evals.pose_id = poses.id AND evals.source = 'posebusters'
+            WHERE poses.run_id = ?
+        """, (run_id,)).fetchall()
+    return {file: None if passed is None else bool(passed) for file, passed in rows}
+
+def index_references(ref_dir) -> int:
+    """把参考配体目录中的SDF文件登记到refs表，并按文件名关联到对应的对接构象"""
+    paths = get_index(ref_dir).files(".sdf")
+    now = time.time()
+    with transaction() as conn:
+        for path in paths:
+            stem = REF_SUFFIX_RE.sub("", os.path.splitext(os.path.basename(path))[0])
+            # 不同运行可能有同名构象，取最近记录的一条
+            row = conn.execute("SELECT id FROM poses WHERE file = ? ORDER BY id DESC LIMIT 1", (f"{stem}.pdbqt",)).fetchone()
+            conn.execute(
+                "INSERT INTO refs (path, pose_id, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET pose_id = COALESCE(excluded.pose_id, refs.pose_id)",
+                (path, row[0] if row else None, now))
+    return len(paths)
+
+# 每个参考配体目录上次登记时的SDF文件列表
+_indexed_references = {}
+
+BEST_REFERENCE_SQL = """
+SELECT refs.path FROM refs
+LEFT JOIN scores ON scores.pose_id = refs.pose_id
+LEFT JOIN evals ON evals.pose_id = refs.pose_id AND evals.source = 'reflection'
+WHERE refs.path LIKE ? || '%'
+ORDER BY COALESCE(evals.overall_pass, 0) DESC, scores.energy IS NULL, scores.energy ASC, refs.created_at DESC
+"""
+
+def best_reference(ref_dir):
+    """按索引查询最佳参考配体：优先通过评估的构象，其次结合能最低
+
+    目录中的SDF文件集合与上次登记时不同（如反馈轮次新增了参考配体）时先重新登记，
+    文件列表来自目录索引，目录未变化时不重复登记
+
+    Returns:
+        参考配体SDF路径，目录中没有SDF文件时返回None
+    """
+    directory = os.path.abspath(str(ref_dir))
+    current = tuple(get_index(directory).files(".sdf"))
+    if not current:
+        return None
+    if _indexed_references.get(directory) != current:
+        index_references(directory)
+        _indexed_references[directory] = current
+    prefix = os.path.join(directory, "")
+    with transaction() as conn:
+        candidates = [row[0] for row in conn.execute(BEST_REFERENCE_SQL, (prefix,))]
+    existing = set(current)
+    return next((path for path in candidates if path in existing), None)
+
+def best_energy_by_directory(result_dir, run_id=None):
+    """按索引汇总目录中各配体的最低结合能，格式同pdbqt_utils.best_energy_per_ligand: {(文件名前缀, 配体序号): (结合能, 文件名)}
+
+    只使用本运行中、目录里当前仍存在的构象文件的记录（已删除文件的旧记录不参与汇总）；
+    目录中有文件没有记录时返回None，由调用方扫描目录，保证结果与扫描一致
+
+    Returns:
+        汇总结果，索引不完整时返回None
+    """
+    run_id = run_id or DEFAULT_RUN_ID
+    directory = os.path.abspath(str(result_dir))
+    current = set(get_index(directory).files(".pdbqt"))
+    if not current:
+        return None
+    # 用范围条件代替LIKE前缀匹配，可以使用(run_id, path)索引；"/"的下一个字符是"0"
+    low = os.path.join(directory, "")
+    high = low[:-1] + chr(ord(os.sep) + 1)
+    with transaction() as conn:
+        rows = conn.execute("""
+            SELECT poses.path, poses.ligand_index, scores.energy, poses.file
+            FROM poses LEFT JOIN scores ON scores.pose_id = poses.id
+            WHERE poses.run_id = ? AND poses.path >= ? AND poses.path < ?
+        """, (run_id, low, high)).fetchall()
+    rows = [row for row in rows if row[0] in current]
+    if len({row[0] for row in rows}) < len(current):
+        return None
+    best = {}
+    for _, ligand, energy, file in rows:
+        if ligand is None or energy is None:
+            continue
+        key = (result_prefix(file), ligand)
+        if key not in best or energy < best[key][0]:
+            best[key] = (energy, file)
+    return best
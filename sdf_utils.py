@@ -0,0 +1,87 @@
+"""SDF文件处理工具"""
+
+SDF_DELIMITER = "$$$$"
+
+def _iter_records(lines):
+    """从逐行迭代器中按$$$$切分记录，每条记录以"$$$$\\n"结尾"""
+    record = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.strip() == SDF_DELIMITER:
+            yield "\n".join(record) + "\n" + SDF_DELIMITER + "\n"
+            record = []
+        else:
+            record.append(line)
+    # 最后一条记录缺少$$$$时补齐
+    if any(line.strip() for line in record):
+        yield "\n".join(record) + "\n" + SDF_DELIMITER + "\n"
+
+def split_sdf_records(text: str) -> list:
+    """将多分子SDF文本按$$$$拆分为记录列表，每条记录以"$$$$\\n"结尾"""
+    return list(_iter_records(text.splitlines()))
+
+def iter_sdf_records(path: str):
+    """流式读取SDF文件中的记录，不会一次性加载整个文件"""
+    with open(path, "r") as f:
+        yield from _iter_records(f)
+
+def iter_sdf_chunks(path: str, chunk_size: int):
+    """流式读取SDF文件，每次产出最多chunk_size条记录组成的列表"""
+    chunk = []
+    for record in iter_sdf_records(path):
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def merge_sdf_records(records: list, title_prefix: str = None) -> str:
+    """合并SDF记录，title_prefix不为空时将每条记录的标题行重写为"<title_prefix>_<序号>"以获得稳定编号"""
+    merged = []
+    for idx, record in enumerate(records):
+        if title_prefix:
+            _, _, rest = record.partition("\n")
+            record = f"{title_prefix}_{idx}\n{rest}"
+        merged.append(record)
+    return "".join(merged)
+
+# V2000原子块中旧式电荷字段的编码
+_LEGACY_CHARGES = {1: 3, 2: 2, 3: 1, 5: -1, 6: -2, 7: -3}
+
+def parse_molblock(record: str):
+    """解析V2000格式的单条SDF记录
+
+    Returns:
+        (atoms, bonds): atoms为[(元素, 形式电荷, x, y, z)]，bonds为[(原子序号1, 原子序号2, 键级)]，序号从0开始
+        记录无法解析时返回(None, None)
+    """
+    lines = record.splitlines()
+    if len(lines) < 4 or "V3000" in lines[3]:
+        return None, None
+    try:
+        n_atoms = int(lines[3][0:3])
+        n_bonds = int(lines[3][3:6])
+        atoms = []
+        for line in lines[4:4 + n_atoms]:
+            charge_code = int(line[36:39]) if len(line) >= 39 and line[36:39].strip() else 0
+            atoms.append((line[31:34].strip(), _LEGACY_CHARGES.get(charge_code, 0),
+                          float(line[0:10]), float(line[10:20]), float(line[20:30])))
+        bonds = []
+        for line in lines[4 + n_atoms:4 + n_atoms + n_bonds]:
+            bonds.append((int(line[0:3]) - 1, int(line[3:6]) - 1, int(line[6:9])))
+    except (ValueError, IndexError):
+        return None, None
+
+    # "M  CHG"属性行覆盖原子块中的电荷
+    for line in lines[4 + n_atoms + n_bonds:]:
+        if line.startswith("M  CHG"):
+            fields = line.split()[3:]
+            for idx, charge in zip(fields[0::2], fields[1::2]):
+                if not idx.isdigit() or not 0 < int(idx) <= len(atoms):
+                    continue
+                element, _, x, y, z = atoms[int(idx) - 1]
+                atoms[int(idx) - 1] = (element, int(charge), x, y, z)
+        elif line.startswith("M  END"):
+            break
+    return atoms, bonds
@@ -4,6 +4,10 @@ import requests
 from typing import Dict, Any
 from mcp.server.fastmcp import FastMCP
 
+from artifact_store import save_response
+from eval_columns import append_evaluation_csv
+from server_cli import run_server
+
 import logging
 logging.basicConfig(level=logging.DEBUG)
 logging.debug("分子生成服务器启动中...")
@@ -179,9 +183,7 @@ def download_molecule(params: Dict[str, Any]) -> Dict:
         response = requests.get(download_url, stream=True, timeout=60)
         
         if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            save_response(response, output_path)
             
             return {
                 "status": "success",
@@ -377,9 +379,7 @@ def download_docking_result(params: Dict[str, Any]) -> Dict:
         response = requests.get(download_url, stream=True, timeout=60)
         
         if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            save_response(response, output_path)
             
             return {
                 "status": "success",
@@ -463,9 +463,7 @@ def batch_download_docking_results(params: Dict[str, Any]) -> Dict:
             response = requests.get(download_url, stream=True, timeout=60)
             
             if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                save_response(response, output_path)
                 downloaded_files.append(result_file)
             else:
                 failed_files.append({
@@ -632,7 +630,7 @@ def conformation_evaluation(params: Dict[str, Any]) -> Dict:
 
 @mcp.tool()
 def download_evaluation_result(params: Dict[str, Any]) -> Dict:
-    """下载构象评估结果文件
+    """下载构象评估结果文件，并追加到列式评估结果存储中
     
     Args:
         params: 包含以下字段的字典:
@@ -692,9 +690,9 @@ def download_evaluation_result(params: Dict[str, Any]) -> Dict:
         response = requests.get(download_url, stream=True, timeout=60)
         
         if response.status_code == 200:
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            save_response(response, output_path)
+            # 追加到列式存储，跨运行汇总评估结果
+            append_evaluation_csv(output_path)
             
             return {
                 "status": "success",
@@ -715,8 +713,7 @@ def download_evaluation_result(params: Dict[str, Any]) -> Dict:
 
 
 def main():
-    logging.info("分子生成服务器启动，使用stdio通信...")
-    mcp.run(transport="stdio")
+    run_server(mcp, "server.py", "分子生成服务器")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
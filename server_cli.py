@@ -0,0 +1,82 @@
+"""MCP服务器的命令行启动参数：默认使用stdio，也可以作为常驻进程通过SSE提供服务
+
+常驻进程保留连接池、缓存和已导入的模块，工作流入口（agent_workflow.py、client.py）启动时会先检查
+对应端口上是否已有常驻进程，有则直接连接，不再启动新的stdio子进程。
+
+用法: python mol_docking_server.py --transport sse [--host 127.0.0.1] [--port 8102]
+"""
+import argparse
+import logging
+import os
+import socket
+
+DAEMON_HOST = os.getenv("MOL_MCP_HOST", "127.0.0.1")
+# 各服务器脚本常驻运行时的默认端口；mol_all_server.py的第i个分片使用DAEMON_PORTS["mol_all_server.py"] + i
+DAEMON_PORTS = {
+    "mol_generation_server.py": 8101,
+    "mol_docking_server.py": 8102,
+    "mol_eval_server.py": 8103,
+    "mol_download_server.py": 8104,
+    "mol_reflection_server.py": 8105,
+    "server.py": 8106,
+    "mol_all_server.py": 8110,
+}
+
+# 各服务器脚本的FastMCP名称，连接常驻服务器后据此确认端口上是预期的服务器
+SERVER_NAMES = {
+    "mol_generation_server.py": "MoleculeGenerationServer",
+    "mol_docking_server.py": "MoleculeDockingServer",
+    "mol_eval_server.py": "MoleculeEvalServer",
+    "mol_download_server.py": "MoleculeDownloadingServer",
+    "mol_reflection_server.py": "MolReflectionServer",
+    "mol_all_server.py": "MoleculeAllServer",
+}
+
+def server_name(script: str, shard: int = 0, shards: int = 0) -> str:
+    """服务器脚本对应的FastMCP名称；mol_all_server.py分片运行时名称中带有分片序号和分片总数，如MoleculeAllServer-2of3"""
+    name = SERVER_NAMES[os.path.basename(script)]
+    if os.path.basename(script) == "mol_all_server.py" and shards > 1:
+        return f"{name}-{shard}of{shards}"
+    return name
+
+def daemon_port(script: str, shard: int = 0) -> int:
+    return DAEMON_PORTS[os.path.basename(script)] + shard
+
+def daemon_url(script: str, shard: int = 0, host: str = DAEMON_HOST) -> str:
+    """常驻服务器的SSE地址"""
+    return f"http://{host}:{daemon_port(script, shard)}/sse"
+
+def daemon_running(script: str, shard: int = 0, host: str = DAEMON_HOST, timeout: float = 0.2) -> bool:
+    """检查常驻服务器的端口是否在监听（不确认是哪个服务器，连接后按server_name核对）"""
+    try:
+        with socket.create_connection((host, daemon_port(script, shard)), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def server_arg_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--transport", choices=["stdio", "sse"], default="stdio", help="通信方式（默认stdio）")
+    parser.add_argument("--host", default=DAEMON_HOST, help="SSE模式监听的地址")
+    parser.add_argument("--port", type=int, default=None, help="SSE模式监听的端口（默认按服务器脚本分配）")
+    return parser
+
+def run_server(mcp, script: str, description: str, args=None, shard: int = 0):
+    """按命令行参数启动FastMCP服务器
+
+    Args:
+        mcp: FastMCP实例
+        script: 服务器脚本文件名，用于确定默认端口
+        description: 服务器说明，用于日志和帮助信息
+        args: 已解析的命令行参数（可选，默认解析sys.argv）
+        shard: 分片序号，SSE模式的默认端口按分片递增
+    """
+    if args is None:
+        args = server_arg_parser(description).parse_args()
+    if args.transport == "sse":
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port or daemon_port(script, shard)
+        logging.info(f"{description}启动，使用SSE通信: http://{mcp.settings.host}:{mcp.settings.port}{mcp.settings.sse_path}")
+    else:
+        logging.info(f"{description}启动，使用stdio通信...")
+    mcp.run(transport=args.transport)
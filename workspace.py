@@ -0,0 +1,88 @@
+"""按运行(run_id)隔离的工作目录
+
+不指定run_id时沿用共享目录/home/zhangfn/workflow/{downloads,uploads,ref}；
+指定run_id时使用/home/zhangfn/workflow/runs/<run_id>/{downloads,uploads,ref}，默认文件只在本运行的目录中查找。
+后端仍把结果写入共享的downloads目录，因此上传到后端的文件名会带上"__<run_id>"标记，
+取回结果后再去掉标记写入本运行的目录，避免并发运行的同名文件互相覆盖。
+"""
+import os
+import re
+from pathlib import Path
+
+WORKFLOW_ROOT = Path(os.getenv("MOL_WORKFLOW_ROOT", "/home/zhangfn/workflow"))
+RUNS_DIR = WORKFLOW_ROOT / "runs"
+# 后端写入结果文件的共享目录
+SHARED_DOWNLOADS = WORKFLOW_ROOT / "downloads"
+
+RUN_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+class Workspace:
+    """一次运行的工作目录"""
+
+    def __init__(self, run_id=None):
+        if run_id is not None and not RUN_ID_RE.match(str(run_id)):
+            raise ValueError(f"run_id只能包含字母、数字、下划线、点和连字符（最长64个字符）: {run_id}")
+        self.run_id = str(run_id) if run_id is not None else None
+        self.root = RUNS_DIR / self.run_id if self.run_id else WORKFLOW_ROOT
+        self.downloads = self.root / "downloads"
+        self.uploads = self.root / "uploads"
+        self.ref = self.root / "ref"
+
+    @property
+    def is_shared(self) -> bool:
+        return self.run_id is None
+
+    def ensure(self):
+        for directory in (self.downloads, self.uploads, self.ref):
+            directory.mkdir(parents=True, exist_ok=True)
+        return self
+
+    def tag(self, filename: str) -> str:
+        """给上传到后端的文件名加上运行标记: 3rfm.pdb -> 3rfm__<run_id>.pdb"""
+        if self.is_shared:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}__{self.run_id}{ext}"
+
+    def untag(self, filename: str) -> str:
+        """去掉后端结果文件名中的运行标记: 3rfm__<run_id>_ligand_0_1.pdbqt -> 3rfm_ligand_0_1.pdbqt"""
+        if self.is_shared:
+            return filename
+        return filename.replace(f"__{self.run_id}", "", 1)
+
+    def collect_output(self, backend_name: str, fetch=None):
+        """把后端写入共享目录的结果文件移入本运行的downloads目录并去掉运行标记
+
+        Args:
+            backend_name: 后端返回的结果文件名
+            fetch: 共享目录中没有该文件时调用，返回文件内容（str或bytes），返回None表示获取失败
+
+        Returns:
+            本地结果文件路径，获取失败时返回None；共享目录模式下直接返回共享目录中的路径
+        """
+        source = SHARED_DOWNLOADS / backend_name
+        if self.is_shared:
+            return source
+        target = self.downloads / self.untag(backend_name)
+        if source.exists():
+            os.replace(source, target)
+            return target
+        content = fetch() if fetch else None
+        if content is None:
+            return None
+        with open(target, "wb" if isinstance(content, bytes) else "w") as f:
+            f.write(content)
+        return target
+
+def get_workspace(run_id=None) -> Workspace:
+    """获取运行的工作目录并确保目录存在，run_id为空时返回共享目录
+
+    Raises:
+        ValueError: run_id不合法，或工作目录无法创建（权限不足、磁盘已满等）
+    """
+    workspace = Workspace(run_id or None)
+    try:
+        return workspace.ensure()
+    except OSError as e:
+        # 各工具只处理ValueError，目录创建失败也统一按参数错误返回
+        raise ValueError(f"无法创建运行工作目录 {workspace.root}: {str(e)}") from e